@@ -0,0 +1,244 @@
+"""benchmark cases, each is a function that sets up its inputs and returns the callable to time
+
+cases that create files get a temporary directory that is removed after the case was timed, cases that patch module
+globals yield the callable instead and the patches are restored after the case was timed, so they don't affect later cases
+"""
+import os
+import sys
+import asyncio
+import struct
+import inspect
+import itertools
+import importlib
+import contextlib
+from unittest import mock
+
+from cwm_cdn_api import api, dns_responder, zone_writer
+
+
+ROOT_DIR = os.path.join(os.path.dirname(__file__), "..")
+FAKE_PEM = "-----BEGIN CERTIFICATE-----\n" + "\n".join(["A" * 64] * 40) + "\n-----END CERTIFICATE-----\n"
+CASES = {}
+
+
+def case(name, rounds=None, threshold=None):
+    """registers a benchmark case
+
+    rounds limits the timing repeats of slow cases, threshold overrides the allowed slowdown of noisy (e.g. file i/o) cases
+    """
+    def decorator(func):
+        if inspect.isgeneratorfunction(func):
+            setup = contextlib.contextmanager(func)
+        else:
+            setup = lambda tmpdir: contextlib.nullcontext(func(tmpdir))
+        CASES[name] = (setup, rounds, threshold)
+        return func
+    return decorator
+
+
+def import_entrypoint(dirname, module_name):
+    sys.path.insert(0, os.path.join(ROOT_DIR, dirname))
+    try:
+        return importlib.import_module(module_name)
+    finally:
+        sys.path.pop(0)
+
+
+def tenant_spec(num_domains, num_origins=2):
+    return {
+        "domains": [
+            {
+                "name": f"domain{i}.example.com",
+                "tls": {"mode": "provided", "minVersion": "TLSv1.2", "maxVersion": "TLSv1.3", "redirectHttpToHttps": True},
+                "cert": FAKE_PEM,
+                "key": FAKE_PEM,
+            }
+            for i in range(num_domains)
+        ],
+        "origins": [{"url": f"http://origin{i}.example.com"} for i in range(num_origins)],
+    }
+
+
+def tenant_object(num_domains):
+    return {
+        "metadata": {"name": "tenant1", "resourceVersion": "1", "generation": 1},
+        "spec": tenant_spec(num_domains),
+        "status": {
+            "conditions": [
+                {"type": "Progressing", "status": "False"},
+                {"type": "Ready", "status": "True"},
+                {"type": "Degraded", "status": "False"},
+                {"type": "SecondariesSynced", "status": "True"},
+            ],
+            "domainTLS": [
+                {"name": f"domain{i}.example.com", "mode": "provided", "ready": True}
+                for i in range(num_domains)
+            ],
+        },
+    }
+
+
+for _num_domains in (1, 100, 5000):
+    @case(f"api.validate_spec[{_num_domains} domains]")
+    def _validate_spec(tmpdir, num_domains=_num_domains):
+        spec = tenant_spec(num_domains)
+        return lambda: api.validate_spec(spec)
+
+    @case(f"api.prepare_tenant[{_num_domains} domains]")
+    def _prepare_tenant(tmpdir, num_domains=_num_domains):
+        spec = {**tenant_spec(num_domains), "primaryKey": ""}
+        with mock.patch.object(api, "IS_PRIMARY", True):
+            yield lambda: api.prepare_tenant("tenant1", spec)
+
+
+for _num_domains in (1, 100, 5000):
+    @case(f"api.get shaping[{_num_domains} domains]")
+    def _tenant_view(tmpdir, num_domains=_num_domains):
+        o = tenant_object(num_domains)
+        return lambda: api.tenant_view(o)
+
+    @case(f"api.get shaping fields=ready,domains.name[{_num_domains} domains]")
+    def _tenant_view_fields(tmpdir, num_domains=_num_domains):
+        o = tenant_object(num_domains)
+        _, fields = api.parse_fields("ready,domains.name")
+        return lambda: api.tenant_view(o, fields)
+
+
+for _num_domains, _num_origins in ((1, 1), (100, 5), (1000, 10)):
+    @case(f"render_nginx_conf.get_default_conf[{_num_domains} domains, {_num_origins} origins]", threshold=0.5)
+    def _render_nginx_conf(tmpdir, num_domains=_num_domains, num_origins=_num_origins):
+        render_nginx_conf = import_entrypoint("tenant-nginx", "render_nginx_conf")
+        env = {"TENANT_NAME": "tenant1"}
+        for i in range(num_domains):
+            env.update({f"D{i}_NAME": f"domain{i}.example.com", f"D{i}_CERT": FAKE_PEM, f"D{i}_KEY": FAKE_PEM})
+        for i in range(num_origins):
+            env[f"O{i}_URL"] = f"http://origin{i}.example.com"
+        certs_path = os.path.join(tmpdir, "certs")
+        return lambda: render_nginx_conf.get_default_conf(certs_path, env)
+
+
+@case("cache-nginx get_default_conf[router, 100 cache servers]")
+def _cache_nginx_router(tmpdir):
+    entrypoint = import_entrypoint("cache-nginx", "entrypoint")
+    env = {"TYPE": "router", "NGINX_UPSTREAM_CACHE_SERVERS": "".join(f"server cache{i}:80;\n" for i in range(100))}
+    return lambda: entrypoint.get_default_conf(env)
+
+
+@case("cache-nginx get_default_conf[cache]")
+def _cache_nginx_cache(tmpdir):
+    entrypoint = import_entrypoint("cache-nginx", "entrypoint")
+    env = {"TYPE": "cache", "NGINX_LOCATION_CONFIGS": "add_header X-Test 1;"}
+    return lambda: entrypoint.get_default_conf(env)
+
+
+def tenant_domains(num_tenants):
+    """synthetic tenants with 1-3 domains each, spread over num_tenants / 10 apex domains"""
+    num_apex = max(1, num_tenants // 10)
+    return [
+        (f"tenant{i}", [f"{sub}.t{i}.apex{i % num_apex}.com" for sub in ("www", "api", "cdn")[:1 + i % 3]])
+        for i in range(num_tenants)
+    ]
+
+
+def zone_writer_main(tmpdir, num_tenants, changed):
+    tenants = tenant_domains(num_tenants)
+
+    async def iterate_tenant_domains():
+        for tenant_name, domains in tenants:
+            yield tenant_name, domains
+
+    def run():
+        if changed:
+            # one tenant moves between two domains, a single zone is rewritten
+            tenant_name, domains = tenants[0]
+            tenants[0] = (tenant_name, [f"moved.{domains[0]}"] if not domains[0].startswith("moved.") else [domains[0][len("moved."):]])
+        asyncio.run(zone_writer.main(zones_dir))
+
+    zones_dir = os.path.join(tmpdir, "zones")
+    os.makedirs(zones_dir)
+    with mock.patch.object(zone_writer, "iterate_tenant_domains", iterate_tenant_domains):
+        asyncio.run(zone_writer.main(zones_dir))
+        yield run
+
+
+for _num_tenants in (10000, 100000):
+    @case(f"zone_writer.main[{_num_tenants} tenants, changed]", rounds=5, threshold=0.5)
+    def _zone_writer_changed(tmpdir, num_tenants=_num_tenants):
+        yield from zone_writer_main(tmpdir, num_tenants, changed=True)
+
+    @case(f"zone_writer.main[{_num_tenants} tenants, unchanged]", rounds=5, threshold=0.5)
+    def _zone_writer_unchanged(tmpdir, num_tenants=_num_tenants):
+        yield from zone_writer_main(tmpdir, num_tenants, changed=False)
+
+
+@case("zone_writer.write_zones single domain change[50000 zones]", rounds=20, threshold=0.5)
+def _zone_writer_single_domain_change(tmpdir):
+    zones_dir = os.path.join(tmpdir, "zones")
+    os.makedirs(zones_dir)
+    records = zone_writer.ZoneRecords()
+    records.rebuild((f"tenant{i}", [f"www.apex{i}.com"]) for i in range(50000))
+    records.pop_changed_apexes()
+    zone_writer.write_zones(zones_dir, records.apex_records, digest=records.digest)
+    num_changes = 0
+
+    def run():
+        nonlocal num_changes
+        num_changes += 1
+        records.set_tenant("tenant0", ["cdn.apex0.com" if num_changes % 2 else "www.apex0.com"])
+        zone_writer.write_zones(zones_dir, records.apex_records, records.pop_changed_apexes(), digest=records.digest)
+
+    return run
+
+
+def dns_queries(num_zones, num_queries):
+    records = zone_writer.ZoneRecords()
+    records.rebuild((f"tenant{i}", [f"www.apex{i}.com"]) for i in range(num_zones))
+    queries = [
+        struct.pack("!HHHHHH", i, 0, 1, 0, 0, 0) + dns_responder.encode_name(f"www.apex{i * 7 % num_zones}.com")
+        + struct.pack("!HH", dns_responder.TYPE_A, dns_responder.CLASS_IN)
+        for i in range(num_queries)
+    ]
+    return dns_responder.DnsResponder(records, lambda apex: 1), queries
+
+
+@case("dns_responder.answer[50000 zones, 1000 queries]")
+def _dns_responder_answer(tmpdir):
+    responder, queries = dns_queries(50000, 1000)
+    return lambda: [responder.answer(query) for query in queries]
+
+
+@case("dns_responder udp[50000 zones, 1000 queries]", rounds=20, threshold=0.5)
+def _dns_responder_udp(tmpdir):
+    responder, queries = dns_queries(50000, 1000)
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        udp_transport, tcp_server = await dns_responder.serve(responder, "127.0.0.1", 0)
+        done = loop.create_future()
+        pending = iter(queries)
+        num_responses = 0
+
+        class Client(asyncio.DatagramProtocol):
+            # a window of queries in flight, so that loopback socket buffers don't drop any
+            def connection_made(self, transport):
+                self.transport = transport
+                for query in itertools.islice(pending, 50):
+                    transport.sendto(query)
+
+            def datagram_received(self, data, addr):
+                nonlocal num_responses
+                num_responses += 1
+                if num_responses == len(queries):
+                    done.set_result(None)
+                for query in itertools.islice(pending, 1):
+                    self.transport.sendto(query)
+
+        client, _ = await loop.create_datagram_endpoint(Client, remote_addr=udp_transport.get_extra_info("sockname"))
+        try:
+            await asyncio.wait_for(done, 10)
+        finally:
+            client.close()
+            udp_transport.close()
+            tcp_server.close()
+
+    return lambda: asyncio.run(run())
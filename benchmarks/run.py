@@ -0,0 +1,98 @@
+"""runs the benchmark cases offline and compares them with the stored baselines
+
+usage: uv run python benchmarks/run.py [--filter TEXT] [--update-baselines] [--threshold 0.25]
+
+exits with status 1 if a case is slower than its baseline by more than the threshold. Timings are normalized by a
+fixed calibration workload measured with the baselines, so that baselines recorded on another machine are usable,
+still, record them again (--update-baselines) on the machine that runs the comparison for meaningful thresholds.
+"""
+import os
+import sys
+import shutil
+import timeit
+import tempfile
+import argparse
+
+import orjson
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+sys.stdout.reconfigure(line_buffering=True)
+
+from cases import CASES  # noqa: E402
+
+
+BASELINES_PATH = os.path.join(os.path.dirname(__file__), "baselines.json")
+DEFAULT_THRESHOLD = 0.25
+CALIBRATION = "calibration"
+
+
+def calibration():
+    data = [{"name": f"item{i}", "values": list(range(20))} for i in range(2000)]
+    return sorted((orjson.dumps(d) for d in data), reverse=True)
+
+
+def measure(func, rounds=None, repeat=5):
+    """returns the best time in seconds of a single call"""
+    timer = timeit.Timer(func)
+    if rounds:
+        return min(timer.repeat(repeat=rounds, number=1))
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def load_baselines():
+    if not os.path.exists(BASELINES_PATH):
+        return {}
+    with open(BASELINES_PATH, "rb") as f:
+        return orjson.loads(f.read())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--filter", help="only run cases which contain this text")
+    parser.add_argument("--update-baselines", action="store_true", help="store the results as the new baselines")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="allowed slowdown, 0.25 = 25%%")
+    args = parser.parse_args()
+    baselines = load_baselines()
+    calibration_seconds = measure(calibration, repeat=20)
+    baseline_calibration_seconds = baselines.get(CALIBRATION, {}).get("seconds")
+    scale = calibration_seconds / baseline_calibration_seconds if baseline_calibration_seconds else 1
+    print(f"machine speed factor vs baselines: {scale:.2f} (higher is slower)")
+    results = {CALIBRATION: calibration_seconds}
+    regressions = []
+    for name, (setup, rounds, case_threshold) in CASES.items():
+        if args.filter and args.filter not in name:
+            continue
+        tmpdir = tempfile.mkdtemp()
+        try:
+            with setup(tmpdir) as func:
+                seconds = measure(func, rounds)
+        finally:
+            shutil.rmtree(tmpdir)
+        results[name] = seconds
+        baseline = baselines.get(name)
+        if baseline:
+            expected = baseline["seconds"] * scale
+            change = seconds / expected - 1
+            threshold = max(args.threshold, case_threshold or 0)
+            status = "REGRESSION" if change > threshold else "ok"
+            if change > threshold:
+                regressions.append(name)
+            print(f"{name:<70} {seconds * 1000:>10.3f}ms {change:>+8.1%} {status}")
+        else:
+            print(f"{name:<70} {seconds * 1000:>10.3f}ms  (no baseline)")
+    if args.update_baselines:
+        for name, seconds in results.items():
+            baselines[name] = {"seconds": seconds}
+        with open(BASELINES_PATH, "wb") as f:
+            f.write(orjson.dumps(baselines, option=orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS | orjson.OPT_APPEND_NEWLINE))
+        print(f"updated {BASELINES_PATH}")
+        return 0
+    if regressions:
+        print(f"{len(regressions)} regressions: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,17 +1,15 @@
-import os
 import re
-import subprocess
-import tempfile
-from copy import deepcopy
 import time
+import hashlib
 import asyncio
+import contextlib
 from datetime import datetime, timezone
 from urllib.parse import urlsplit, urlunsplit
 
-import orjson
-import requests
+import httpx
 
-from .common import async_subprocess_check_output, async_subprocess_status_output
+from . import kube, informer, config, metrics
+from .common import TTLCache
 from .config import NAMESPACE, ALLOWED_PRIMARY_KEY, IS_PRIMARY
 
 
@@ -61,16 +59,33 @@ def parse_origin_url(origin_url):
     return parsed
 
 
-def validate_origins(origins):
-    if not origins:
-        raise ValueError("At least one origin is required")
-    for origin in origins:
-        parse_origin_url(origin.get("url", ""))
-    if len(origins) > 1:
-        for origin in origins:
+def _origin_errors(origins, forbidden=None):
+    """returns list of origin errors, parsing each url once, and collects internal certificate fields into forbidden"""
+    if not isinstance(origins, list) or not origins:
+        return ["At least one origin is required"]
+    errors = []
+    path_prefixed = False
+    for i, origin in enumerate(origins):
+        if not isinstance(origin, dict):
+            errors.append(f"origins[{i}] must be an object")
+            continue
+        if forbidden is not None:
+            _collect_forbidden_fields(origin, ['origins', i], forbidden)
+        try:
             parsed = parse_origin_url(origin.get("url", ""))
-            if parsed.path not in ("", "/"):
-                raise ValueError("Path-prefixed origin URLs are not supported with multiple origins")
+        except ValueError as e:
+            errors.append(str(e))
+            continue
+        path_prefixed = path_prefixed or parsed.path not in ("", "/")
+    if path_prefixed and len(origins) > 1:
+        errors.append("Path-prefixed origin URLs are not supported with multiple origins")
+    return errors
+
+
+def validate_origins(origins):
+    errors = _origin_errors(origins)
+    if errors:
+        raise ValueError('; '.join(errors))
 
 
 def origin_name(origin, index):
@@ -94,7 +109,44 @@ def build_origin_health_url(origin_url, health_path):
     return urlunsplit((parsed.scheme, parsed.netloc, health_path, "", ""))
 
 
-def check_origin_health(origin, index):
+_origin_health_client = None  # (event loop, client, concurrency semaphore)
+
+
+def origin_health_client():
+    """returns the shared origin health probes http client, which keeps per-host keep-alive connection pools"""
+    global _origin_health_client
+    loop = asyncio.get_running_loop()
+    if _origin_health_client is None or _origin_health_client[0] is not loop:
+        _origin_health_client = (
+            loop,
+            httpx.AsyncClient(
+                follow_redirects=False,
+                limits=httpx.Limits(
+                    max_connections=config.ORIGIN_HEALTH_MAX_CONNECTIONS,
+                    max_keepalive_connections=config.ORIGIN_HEALTH_MAX_CONNECTIONS,
+                ),
+            ),
+            asyncio.Semaphore(config.ORIGIN_HEALTH_MAX_CONCURRENCY),
+        )
+    return _origin_health_client[1]
+
+
+def _origin_health_semaphore():
+    origin_health_client()
+    return _origin_health_client[2]
+
+
+async def _probe_status_code(health_url, timeout_seconds):
+    async with _origin_health_semaphore():
+        async with origin_health_client().stream('GET', health_url, timeout=timeout_seconds) as response:
+            content_length = response.headers.get('content-length')
+            if content_length and content_length.isdigit() and int(content_length) <= config.ORIGIN_HEALTH_MAX_DRAIN_BYTES:
+                # small bodies are drained so the connection goes back to the keep-alive pool, otherwise it's closed
+                await response.aread()
+            return response.status_code
+
+
+async def check_origin_health(origin, index):
     name = origin_name(origin, index)
     origin_url = origin.get("url", "")
     checked_at = datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
@@ -112,19 +164,19 @@ def check_origin_health(origin, index):
     health_url = build_origin_health_url(origin_url, health_check["path"])
     start = time.monotonic()
     try:
-        response = requests.get(health_url, timeout=health_check["timeoutSeconds"], allow_redirects=False)
+        status_code = await _probe_status_code(health_url, health_check["timeoutSeconds"])
         latency_ms = int((time.monotonic() - start) * 1000)
-        healthy = response.status_code == health_check["expectedStatus"]
+        healthy = status_code == health_check["expectedStatus"]
         return {
             "name": name,
             "url": origin_url,
             "healthy": healthy,
-            "statusCode": response.status_code,
+            "statusCode": status_code,
             "latencyMs": latency_ms,
             "checkedAt": checked_at,
-            "message": "" if healthy else f"unexpected status {response.status_code}",
+            "message": "" if healthy else f"unexpected status {status_code}",
         }
-    except requests.RequestException as e:
+    except (httpx.HTTPError, httpx.InvalidURL) as e:
         latency_ms = int((time.monotonic() - start) * 1000)
         return {
             "name": name,
@@ -133,35 +185,67 @@ def check_origin_health(origin, index):
             "statusCode": None,
             "latencyMs": latency_ms,
             "checkedAt": checked_at,
-            "message": str(e),
+            "message": str(e) or e.__class__.__name__,
         }
 
 
+_reserved_names_cache = TTLCache(config.RESERVED_NAMES_TTL_SECONDS)
+
+
+async def _load_name_sets():
+    tenants = set([n async for n in list_iterator(consistent=True)])
+    return tenants, set(await kube.get_backend().list_namespace_names())
+
+
+async def name_sets(max_age_seconds=None):
+    """returns tuple of (tenant names, namespace names) containers, from the informers or a periodically refreshed snapshot"""
+    tenants, namespaces = informer.get_tenants(), informer.get_namespaces()
+    if tenants is not None and namespaces is not None:
+        return tenants.items, namespaces.items
+    return await _reserved_names_cache.get(None, _load_name_sets, max_age_seconds)
+
+
+def is_reserved_name(name, tenants, namespaces):
+    return name in namespaces and name not in tenants
+
+
 async def reserved_names_iterator():
-    tenants = set([n async for n in list_iterator()])
-    for n in (await async_subprocess_check_output('kubectl', 'get', 'ns', '-oname')).splitlines():
-        if n.startswith('namespace/'):
-            n = n.split('/', 1)[1]
-            if n not in tenants:
-                yield n
+    tenants, namespaces = await name_sets()
+    for n in sorted(namespaces):
+        if n not in tenants:
+            yield n
 
 
 async def validate_name(name):
-    async for reserved_name in reserved_names_iterator():
-        if name == reserved_name:
-            raise ValueError(f'Tenant name "{name}" is not allowed')
+    with metrics.VALIDATION_DURATION.labels('name').time():
+        reserved = is_reserved_name(name, *await name_sets())
+        if reserved:
+            # snapshot may be stale, e.g. tenant was created after it was taken, confirm with fresh data before rejecting
+            reserved = is_reserved_name(name, *await name_sets(max_age_seconds=0))
+    if reserved:
+        raise ValueError(f'Tenant name "{name}" is not allowed')
 
 
-def _find_forbidden_fields(value, path='spec'):
+def _format_path(path, key):
+    return 'spec' + ''.join(f'[{p}]' if isinstance(p, int) else f'.{p}' for p in path) + f'.{key}'
+
+
+def _collect_forbidden_fields(value, path, found):
+    """appends the paths of internal certificate fields nested in value, path strings are only built for matches"""
     if isinstance(value, dict):
         for key, child in value.items():
-            child_path = f'{path}.{key}'
             if key in FORBIDDEN_TENANT_FIELDS:
-                yield child_path
-            yield from _find_forbidden_fields(child, child_path)
+                found.append(_format_path(path, key))
+            if isinstance(child, (dict, list)):
+                path.append(key)
+                _collect_forbidden_fields(child, path, found)
+                path.pop()
     elif isinstance(value, list):
         for i, child in enumerate(value):
-            yield from _find_forbidden_fields(child, f'{path}[{i}]')
+            if isinstance(child, (dict, list)):
+                path.append(i)
+                _collect_forbidden_fields(child, path, found)
+                path.pop()
 
 
 def _domain_tls(domain):
@@ -184,47 +268,74 @@ def _is_valid_domain_name(name):
     return all(DNS_LABEL_RE.match(label) for label in labels)
 
 
-def validate_spec(spec):
+def _domain_errors(i, domain, forbidden):
+    if not isinstance(domain, dict):
+        return [f'domains[{i}] must be an object']
+    _collect_forbidden_fields(domain, ['domains', i], forbidden)
+    errors = []
+    if not domain.get('name'):
+        errors.append(f'domains[{i}].name is required')
+    if 'tls' in domain and domain['tls'] is not None and not isinstance(domain['tls'], dict):
+        return errors + [f'domains[{i}].tls must be an object']
+    tls, mode, min_version, max_version = _domain_tls(domain)
+    if mode not in SUPPORTED_TLS_MODES:
+        errors.append(f'domains[{i}].tls.mode must be one of: letsencrypt, provided')
+    if min_version not in SUPPORTED_TLS_VERSIONS:
+        errors.append(f'domains[{i}].tls.minVersion must be TLSv1.2 or TLSv1.3')
+    if max_version not in SUPPORTED_TLS_VERSIONS:
+        errors.append(f'domains[{i}].tls.maxVersion must be TLSv1.2 or TLSv1.3')
+    if min_version == 'TLSv1.3' and max_version == 'TLSv1.2':
+        errors.append(f'domains[{i}].tls.minVersion cannot be greater than maxVersion')
+    if mode == 'provided' and (not domain.get('cert') or not domain.get('key')):
+        errors.append(f'domains[{i}] with tls.mode=provided requires cert and key')
+    if mode == 'letsencrypt':
+        if not IS_PRIMARY:
+            errors.append(f'domains[{i}] with tls.mode=letsencrypt is only supported on the primary cluster')
+        if domain.get('cert') or domain.get('key'):
+            errors.append(f'domains[{i}] with tls.mode=letsencrypt must not include cert or key')
+        if not _is_valid_domain_name(domain.get('name')):
+            errors.append(f'domains[{i}].name must be a valid customer-owned domain for tls.mode=letsencrypt')
+    return errors
+
+
+def spec_errors(spec):
+    """validates the spec in a single pass without modifying it
+
+    returns tuple of (origin errors, other spec errors), all errors are collected instead of stopping at the first one
+    """
     if not isinstance(spec, dict):
-        raise ValueError('Tenant spec must be an object')
-
-    forbidden = sorted(_find_forbidden_fields(spec))
-    if forbidden:
-        raise ValueError(f'Tenant spec contains internal certificate fields: {", ".join(forbidden)}')
-
+        return [], ['Tenant spec must be an object']
+    forbidden = []
+    errors = []
+    origin_errors = None
+    for key, value in spec.items():
+        if key in FORBIDDEN_TENANT_FIELDS:
+            forbidden.append(_format_path([], key))
+        if key == 'domains':
+            if isinstance(value, list):
+                for i, domain in enumerate(value):
+                    errors.extend(_domain_errors(i, domain, forbidden))
+        elif key == 'origins':
+            origin_errors = _origin_errors(value, forbidden)
+        elif isinstance(value, (dict, list)):
+            _collect_forbidden_fields(value, [key], forbidden)
     domains = spec.get('domains')
     if not isinstance(domains, list) or not domains:
-        raise ValueError('Tenant spec must include at least one domain')
-
-    for i, domain in enumerate(domains):
-        if not isinstance(domain, dict):
-            raise ValueError(f'domains[{i}] must be an object')
-        if not domain.get('name'):
-            raise ValueError(f'domains[{i}].name is required')
-        if 'tls' in domain and domain['tls'] is not None and not isinstance(domain['tls'], dict):
-            raise ValueError(f'domains[{i}].tls must be an object')
-        tls, mode, min_version, max_version = _domain_tls(domain)
-        if mode not in SUPPORTED_TLS_MODES:
-            raise ValueError(f'domains[{i}].tls.mode must be one of: letsencrypt, provided')
-        if min_version not in SUPPORTED_TLS_VERSIONS:
-            raise ValueError(f'domains[{i}].tls.minVersion must be TLSv1.2 or TLSv1.3')
-        if max_version not in SUPPORTED_TLS_VERSIONS:
-            raise ValueError(f'domains[{i}].tls.maxVersion must be TLSv1.2 or TLSv1.3')
-        if min_version == 'TLSv1.3' and max_version == 'TLSv1.2':
-            raise ValueError(f'domains[{i}].tls.minVersion cannot be greater than maxVersion')
-        if mode == 'provided' and (not domain.get('cert') or not domain.get('key')):
-            raise ValueError(f'domains[{i}] with tls.mode=provided requires cert and key')
-        if mode == 'letsencrypt':
-            if not IS_PRIMARY:
-                raise ValueError(f'domains[{i}] with tls.mode=letsencrypt is only supported on the primary cluster')
-            if domain.get('cert') or domain.get('key'):
-                raise ValueError(f'domains[{i}] with tls.mode=letsencrypt must not include cert or key')
-            if not _is_valid_domain_name(domain.get('name')):
-                raise ValueError(f'domains[{i}].name must be a valid customer-owned domain for tls.mode=letsencrypt')
-
+        errors.insert(0, 'Tenant spec must include at least one domain')
+    if forbidden:
+        errors.insert(0, f'Tenant spec contains internal certificate fields: {", ".join(sorted(forbidden))}')
     origins = spec.get('origins')
     if not isinstance(origins, list) or not origins:
-        raise ValueError('Tenant spec must include at least one origin')
+        errors.append('Tenant spec must include at least one origin')
+    if origin_errors is None:
+        origin_errors = _origin_errors(origins)
+    return origin_errors, errors
+
+
+def validate_spec(spec):
+    errors = spec_errors(spec)[1]
+    if errors:
+        raise ValueError('; '.join(errors))
 
 
 def _redacted_domain(domain, tls_status_by_name):
@@ -261,129 +372,497 @@ def validate_admin_primary_key(primary_key):
         raise ValueError('Valid primary_key is required for platform-admin debug output')
 
 
-async def apply(name, spec):
-    await validate_name(name)
-    spec = deepcopy(spec)
-    primary_key = spec.pop("primaryKey", "")
-    try:
-        validate_origins(spec.get("origins", []))
-    except ValueError as e:
-        return False, str(e)
+def prepare_tenant(name, spec):
+    """validates the spec, returns tuple of (success, tenant object or error message)"""
+    if isinstance(spec, dict) and 'primaryKey' in spec:
+        # shallow copy is enough, nested values are not modified
+        spec = dict(spec)
+        primary_key = spec.pop('primaryKey')
+    else:
+        primary_key = ''
+    with metrics.VALIDATION_DURATION.labels('spec').time():
+        origin_errors, errors = spec_errors(spec)
+    if origin_errors:
+        return False, '; '.join(origin_errors)
     if not IS_PRIMARY and primary_key != ALLOWED_PRIMARY_KEY:
         return False, 'Updates are not allowed on this instance'
-    try:
-        validate_spec(spec)
-    except ValueError as e:
-        return False, str(e)
-    o = {
+    if errors:
+        return False, '; '.join(errors)
+    return True, {
         'apiVersion': 'cdn.cloudwm-cdn.com/v1',
         'kind': 'CdnTenant',
         'metadata': {
             'name': name,
             'namespace': NAMESPACE,
+            'annotations': {
+                kube.SPEC_HASH_ANNOTATION: kube.spec_hash(spec),
+            },
         },
         'spec': spec,
     }
-    with tempfile.TemporaryDirectory() as tmpdir:
-        with open(os.path.join(tmpdir, f'{name}.json'), 'wb') as f:
-            f.write(orjson.dumps(o))
-        status, output = await async_subprocess_status_output(
-            'kubectl', 'apply', '-f', f'{name}.json',
-            stderr=subprocess.STDOUT, cwd=tmpdir
-        )
-    return (status == 0), output
+
+
+def _cached_spec_hash(tenants, name):
+    """spec hash of the cached tenant, or None if the cache has not seen the last write of this process yet"""
+    current = tenants.get(name)
+    if current is None:
+        return None
+    cached_hash = ((current.get('metadata') or {}).get('annotations') or {}).get(kube.SPEC_HASH_ANNOTATION)
+    written_hash = tenants.written.get(name)
+    if written_hash is not None:
+        if cached_hash != written_hash:
+            return None
+        del tenants.written[name]
+    return cached_hash
+
+
+async def apply_tenant(o, consistent=False):
+    """applies a prepared tenant object, unless the informer cache shows it is already applied with the same spec
+
+    the cache may lag behind writes, after a write it is only trusted once it has the written spec, until then the
+    backend compares with the current object from the api server
+    """
+    name = o['metadata']['name']
+    new_hash = o['metadata']['annotations'][kube.SPEC_HASH_ANNOTATION]
+    tenants = None if consistent else informer.get_tenants()
+    if tenants is not None and _cached_spec_hash(tenants, name) == new_hash:
+        return True, kube.unchanged_message(name)
+    success, msg = await kube.get_backend().apply_tenant(o)
+    if success and tenants is not None:
+        tenants.written[name] = new_hash
+    return success, msg
+
+
+async def apply(name, spec, consistent=False):
+    await validate_name(name)
+    success, o = prepare_tenant(name, spec)
+    if not success:
+        return False, o
+    return await apply_tenant(o, consistent)
+
+
+async def apply_bulk(items):
+    """validates all items against a single reserved names snapshot and applies the valid ones concurrently
+
+    returns a list of {name, success, msg} results in the same order as items
+    """
+    results = [None] * len(items)
+    names = [item.get('name') if isinstance(item, dict) else None for item in items]
+    name_counts = {}
+    # names of other types are only reported as invalid, they may not be hashable
+    for name in names:
+        if isinstance(name, str):
+            name_counts[name] = name_counts.get(name, 0) + 1
+    with metrics.VALIDATION_DURATION.labels('name').time():
+        tenants, namespaces = await name_sets()
+        if any(is_reserved_name(name, tenants, namespaces) for name in name_counts if name):
+            # snapshot may be stale, confirm with fresh data before rejecting
+            tenants, namespaces = await name_sets(max_age_seconds=0)
+    objects = {}
+    for i, (item, name) in enumerate(zip(items, names)):
+        if not name or not isinstance(name, str) or not isinstance(item.get('spec'), dict):
+            results[i] = (False, 'Each item must include a name and a spec object')
+        elif name_counts[name] > 1:
+            results[i] = (False, f'Tenant name "{name}" appears more than once in the request')
+        elif is_reserved_name(name, tenants, namespaces):
+            results[i] = (False, f'Tenant name "{name}" is not allowed')
+        else:
+            success, o = prepare_tenant(name, item['spec'])
+            if success:
+                objects[i] = o
+            else:
+                results[i] = (False, o)
+    semaphore = asyncio.Semaphore(config.APPLY_BULK_CONCURRENCY)
+
+    async def _apply(i, o):
+        async with semaphore:
+            try:
+                results[i] = await apply_tenant(o)
+            except Exception as e:
+                results[i] = (False, str(e))
+
+    await asyncio.gather(*[_apply(i, o) for i, o in objects.items()])
+    return [
+        {'name': name, 'success': success, 'msg': msg}
+        for name, (success, msg) in zip(names, results)
+    ]
 
 
 async def delete(name, primary_key=""):
     if not IS_PRIMARY and primary_key != ALLOWED_PRIMARY_KEY:
         return False, 'Deletes are not allowed on this instance'
-    status, output = await async_subprocess_status_output(
-        'kubectl', 'delete', 'cdntenant.cdn.cloudwm-cdn.com', name, '-n', NAMESPACE, '--wait=false',
-        stderr=subprocess.STDOUT
-    )
-    return (status == 0), output
+    return await kube.get_backend().delete_tenant(name)
+
+
+async def get_tenant(name, consistent=False):
+    """returns the tenant object from the informer cache, or from the api server if consistent or cache is not synced"""
+    tenants = None if consistent else informer.get_tenants()
+    if tenants is None:
+        return await kube.get_backend().get_tenant(name)
+    o = tenants.get(name)
+    if o is None:
+        return False, f'Error from server (NotFound): {kube.TENANT_PLURAL}.{kube.TENANT_GROUP} "{name}" not found'
+    return True, o
 
 
-async def get(name):
-    status, output = await async_subprocess_status_output(
-        'kubectl', 'get', 'cdntenant.cdn.cloudwm-cdn.com', name, '-n', NAMESPACE, '-o', 'json',
-        stderr=subprocess.STDOUT
+TENANT_VIEW_FIELDS = ('domains', 'origins', 'domainTLS', 'ready', 'conditions')
+FIELD_NAME_RE = re.compile(r'^[A-Za-z][A-Za-z0-9_]*$')
+
+
+def parse_fields(fields):
+    """parses comma separated dotted field paths of the tenant view (e.g. "ready,domains.name") to a field tree,
+    which maps a field name to True for the whole value or to a field tree of its sub-fields,
+    returns tuple of (success, field tree or error message)"""
+    tree = {}
+    for path in fields.split(','):
+        path = path.strip()
+        if not path:
+            continue
+        parts = path.split('.')
+        if not all(FIELD_NAME_RE.match(part) for part in parts):
+            return False, f'invalid field: {path}'
+        if parts[0] not in TENANT_VIEW_FIELDS:
+            return False, f'unknown field: {parts[0]}, must be one of: {", ".join(TENANT_VIEW_FIELDS)}'
+        node = tree
+        for part in parts[:-1]:
+            if node.get(part) is True:
+                break
+            node = node.setdefault(part, {})
+        else:
+            node[parts[-1]] = True
+    if not tree:
+        return False, 'no fields'
+    return True, tree
+
+
+def format_fields(tree, prefix=''):
+    """returns the field paths of a field tree, sorted, the inverse of parse_fields"""
+    paths = []
+    for name, sub in sorted(tree.items()):
+        if sub is True:
+            paths.append(f'{prefix}{name}')
+        else:
+            paths.append(format_fields(sub, f'{prefix}{name}.'))
+    return ','.join(paths)
+
+
+def project(value, tree):
+    """returns the parts of value selected by the field tree, list items are projected each"""
+    if isinstance(value, list):
+        return [project(item, tree) for item in value]
+    if not isinstance(value, dict):
+        return value
+    return {
+        name: value[name] if sub is True else project(value[name], sub)
+        for name, sub in tree.items() if name in value
+    }
+
+
+def tenant_etag(o, fields=None):
+    if fields is None:
+        return f'"{o["metadata"]["resourceVersion"]}"'
+    # a digest because the field paths contain commas, which separate the etags of If-None-Match
+    return f'"{o["metadata"]["resourceVersion"]}-{hashlib.sha256(format_fields(fields).encode()).hexdigest()[:12]}"'
+
+
+def tenant_conditions(o):
+    return {
+        condition['type']: condition
+        for condition in o.get('status', {}).get('conditions', [])
+        if condition['type'] != 'SecondariesSynced' or IS_PRIMARY
+    }
+
+
+def is_ready(conditions):
+    return (
+        conditions.get("Progressing", {}).get("status") == "False"
+        and conditions.get("Ready", {}).get("status") == "True"
+        and conditions.get("Degraded", {}).get("status") == "False"
     )
-    if status == 0:
-        o = orjson.loads(output)
-        conditions = {
-            condition['type']: condition
-            for condition in o.get('status', {}).get('conditions', [])
-            if condition['type'] != 'SecondariesSynced' or IS_PRIMARY
-        }
-        ready = (
-            conditions.get("Progressing", {}).get("status") == "False"
-            and conditions.get("Ready", {}).get("status") == "True"
-            and conditions.get("Degraded", {}).get("status") == "False"
-        )
-        tls_status_by_name = {
-            status['name']: status for status in o.get('status', {}).get('domainTLS', [])
-        }
-        return True, {
-            'domains': [_redacted_domain(domain, tls_status_by_name) for domain in o['spec'].get('domains', [])],
-            'origins': [
+
+
+def is_settled(o):
+    """true if the operator finished reconciling the current generation of the tenant, whether it is ready or not"""
+    conditions = tenant_conditions(o)
+    generation = o['metadata'].get('generation')
+    if generation is not None and any(
+        condition.get('observedGeneration', generation) < generation for condition in conditions.values()
+    ):
+        return False
+    return conditions.get("Progressing", {}).get("status") == "False"
+
+
+def tenant_status(o):
+    conditions = tenant_conditions(o)
+    return {
+        'conditions': conditions,
+        'domainTLS': o.get('status', {}).get('domainTLS', []),
+        'ready': is_ready(conditions),
+    }
+
+
+def tenant_view(o, fields=None):
+    """returns the tenant as shown to api users, without secrets, optionally only the fields of a parse_fields tree"""
+    if fields is None:
+        fields = dict.fromkeys(TENANT_VIEW_FIELDS, True)
+    domains_fields = fields.get('domains')
+    if isinstance(domains_fields, dict):
+        domains_fields = {name: sub for name, sub in domains_fields.items() if name not in ('cert', 'key')}
+    with_tls_status = domains_fields is True or (domains_fields is not None and 'tlsStatus' in domains_fields)
+    # the status is only evaluated if a field derived from it was requested
+    status = None
+    if with_tls_status or not fields.keys().isdisjoint(('domainTLS', 'ready', 'conditions')):
+        status = tenant_status(o)
+    view = {}
+    for name in TENANT_VIEW_FIELDS:
+        sub = domains_fields if name == 'domains' else fields.get(name)
+        if sub is None:
+            continue
+        if name == 'domains':
+            if with_tls_status:
+                tls_status_by_name = {
+                    domain_tls['name']: domain_tls for domain_tls in status['domainTLS']
+                }
+                value = [_redacted_domain(domain, tls_status_by_name) for domain in o['spec'].get('domains', [])]
+            else:
+                # the projection copies only the requested fields, cert and key were removed from them
+                value = o['spec'].get('domains', [])
+        elif name == 'origins':
+            value = [
                 origin for origin in o['spec'].get('origins', [])
-            ],
-            'domainTLS': o.get('status', {}).get('domainTLS', []),
-            'ready': ready,
-            'conditions': conditions,
-        }
+            ]
+        else:
+            value = status[name]
+        view[name] = value if sub is True else project(value, sub)
+    return view
+
+
+async def get(name, consistent=False, fields=None):
+    success, o = await get_tenant(name, consistent)
+    return (True, tenant_view(o, fields)) if success else (False, o)
+
+
+async def _tenant_updates(name):
+    """yields tuple of (success, tenant object or error message) initially and whenever the tenant may have changed"""
+    tenants = informer.get_tenants()
+    if tenants is not None:
+        changed = asyncio.Event()
+
+        def listener(event_type, obj):
+            if obj['metadata']['name'] == name:
+                changed.set()
+
+        tenants.add_listener(listener)
+        try:
+            # the cache may not have seen a write made just before, so it starts from the api server and then skips
+            # cached objects of an older generation
+            success, o = await kube.get_backend().get_tenant(name)
+            min_generation = o['metadata'].get('generation') if success else None
+            yield success, o
+            while True:
+                await changed.wait()
+                changed.clear()
+                success, o = await get_tenant(name)
+                generation = o['metadata'].get('generation') if success else None
+                if generation is not None and min_generation is not None and generation < min_generation:
+                    continue
+                yield success, o
+        finally:
+            tenants.remove_listener(listener)
+    backend = kube.get_backend()
+    if backend.name == 'http':
+        yield await backend.get_tenant(name)
+        while True:
+            # a watch without resourceVersion starts with the current object, so nothing is missed between watches
+            async for event in backend.watch(
+                kube.tenants_path(), timeout_seconds=config.INFORMER_WATCH_TIMEOUT_SECONDS,
+                params={'fieldSelector': f'metadata.name={name}'},
+            ):
+                if event['type'] in ('ADDED', 'MODIFIED'):
+                    yield True, event['object']
+                elif event['type'] == 'DELETED':
+                    yield await backend.get_tenant(name)
     else:
-        return False, output
+        while True:
+            yield await backend.get_tenant(name)
+            await asyncio.sleep(config.WAIT_READY_POLL_SECONDS)
 
 
-async def debug_certificates(name, primary_key):
+async def wait_settled(name, timeout_seconds):
+    """waits until the tenant conditions settle (see is_settled) or timeout_seconds passed
+
+    returns tuple of (success, tenant object or error message, settled)
+    """
+    success, output, settled = False, f'Timed out waiting for tenant "{name}"', False
+    try:
+        async with asyncio.timeout(timeout_seconds):
+            async with contextlib.aclosing(_tenant_updates(name)) as updates:
+                async for success, output in updates:
+                    if success and is_settled(output):
+                        settled = True
+                        break
+    except TimeoutError:
+        pass
+    return success, output, settled
+
+
+def tenant_events_supported():
+    return informer.get_tenants() is not None or kube.get_backend().name == 'http'
+
+
+async def _tenant_watch(names=None):
+    """yields ('snapshot', {name: tenant object}) initially and after missed events, and (event type, tenant object)"""
+    tenants = informer.get_tenants()
+    if tenants is not None:
+        queue = asyncio.Queue(config.EVENTS_MAX_QUEUE)
+        overflow = False
+
+        def listener(event_type, obj):
+            nonlocal overflow
+            if names is None or obj['metadata']['name'] in names:
+                if queue.full():
+                    overflow = True
+                else:
+                    queue.put_nowait((event_type, obj))
+
+        def snapshot():
+            if names is None:
+                return dict(tenants.items)
+            return {name: tenants.items[name] for name in names if name in tenants.items}
+
+        tenants.add_listener(listener)
+        try:
+            yield 'snapshot', snapshot()
+            while True:
+                event = await queue.get()
+                if overflow:
+                    while not queue.empty():
+                        queue.get_nowait()
+                    overflow = False
+                    yield 'snapshot', snapshot()
+                else:
+                    yield event
+        finally:
+            tenants.remove_listener(listener)
+    backend = kube.get_backend()
+    params = {}
+    if names is not None and len(names) == 1:
+        params['fieldSelector'] = f'metadata.name={next(iter(names))}'
+    while True:
+        data = await backend.request_check('GET', kube.tenants_path(), params=params)
+        yield 'snapshot', {
+            item['metadata']['name']: item for item in data.get('items', [])
+            if names is None or item['metadata']['name'] in names
+        }
+        resource_version = data['metadata']['resourceVersion']
+        try:
+            while True:
+                async for event in backend.watch(
+                    kube.tenants_path(), resource_version=resource_version,
+                    timeout_seconds=config.INFORMER_WATCH_TIMEOUT_SECONDS, params=params,
+                ):
+                    obj = event['object']
+                    resource_version = obj['metadata']['resourceVersion']
+                    if event['type'] in ('ADDED', 'MODIFIED', 'DELETED') and (names is None or obj['metadata']['name'] in names):
+                        yield event['type'], obj
+        except kube.ResourceVersionExpired:
+            pass
+
+
+async def tenant_status_events(names=None):
+    """yields tuple of (tenant name, tenant_status or None if deleted), for all tenants initially and then on changes
+
+    names optionally limits the tenants, only changes of the conditions, domainTLS or ready are yielded
+    """
+    names = set(names) if names else None
+    last_statuses = {}
+    async with contextlib.aclosing(_tenant_watch(names)) as events:
+        async for event_type, data in events:
+            if event_type == 'snapshot':
+                for name in last_statuses.keys() - data.keys():
+                    del last_statuses[name]
+                    yield name, None
+                updates = data.items()
+            elif event_type == 'DELETED':
+                name = data['metadata']['name']
+                if last_statuses.pop(name, None) is not None:
+                    yield name, None
+                continue
+            else:
+                updates = [(data['metadata']['name'], data)]
+            for name, o in updates:
+                status = tenant_status(o)
+                if last_statuses.get(name) != status:
+                    last_statuses[name] = status
+                    yield name, status
+
+
+async def debug_certificates(name, primary_key, consistent=False):
     try:
         validate_admin_primary_key(primary_key)
     except ValueError as e:
         return False, str(e)
-    status, output = await async_subprocess_status_output(
-        'kubectl', 'get', 'cdntenant.cdn.cloudwm-cdn.com', name, '-n', NAMESPACE, '-o', 'json',
-        stderr=subprocess.STDOUT
-    )
-    if status != 0:
-        return False, output
-    o = orjson.loads(output)
+    success, o = await get_tenant(name, consistent)
+    if not success:
+        return False, o
     return True, {
         'certificates': certificate_resource_details(name, o.get('spec', {})),
     }
 
 
-async def origins_health(name):
-    status, output = await async_subprocess_status_output(
-        'kubectl', 'get', 'cdntenant.cdn.cloudwm-cdn.com', name, '-n', NAMESPACE, '-o', 'json',
-        stderr=subprocess.STDOUT
-    )
-    if status != 0:
-        return False, output
-    tenant = orjson.loads(output)
+async def origins_health(name, consistent=False):
+    success, tenant = await get_tenant(name, consistent)
+    if not success:
+        return False, tenant
     origins = tenant.get("spec", {}).get("origins", [])
     try:
         validate_origins(origins)
         return True, await asyncio.gather(*[
-            asyncio.to_thread(check_origin_health, origin, index)
+            check_origin_health(origin, index)
             for index, origin in enumerate(origins)
         ])
     except ValueError as e:
         return False, str(e)
 
 
-async def list_iterator():
-    status, output = await async_subprocess_status_output(
-        'kubectl', 'get', 'cdntenant.cdn.cloudwm-cdn.com', '-oname', '-n', NAMESPACE,
-        stderr=subprocess.STDOUT
+_origins_health_cache = TTLCache(config.ORIGINS_HEALTH_TTL_SECONDS)
+
+
+async def origins_health_cached(name, consistent=False, fresh=False):
+    """returns tuple of (success, origins health or error message, age of the result in seconds)"""
+    (success, output), age_seconds = await _origins_health_cache.get_with_age(
+        name, lambda: origins_health(name, consistent),
+        max_age_seconds=config.ORIGINS_HEALTH_FRESH_MIN_INTERVAL_SECONDS if fresh or consistent else None,
     )
-    if status == 0:
-        for name in output.splitlines():
-            if name:
-                yield name.split('/', 1)[1]
-    else:
-        raise Exception(output)
+    if not success:
+        _origins_health_cache.invalidate(name)
+    return success, output, age_seconds
+
+
+async def list_iterator(consistent=False, continue_token=None):
+    """yields all tenant names, or the remaining names after continue_token of a previous list_page call"""
+    tenants = None if consistent or continue_token else informer.get_tenants()
+    if tenants is not None:
+        for name in tenants.sorted_names():
+            yield name
+        return
+    async for name in kube.get_backend().iter_tenant_names(continue_token):
+        yield name
+
+
+async def list_names(consistent=False):
+    """returns tuple of (sorted tenant names, etag of the names)"""
+    tenants = None if consistent else informer.get_tenants()
+    if tenants is not None:
+        # digest is cached by the informer until a tenant is added or removed
+        return tenants.sorted_names(), f'"{tenants.names_digest()[:32]}"'
+    names = [name async for name in list_iterator(consistent)]
+    return names, f'"{informer.names_digest(names)[:32]}"'
+
+
+async def list_page(limit, continue_token=None):
+    """returns tuple of (success, (names, continue token for the next page or None) or error message)"""
+    return await kube.get_backend().list_tenant_names_page(limit, continue_token)
 
 
 def parse_pod_status(pod):
@@ -398,22 +877,29 @@ def parse_pod_status(pod):
     }
 
 
-async def components_status():
+_components_status_cache = TTLCache(config.COMPONENTS_STATUS_TTL_SECONDS)
+
+
+async def _load_components_status():
     res = {
         'cache': {},
         'edge': {},
         'operator': [],
     }
-    for pod in orjson.loads(await async_subprocess_check_output(
-        'kubectl', '-n', 'cdn-cache', 'get', 'pods', '-o', 'json'
-    ))['items']:
+    backend = kube.get_backend()
+    cache_pods, edge_pods, operator_pods = await asyncio.gather(
+        backend.list_pods('cdn-cache', config.COMPONENTS_STATUS_CACHE_LABEL_SELECTOR),
+        backend.list_pods('cdn-edge', config.COMPONENTS_STATUS_EDGE_LABEL_SELECTOR),
+        backend.list_pods('cwm-cdn-operator-system', config.COMPONENTS_STATUS_OPERATOR_LABEL_SELECTOR),
+    )
+    for pod in cache_pods:
         res['cache'].setdefault(pod['metadata']['name'].split('-')[0], []).append(parse_pod_status(pod))
-    for pod in orjson.loads(await async_subprocess_check_output(
-        'kubectl', '-n', 'cdn-edge', 'get', 'pods', '-o', 'json'
-    ))['items']:
+    for pod in edge_pods:
         res['edge'].setdefault(pod['metadata']['name'].split('-')[2], []).append(parse_pod_status(pod))
-    for pod in orjson.loads(await async_subprocess_check_output(
-        'kubectl', '-n', 'cwm-cdn-operator-system', 'get', 'pods', '-o', 'json'
-    ))['items']:
+    for pod in operator_pods:
         res['operator'].append(parse_pod_status(pod))
     return res
+
+
+async def components_status():
+    return await _components_status_cache.get(None, _load_components_status)
@@ -1,12 +1,30 @@
+from . import startup
+
+import time
 import logging
 import traceback
+import contextlib
 
 from fastapi import FastAPI, logger, Request
 from fastapi.responses import ORJSONResponse
 
 from .version import VERSION
 from .router import router
-from . import config
+from . import config, informer, metrics
+from .common import QueueFull
+
+startup.record('imports', startup.STARTED_AT)
+
+
+async def queue_full_exception_handler(request: Request, exc: QueueFull):
+    return ORJSONResponse(
+        status_code=503,
+        headers={"Retry-After": "1"},
+        content={
+            "success": False,
+            "msg": str(exc),
+        }
+    )
 
 
 async def global_exception_handler(request: Request, exc: Exception):
@@ -19,16 +37,62 @@ async def global_exception_handler(request: Request, exc: Exception):
     )
 
 
+class MetricsMiddleware:
+    """records in-flight requests and request latency labeled by route path template"""
+
+    def __init__(self, app_):
+        self.app = app_
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        method = scope['method']
+        status = 500
+
+        async def send_(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        start_time = time.monotonic()
+        in_flight = metrics.HTTP_REQUESTS_IN_FLIGHT.labels(method)
+        in_flight.inc()
+        try:
+            await self.app(scope, receive, send_)
+        finally:
+            in_flight.dec()
+            # the matched route is set in the scope by the router, path parameters don't create new series
+            route = getattr(scope.get('route'), 'path', '<unmatched>')
+            metrics.HTTP_REQUEST_DURATION.labels(method, route, str(status)).observe(time.monotonic() - start_time)
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app_):
+    with startup.timed('informers'):
+        await informer.start()
+    startup.log_summary()
+    try:
+        yield
+    finally:
+        await informer.stop()
+
+
 def app():
+    start_time = time.monotonic()
     app_ = FastAPI(
         version=VERSION,
         title='CWM CDN API',
+        lifespan=lifespan,
     )
     if config.CWM_ENV_TYPE == 'docker':
         logging.basicConfig(level=getattr(logging, config.CWM_LOG_LEVEL), handlers=logging.getLogger("gunicorn.error").handlers)
     else:
         logging.basicConfig(level=getattr(logging, config.CWM_LOG_LEVEL), handlers=logger.logger.handlers)
+    app_.add_exception_handler(QueueFull, queue_full_exception_handler)
     app_.add_exception_handler(Exception, global_exception_handler)
     app_.include_router(router)
+    app_.add_middleware(MetricsMiddleware)
+    startup.record('app', start_time)
     logging.info('App initialized')
     return app_
@@ -26,6 +26,18 @@ async def apply(cdn_tenant_name, cdn_tenant_spec_json):
     common.json_print(await api.apply(cdn_tenant_name, orjson.loads(cdn_tenant_spec_json)))
 
 
+@main.command()
+@click.argument('items_json_file')
+async def apply_bulk(items_json_file):
+    """Apply a JSON list of {"name": ..., "spec": ...} tenants"""
+    from . import api
+    with open(items_json_file, 'rb') as f:
+        items = orjson.loads(f.read())
+    results = await api.apply_bulk(items)
+    common.json_print(results)
+    print(f'Applied {sum(1 for r in results if r["success"])}/{len(results)} CDN tenants', file=sys.stderr)
+
+
 @main.command()
 @click.argument('cdn_tenant_name')
 async def delete(cdn_tenant_name):
@@ -60,9 +72,10 @@ async def reserved_names():
 
 @main.command()
 @click.argument('zones_dir')
-async def start_zone_writer(zones_dir):
+@click.option('--dns-listen', default=config.ZONE_WRITER_DNS_LISTEN, help='Also answer DNS queries for the zones from memory on HOST:PORT (udp and tcp)')
+async def start_zone_writer(zones_dir, dns_listen):
     from . import zone_writer
-    await zone_writer.main(zones_dir, daemon=True)
+    await zone_writer.main(zones_dir, daemon=True, dns_listen=dns_listen)
 
 
 @main.command()
@@ -71,6 +84,25 @@ async def components_status():
     common.json_print(await api.components_status())
 
 
+@main.command()
+@click.option('--host', default='127.0.0.1')
+@click.option('--port', default=8001)
+@click.option('--num-tenants', default=0, help='Seed the fake api server with this number of synthetic tenants')
+async def start_fake_kube_api(host, port, num_tenants):
+    import asyncio
+    from . import kube_fake
+    api = kube_fake.FakeKubeApi()
+    for i in range(num_tenants):
+        api.add_namespace(f'tenant{i}')
+        api.add_tenant(f'tenant{i}', {
+            'domains': [{'name': f'tenant{i}.example.com', 'cert': 'cert', 'key': 'key'}],
+            'origins': [{'url': 'http://origin.example.com'}],
+        })
+    async with kube_fake.serve(api, host=host, port=port):
+        print(f'Fake kubernetes api server listening on {api.url} (use KUBE_API_URL={api.url})', file=sys.stderr)
+        await asyncio.Event().wait()
+
+
 from .load_tests import cli as load_tests_cli
 main.add_command(load_tests_cli.main, name='load-tests')
 
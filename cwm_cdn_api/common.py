@@ -1,23 +1,165 @@
-import orjson
+import time
 import asyncio
+import contextlib
+import collections
+
+import orjson
+
+from . import config, metrics
 
 
 def json_print(data):
     print(orjson.dumps(data, option=(orjson.OPT_INDENT_2 | orjson.OPT_APPEND_NEWLINE)).decode())
 
 
+class QueueFull(Exception):
+    pass
+
+
+class ConcurrencyLimiter:
+    """limits concurrent operations, callers wait in a bounded fifo queue and fail fast with QueueFull when it is full"""
+
+    def __init__(self, name, max_concurrency, max_queue):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.in_flight = 0
+        self.waiters = collections.deque()
+
+    def _set_gauges(self):
+        metrics.LIMITER_IN_FLIGHT.labels(self.name).set(self.in_flight)
+        metrics.LIMITER_QUEUE_DEPTH.labels(self.name).set(len(self.waiters))
+
+    async def _acquire(self):
+        if self.in_flight < self.max_concurrency and not self.waiters:
+            self.in_flight += 1
+            self._set_gauges()
+            metrics.LIMITER_WAIT_SECONDS.labels(self.name).observe(0)
+            return
+        if len(self.waiters) >= self.max_queue:
+            metrics.LIMITER_REJECTED.labels(self.name).inc()
+            raise QueueFull(f'too many pending {self.name} operations, try again later')
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        self._set_gauges()
+        start_time = time.monotonic()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # the slot was already handed over to this caller
+                self._release()
+            else:
+                self.waiters.remove(waiter)
+                self._set_gauges()
+            raise
+        metrics.LIMITER_WAIT_SECONDS.labels(self.name).observe(time.monotonic() - start_time)
+
+    def _release(self):
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                # hand over the slot, in_flight stays the same
+                waiter.set_result(None)
+                self._set_gauges()
+                return
+        self.in_flight -= 1
+        self._set_gauges()
+
+    @contextlib.asynccontextmanager
+    async def slot(self):
+        await self._acquire()
+        try:
+            yield
+        finally:
+            self._release()
+
+
+# limits the number of concurrent child processes (e.g. kubectl) per worker
+subprocess_limiter = ConcurrencyLimiter('subprocess', config.SUBPROCESS_MAX_CONCURRENCY, config.SUBPROCESS_MAX_QUEUE)
+
+
 async def async_subprocess_check_call(*args, **kwargs):
     assert (await (await asyncio.create_subprocess_exec(*args, **kwargs)).wait()) == 0
 
 
 async def async_subprocess_check_output(*args, **kwargs):
-    proc = await asyncio.create_subprocess_exec(*args, stdout=asyncio.subprocess.PIPE, **kwargs)
-    stdout, _ = await proc.communicate()
+    async with subprocess_limiter.slot():
+        proc = await asyncio.create_subprocess_exec(*args, stdout=asyncio.subprocess.PIPE, **kwargs)
+        stdout, _ = await proc.communicate()
     assert proc.returncode == 0
     return stdout.decode().strip()
 
 
 async def async_subprocess_status_output(*args, **kwargs):
-    proc = await asyncio.create_subprocess_exec(*args, stdout=asyncio.subprocess.PIPE, **kwargs)
-    stdout, _ = await proc.communicate()
+    async with subprocess_limiter.slot():
+        proc = await asyncio.create_subprocess_exec(*args, stdout=asyncio.subprocess.PIPE, **kwargs)
+        stdout, _ = await proc.communicate()
     return proc.returncode, stdout.decode().strip()
+
+
+async def async_subprocess_iter_lines(*args, **kwargs):
+    """yields the output lines while the process runs, raises with its stderr if it fails"""
+    async with subprocess_limiter.slot():
+        proc = await asyncio.create_subprocess_exec(
+            *args, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE, limit=2 ** 24, **kwargs
+        )
+        stderr_task = asyncio.create_task(proc.stderr.read())
+        try:
+            async for line in proc.stdout:
+                yield line.decode().rstrip('\n')
+            await proc.wait()
+        finally:
+            if proc.returncode is None:
+                proc.kill()
+                await proc.wait()
+            stderr = await stderr_task
+    if proc.returncode != 0:
+        raise Exception(stderr.decode().strip())
+
+
+class TTLCache:
+    """caches async loader results per key for ttl_seconds, concurrent callers of a missing or expired key share a single load"""
+
+    def __init__(self, ttl_seconds, max_entries=10000):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.values = {}  # key -> (monotonic load time, value)
+        self.loading = {}  # key -> load task
+
+    async def _load(self, key, loader):
+        try:
+            value = await loader()
+            if len(self.values) >= self.max_entries:
+                self.prune()
+            entry = self.values[key] = (time.monotonic(), value)
+            return entry
+        finally:
+            self.loading.pop(key, None)
+
+    async def get_with_age(self, key, loader, max_age_seconds=None):
+        """returns tuple of (value, seconds since it was loaded)"""
+        max_age_seconds = self.ttl_seconds if max_age_seconds is None else max_age_seconds
+        entry = self.values.get(key)
+        if entry is None or time.monotonic() - entry[0] >= max_age_seconds:
+            task = self.loading.get(key)
+            if task is None or task.get_loop() is not asyncio.get_running_loop():
+                task = self.loading[key] = asyncio.ensure_future(self._load(key, loader))
+            # shielded so that a cancelled caller doesn't cancel the load shared with other callers
+            entry = await asyncio.shield(task)
+        return entry[1], time.monotonic() - entry[0]
+
+    async def get(self, key, loader, max_age_seconds=None):
+        return (await self.get_with_age(key, loader, max_age_seconds))[0]
+
+    def prune(self):
+        now = time.monotonic()
+        for key, (loaded_at, _) in list(self.values.items()):
+            if now - loaded_at >= self.ttl_seconds:
+                del self.values[key]
+
+    def invalidate(self, key=None):
+        if key is None:
+            self.values.clear()
+        else:
+            self.values.pop(key, None)
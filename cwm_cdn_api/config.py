@@ -12,3 +12,78 @@ CWM_ENV_TYPE = os.getenv("CWM_ENV_TYPE")
 NAMESPACE = os.getenv("NAMESPACE", "default")
 IS_PRIMARY = os.getenv("IS_PRIMARY", "") == "true"
 ALLOWED_PRIMARY_KEY = os.getenv("ALLOWED_PRIMARY_KEY", "")
+
+# how to access the kubernetes api:
+#   auto - in-process http client if in-cluster or kubeconfig credentials are available, otherwise kubectl
+#   http - in-process http client only
+#   kubectl - spawn a kubectl process for each call
+KUBE_BACKEND = os.getenv("KUBE_BACKEND", "auto")
+KUBE_API_URL = os.getenv("KUBE_API_URL", "")  # overrides in-cluster / kubeconfig server, e.g. to use the local fake api server
+KUBE_API_TOKEN = os.getenv("KUBE_API_TOKEN", "")
+KUBE_API_TIMEOUT_SECONDS = float(os.getenv("KUBE_API_TIMEOUT_SECONDS", "30"))
+KUBE_API_MAX_CONNECTIONS = int(os.getenv("KUBE_API_MAX_CONNECTIONS", "20"))
+
+# max concurrent kubectl (or other child) processes per worker, further calls wait in a queue of up to
+# SUBPROCESS_MAX_QUEUE callers, beyond that requests fail immediately with 503
+SUBPROCESS_MAX_CONCURRENCY = int(os.getenv("SUBPROCESS_MAX_CONCURRENCY", "16"))
+SUBPROCESS_MAX_QUEUE = int(os.getenv("SUBPROCESS_MAX_QUEUE", "256"))
+
+# serve tenant reads from an in-memory list + watch cache (requires the http kubernetes backend)
+TENANT_INFORMER = os.getenv("TENANT_INFORMER", "true") == "true"
+# index of namespace names for reserved tenant name validation (requires list + watch permissions on namespaces)
+NAMESPACE_INFORMER = os.getenv("NAMESPACE_INFORMER", "true") == "true"
+# when the informers are not available, tenant and namespace names are listed at most once per this interval
+RESERVED_NAMES_TTL_SECONDS = float(os.getenv("RESERVED_NAMES_TTL_SECONDS", "30"))
+INFORMER_RESYNC_SECONDS = float(os.getenv("INFORMER_RESYNC_SECONDS", "600"))  # periodic full relist as a safety net
+INFORMER_WATCH_TIMEOUT_SECONDS = float(os.getenv("INFORMER_WATCH_TIMEOUT_SECONDS", "290"))
+# total time the workers wait on startup for all informers to sync, keep it well below GUNICORN_TIMEOUT, reads are served
+# from the api server until the informers are synced
+INFORMER_START_TIMEOUT_SECONDS = float(os.getenv("INFORMER_START_TIMEOUT_SECONDS", "10"))
+# a snapshot listed in the gunicorn master before forking (WARM_START=true) seeds the informers of workers started
+# within this many seconds, workers restarted later list the collections themselves
+WARM_START_SNAPSHOT_MAX_AGE_SECONDS = float(os.getenv("WARM_START_SNAPSHOT_MAX_AGE_SECONDS", "60"))
+STARTUP_BUDGET_SECONDS = float(os.getenv("STARTUP_BUDGET_SECONDS", "10"))  # a warning is logged when startup takes longer
+
+APPLY_BULK_CONCURRENCY = int(os.getenv("APPLY_BULK_CONCURRENCY", "20"))  # max concurrent tenant applies per /apply-bulk request
+APPLY_BULK_MAX_ITEMS = int(os.getenv("APPLY_BULK_MAX_ITEMS", "5000"))
+LIST_PAGE_SIZE = int(os.getenv("LIST_PAGE_SIZE", "500"))  # tenants per kubernetes list request when paging through all tenants
+LIST_MAX_LIMIT = int(os.getenv("LIST_MAX_LIMIT", "5000"))
+
+# components status is cached for this interval, concurrent requests share a single refresh
+COMPONENTS_STATUS_TTL_SECONDS = float(os.getenv("COMPONENTS_STATUS_TTL_SECONDS", "5"))
+# optional label selectors to limit the pods listed for each component
+COMPONENTS_STATUS_CACHE_LABEL_SELECTOR = os.getenv("COMPONENTS_STATUS_CACHE_LABEL_SELECTOR", "")
+COMPONENTS_STATUS_EDGE_LABEL_SELECTOR = os.getenv("COMPONENTS_STATUS_EDGE_LABEL_SELECTOR", "")
+COMPONENTS_STATUS_OPERATOR_LABEL_SELECTOR = os.getenv("COMPONENTS_STATUS_OPERATOR_LABEL_SELECTOR", "")
+
+# origin health probes share a keep-alive http client per worker
+ORIGIN_HEALTH_MAX_CONCURRENCY = int(os.getenv("ORIGIN_HEALTH_MAX_CONCURRENCY", "50"))
+ORIGIN_HEALTH_MAX_CONNECTIONS = int(os.getenv("ORIGIN_HEALTH_MAX_CONNECTIONS", "100"))
+ORIGIN_HEALTH_MAX_DRAIN_BYTES = int(os.getenv("ORIGIN_HEALTH_MAX_DRAIN_BYTES", "65536"))  # larger response bodies are not read
+# origin health results are cached per tenant, concurrent requests share a single probe
+ORIGINS_HEALTH_TTL_SECONDS = float(os.getenv("ORIGINS_HEALTH_TTL_SECONDS", "10"))
+ORIGINS_HEALTH_FRESH_MIN_INTERVAL_SECONDS = float(os.getenv("ORIGINS_HEALTH_FRESH_MIN_INTERVAL_SECONDS", "2"))  # ?fresh=true is served from cache if younger than this
+# /wait-ready long-poll, without the tenants informer and the http backend the tenant is polled at this interval
+WAIT_READY_MAX_TIMEOUT_SECONDS = float(os.getenv("WAIT_READY_MAX_TIMEOUT_SECONDS", "300"))
+WAIT_READY_POLL_SECONDS = float(os.getenv("WAIT_READY_POLL_SECONDS", "2"))
+# /events server-sent events stream of tenant status changes
+EVENTS_KEEPALIVE_SECONDS = float(os.getenv("EVENTS_KEEPALIVE_SECONDS", "15"))
+EVENTS_MAX_QUEUE = int(os.getenv("EVENTS_MAX_QUEUE", "10000"))  # per connection, a slow client falls back to a snapshot
+# the zone writer daemon follows a watch on the tenants (with the http kubernetes backend, otherwise it polls),
+# changes are batched for the debounce interval and all zones are compared with the tenants every resync interval
+ZONE_WRITER_DEBOUNCE_SECONDS = float(os.getenv("ZONE_WRITER_DEBOUNCE_SECONDS", "0.2"))
+ZONE_WRITER_RESYNC_SECONDS = float(os.getenv("ZONE_WRITER_RESYNC_SECONDS", "300"))
+# optional HOST:PORT of an embedded dns responder which answers queries for the zones from memory
+ZONE_WRITER_DNS_LISTEN = os.getenv("ZONE_WRITER_DNS_LISTEN", "")
+# with more than one zone writer replica, only the holder of a coordination.k8s.io Lease watches the tenants and writes
+# the zones (requires the http kubernetes backend and get, create and update permissions on leases), the other
+# replicas stand by and load the zones snapshot written by the leader, a failover takes up to ZONE_WRITER_LEASE_SECONDS
+ZONE_WRITER_LEADER_ELECTION = os.getenv("ZONE_WRITER_LEADER_ELECTION", "false") == "true"
+ZONE_WRITER_LEASE_NAME = os.getenv("ZONE_WRITER_LEASE_NAME", "cwm-cdn-zone-writer")
+ZONE_WRITER_LEASE_SECONDS = float(os.getenv("ZONE_WRITER_LEASE_SECONDS", "5"))
+ZONE_WRITER_LEASE_RENEW_DEADLINE_SECONDS = float(os.getenv("ZONE_WRITER_LEASE_RENEW_DEADLINE_SECONDS", "3"))  # the leader stops if it can't renew within this time
+ZONE_WRITER_LEASE_RETRY_SECONDS = float(os.getenv("ZONE_WRITER_LEASE_RETRY_SECONDS", "1"))
+ZONE_WRITER_FOLLOW_SECONDS = float(os.getenv("ZONE_WRITER_FOLLOW_SECONDS", "1"))  # interval of standby replicas checking the snapshot
+# write A/AAAA records of the tenant service ips (the cluster ips, or the ready endpoints of a headless service) instead
+# of a CNAME to the service name, requires the http kubernetes backend and list and watch on services and endpointslices
+ZONE_WRITER_FLATTEN = os.getenv("ZONE_WRITER_FLATTEN", "false") == "true"
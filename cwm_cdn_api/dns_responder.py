@@ -0,0 +1,218 @@
+import socket
+import struct
+import asyncio
+import logging
+
+
+TYPE_A = 1
+TYPE_NS = 2
+TYPE_CNAME = 5
+TYPE_SOA = 6
+TYPE_AAAA = 28
+TYPE_OPT = 41
+TYPE_ANY = 255
+CLASS_IN = 1
+CLASS_ANY = 255
+
+RCODE_NOERROR = 0
+RCODE_FORMERR = 1
+RCODE_NXDOMAIN = 3
+RCODE_NOTIMP = 4
+RCODE_REFUSED = 5
+
+FLAG_QR = 0x8000
+FLAG_AA = 0x0400
+FLAG_TC = 0x0200
+FLAG_RD = 0x0100
+OPCODE_MASK = 0x7800
+
+# same values as the zone files written by the zone writer
+TTL = 60
+SOA_TIMERS = struct.pack('!IIII', 120, 60, 1209600, 60)
+NS_ADDRESS = bytes([127, 0, 0, 1])
+
+# udp responses larger than this are truncated, unless the client advertised a larger edns udp payload size
+UDP_MAX_SIZE = 512
+# the largest edns udp payload size which is accepted from clients and advertised to them, avoids ip fragmentation
+EDNS_UDP_MAX_SIZE = 1232
+OPT_RR = b'\x00' + struct.pack('!HHIH', TYPE_OPT, EDNS_UDP_MAX_SIZE, 0, 0)
+
+
+def encode_name(name):
+    return b''.join(bytes([len(label)]) + label.encode() for label in name.rstrip('.').split('.') if label) + b'\x00'
+
+
+def _rr(owner, rr_type, rdata):
+    return owner + struct.pack('!HHIH', rr_type, CLASS_IN, TTL, len(rdata)) + rdata
+
+
+def _address_rr(owner, address):
+    if ':' in address:
+        return _rr(owner, TYPE_AAAA, socket.inet_pton(socket.AF_INET6, address))
+    return _rr(owner, TYPE_A, socket.inet_pton(socket.AF_INET, address))
+
+
+def parse_question(query):
+    """returns tuple of (id, flags, qname labels, qtype, qclass, end offset of the question), raises ValueError"""
+    if len(query) < 12:
+        raise ValueError('short header')
+    query_id, flags, qdcount = struct.unpack('!HHH', query[:6])
+    if qdcount != 1:
+        raise ValueError('expected a single question')
+    labels = []
+    offset = 12
+    while True:
+        if offset >= len(query):
+            raise ValueError('truncated name')
+        length = query[offset]
+        offset += 1
+        if length == 0:
+            break
+        if length & 0xC0:
+            raise ValueError('compressed question name')
+        labels.append(query[offset:offset + length].decode('ascii').lower())
+        offset += length
+    if offset + 4 > len(query):
+        raise ValueError('truncated question')
+    qtype, qclass = struct.unpack('!HH', query[offset:offset + 4])
+    return query_id, flags, labels, qtype, qclass, offset + 4
+
+
+def parse_edns_udp_size(query, offset):
+    """returns the udp payload size of an OPT record right after the question at offset, or None if there is none"""
+    ancount, nscount, arcount = struct.unpack('!HHH', query[6:12])
+    # the OPT record is owned by the root name
+    if ancount or nscount or not arcount or offset + 11 > len(query) or query[offset] != 0:
+        return None
+    rr_type, udp_size = struct.unpack('!HH', query[offset + 1:offset + 5])
+    return udp_size if rr_type == TYPE_OPT else None
+
+
+def _message(query_id, flags, question, answers=(), authority=(), additional=()):
+    return b''.join([
+        struct.pack('!HHHHHH', query_id, flags, 1, len(answers), len(authority), len(additional)),
+        question,
+        *answers,
+        *authority,
+        *additional,
+    ])
+
+
+class DnsResponder:
+    """answers queries for the tenant zones from the in-memory records of the zone writer
+
+    records is a zone_writer.ZoneRecords, serial is a callable which returns the SOA serial of an apex
+    """
+
+    def __init__(self, records, serial):
+        self.records = records
+        self.serial = serial
+
+    def _soa(self, apex, owner):
+        return _rr(
+            owner, TYPE_SOA,
+            encode_name(f'ns1.{apex}') + encode_name(f'hostmaster.{apex}') + struct.pack('!I', self.serial(apex)) + SOA_TIMERS,
+        )
+
+    def resolve(self, labels, qtype):
+        """returns tuple of (rcode, answer records, authority records), or None if not authoritative for the name"""
+        if len(labels) < 2:
+            return None
+        apex = '.'.join(labels[-2:])
+        records = self.records.apex_records.get(apex)
+        if records is None:
+            return None
+        owner = encode_name('.'.join(labels))
+        domain_without_apex = '.'.join(labels[:-2])
+        answers = []
+        if not domain_without_apex and qtype in (TYPE_SOA, TYPE_NS, TYPE_ANY):
+            if qtype in (TYPE_SOA, TYPE_ANY):
+                answers.append(self._soa(apex, owner))
+            if qtype in (TYPE_NS, TYPE_ANY):
+                answers.append(_rr(owner, TYPE_NS, encode_name(f'ns1.{apex}')))
+            return RCODE_NOERROR, answers, []
+        if domain_without_apex == 'ns1' and 'ns1' not in records:
+            if qtype in (TYPE_A, TYPE_ANY):
+                return RCODE_NOERROR, [_rr(owner, TYPE_A, NS_ADDRESS)], []
+            return RCODE_NOERROR, [], [self._soa(apex, encode_name(apex))]
+        tenant_name = records.get(domain_without_apex)
+        if tenant_name is not None:
+            addresses = self.records.tenant_addresses.get(tenant_name)
+            if not addresses:
+                return RCODE_NOERROR, [_rr(owner, TYPE_CNAME, encode_name(f'tenant.{tenant_name}.svc.cluster.local'))], []
+            # flattened records, A and AAAA of the tenant service instead of the CNAME
+            answers = [
+                _address_rr(owner, address) for address in addresses
+                if qtype == TYPE_ANY or qtype == (TYPE_AAAA if ':' in address else TYPE_A)
+            ]
+            return RCODE_NOERROR, answers, ([] if answers else [self._soa(apex, encode_name(apex))])
+        if not domain_without_apex:
+            # the apex exists, with no records of the queried type
+            return RCODE_NOERROR, [], [self._soa(apex, encode_name(apex))]
+        return RCODE_NXDOMAIN, [], [self._soa(apex, encode_name(apex))]
+
+    def answer(self, query, udp=False):
+        """returns the response message to a query message, or None if it can't be parsed at all
+
+        udp responses larger than the client accepts are truncated to the question with the TC flag, the client then
+        retries over tcp
+        """
+        try:
+            query_id, flags, labels, qtype, qclass, question_end = parse_question(query)
+        except (ValueError, UnicodeDecodeError):
+            if len(query) < 2:
+                return None
+            return struct.pack('!HHHHHH', struct.unpack('!H', query[:2])[0], FLAG_QR | RCODE_FORMERR, 0, 0, 0, 0)
+        question = query[12:question_end]
+        response_flags = FLAG_QR | (flags & FLAG_RD)
+        edns_udp_size = parse_edns_udp_size(query, question_end)
+        additional = [] if edns_udp_size is None else [OPT_RR]
+        if flags & OPCODE_MASK:
+            return _message(query_id, response_flags | RCODE_NOTIMP, question, additional=additional)
+        result = self.resolve(labels, qtype) if qclass in (CLASS_IN, CLASS_ANY) else None
+        if result is None:
+            return _message(query_id, response_flags | RCODE_REFUSED, question, additional=additional)
+        rcode, answers, authority = result
+        response = _message(query_id, response_flags | FLAG_AA | rcode, question, answers, authority, additional)
+        if udp and len(response) > max(UDP_MAX_SIZE, min(edns_udp_size or 0, EDNS_UDP_MAX_SIZE)):
+            return _message(query_id, response_flags | FLAG_AA | FLAG_TC | rcode, question, additional=additional)
+        return response
+
+
+class _UdpProtocol(asyncio.DatagramProtocol):
+
+    def __init__(self, responder):
+        self.responder = responder
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        response = self.responder.answer(data, udp=True)
+        if response is not None:
+            self.transport.sendto(response, addr)
+
+
+async def _handle_tcp(responder, reader, writer):
+    try:
+        while True:
+            length = struct.unpack('!H', await reader.readexactly(2))[0]
+            response = responder.answer(await reader.readexactly(length))
+            if response is None:
+                break
+            writer.write(struct.pack('!H', len(response)) + response)
+            await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(responder, host, port):
+    """starts udp and tcp listeners, returns tuple of (udp transport, tcp server)"""
+    loop = asyncio.get_running_loop()
+    udp_transport, _ = await loop.create_datagram_endpoint(lambda: _UdpProtocol(responder), local_addr=(host, port))
+    tcp_server = await asyncio.start_server(lambda reader, writer: _handle_tcp(responder, reader, writer), host, port)
+    logging.info(f'DNS responder listening on {host}:{port} (udp and tcp)')
+    return udp_transport, tcp_server
@@ -0,0 +1,287 @@
+import time
+import hashlib
+import random
+import asyncio
+import logging
+
+from . import config, kube, metrics, startup
+
+
+def names_digest(names):
+    return hashlib.sha256('\n'.join(names).encode()).hexdigest()
+
+
+class Informer:
+    """keeps an in-memory, resourceVersion-consistent copy of a kubernetes collection using list + watch"""
+
+    def __init__(self, name, path, backend=None, accept=None, resync_seconds=None, page_size=None, transform=None, params=None,
+                 namespaced=False):
+        self.name = name
+        self.path = path
+        self.params = params or {}  # label or field selector of the list and watch requests
+        self.namespaced = namespaced  # items are keyed by namespace/name, for collections across all namespaces
+        self.backend = backend
+        self.accept = accept
+        self.page_size = page_size  # list in pages of this many objects instead of a single response
+        self.transform = transform  # optional callable which returns the part of an object to keep in memory
+        self.resync_seconds = config.INFORMER_RESYNC_SECONDS if resync_seconds is None else resync_seconds
+        self.items = {}
+        self.listeners = set()  # callables of (event type, object), called on every change
+        self.written = {}  # name -> what this process last wrote to the object, e.g. a spec hash, for detecting stale items
+        self._sorted_names = None  # cached until an item is added or removed
+        self._names_digest = None
+        self.resource_version = None
+        self.synced = False
+        self.last_sync_time = None
+        self.last_list_time = None
+        self.num_resyncs = 0
+        self._seeded = False
+        self._synced_event = asyncio.Event()
+        self._task = None
+
+    def get(self, name):
+        return self.items.get(name)
+
+    def key(self, obj):
+        metadata = obj['metadata']
+        return f'{metadata.get("namespace")}/{metadata["name"]}' if self.namespaced else metadata['name']
+
+    def sorted_names(self):
+        if self._sorted_names is None:
+            self._sorted_names = sorted(self.items)
+            self._names_digest = None
+        return self._sorted_names
+
+    def names_digest(self):
+        """digest of the item names, equal in all processes holding the same set of names"""
+        names = self.sorted_names()
+        if self._names_digest is None:
+            self._names_digest = names_digest(names)
+        return self._names_digest
+
+    def staleness_seconds(self):
+        return None if self.last_sync_time is None else time.time() - self.last_sync_time
+
+    def status(self):
+        return {
+            'synced': self.synced,
+            'resourceVersion': self.resource_version,
+            'objects': len(self.items),
+            'stalenessSeconds': self.staleness_seconds(),
+            'resyncs': self.num_resyncs,
+        }
+
+    def _touch(self, resource_version):
+        self.resource_version = resource_version
+        self.last_sync_time = time.time()
+        metrics.INFORMER_LAST_SYNC.labels(self.name).set(self.last_sync_time)
+
+    def add_listener(self, listener):
+        self.listeners.add(listener)
+
+    def remove_listener(self, listener):
+        self.listeners.discard(listener)
+
+    def _notify(self, event_type, obj):
+        for listener in list(self.listeners):
+            try:
+                listener(event_type, obj)
+            except Exception:
+                logging.exception(f'{self.name} informer listener failed')
+
+    async def fetch(self):
+        """returns a list response of the collection with transformed items, listed in pages if page_size"""
+        if not self.page_size:
+            data = await self.backend.request_check('GET', self.path, params=self.params or None, accept=self.accept)
+            return {**data, 'items': list(map(self.transform, data.get('items', [])))} if self.transform else data
+        items = []
+        params = {**self.params, 'limit': str(self.page_size)}
+        while True:
+            data = await self.backend.request_check('GET', self.path, params=params, accept=self.accept)
+            items.extend(map(self.transform, data['items']) if self.transform else data['items'])
+            if not data['metadata'].get('continue'):
+                break
+            params['continue'] = data['metadata']['continue']
+        # all pages are of the same snapshot, the last page has its resourceVersion
+        return {'metadata': data['metadata'], 'items': items}
+
+    async def list(self, reason):
+        self._set_list(await self.fetch(), reason, transformed=True)
+
+    def seed(self, data, transformed=False):
+        """starts the informer synced from a list response fetched elsewhere, the watch continues from its resourceVersion"""
+        self._set_list(data, 'snapshot', transformed)
+        self._seeded = True
+
+    def _set_list(self, data, reason, transformed=False):
+        items = data.get('items', [])
+        if self.transform and not transformed:
+            items = map(self.transform, items)
+        previous_items = self.items
+        self.items = {self.key(item): item for item in items}
+        self._sorted_names = None
+        if self.listeners:
+            # changes missed while the watch was not running
+            for name, item in self.items.items():
+                previous = previous_items.get(name)
+                if previous is None:
+                    self._notify('ADDED', item)
+                elif previous['metadata'].get('resourceVersion') != item['metadata'].get('resourceVersion'):
+                    self._notify('MODIFIED', item)
+            for name in previous_items.keys() - self.items.keys():
+                self._notify('DELETED', previous_items[name])
+        self.last_list_time = time.monotonic()
+        self.num_resyncs += 1
+        self._touch(data['metadata']['resourceVersion'])
+        metrics.INFORMER_RESYNCS.labels(self.name, reason).inc()
+        metrics.INFORMER_OBJECTS.labels(self.name).set(len(self.items))
+        if not self.synced:
+            self.synced = True
+            self._synced_event.set()
+
+    def on_event(self, event_type, obj):
+        if event_type not in ('ADDED', 'MODIFIED', 'DELETED'):
+            return
+        if self.transform:
+            obj = self.transform(obj)
+        name = self.key(obj)
+        if event_type == 'DELETED':
+            if self.items.pop(name, None) is not None:
+                self._sorted_names = None
+        else:
+            if name not in self.items:
+                self._sorted_names = None
+            self.items[name] = obj
+        self._notify(event_type, obj)
+
+    async def watch(self, timeout_seconds):
+        async for event in self.backend.watch(
+            self.path, resource_version=self.resource_version, timeout_seconds=timeout_seconds, params=self.params,
+            accept=self.accept,
+        ):
+            event_type, obj = event['type'], event['object']
+            metrics.INFORMER_EVENTS.labels(self.name, event_type).inc()
+            self.on_event(event_type, obj)
+            self._touch(obj['metadata']['resourceVersion'])
+        metrics.INFORMER_OBJECTS.labels(self.name).set(len(self.items))
+
+    async def run(self):
+        reason = None if self._seeded else 'initial'
+        self._seeded = False
+        while True:
+            try:
+                if reason:
+                    await self.list(reason)
+                    reason = None
+                remaining = self.last_list_time + self.resync_seconds - time.monotonic()
+                if remaining <= 0:
+                    reason = 'periodic'
+                    continue
+                await self.watch(min(remaining, config.INFORMER_WATCH_TIMEOUT_SECONDS))
+            except asyncio.CancelledError:
+                raise
+            except kube.ResourceVersionExpired:
+                logging.info(f'{self.name} informer resourceVersion {self.resource_version} expired, relisting')
+                reason = 'expired'
+            except Exception:
+                logging.exception(f'{self.name} informer failed, retrying')
+                await asyncio.sleep(1 + random.uniform(0, 1))
+
+    def start(self):
+        self.backend = self.backend or kube.get_backend()
+        self._task = asyncio.create_task(self.run())
+
+    async def wait_synced(self, timeout=None):
+        await asyncio.wait_for(self._synced_event.wait(), timeout)
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+_informers = {}
+
+
+def get(name):
+    """returns the named informer if it is running and synced, otherwise None and callers read from the api server"""
+    informer = _informers.get(name)
+    return informer if informer is not None and informer.synced else None
+
+
+def get_tenants():
+    return get(kube.TENANT_PLURAL)
+
+
+def all_informers():
+    return dict(_informers)
+
+
+def get_namespaces():
+    return get('namespaces')
+
+
+def _create_informers():
+    informers = []
+    if config.TENANT_INFORMER:
+        informers.append(Informer(kube.TENANT_PLURAL, kube.tenants_path(), page_size=config.LIST_PAGE_SIZE))
+    if config.NAMESPACE_INFORMER:
+        informers.append(Informer(
+            'namespaces', '/api/v1/namespaces', accept=kube.METADATA_ONLY_ACCEPT, page_size=config.LIST_PAGE_SIZE,
+        ))
+    return informers
+
+
+_snapshots = {}  # informer name -> (monotonic time, list response)
+
+
+async def load_snapshots():
+    """lists the informer collections once in the gunicorn master before the workers are forked (warm start)"""
+    backend = kube.get_backend()
+    if backend.name != 'http':
+        return
+    try:
+        for informer in _create_informers():
+            informer.backend = backend
+            _snapshots[informer.name] = (time.monotonic(), await informer.fetch())
+    except Exception:
+        logging.exception('failed to load the informers snapshot, workers will list on startup')
+    finally:
+        # connections must not be shared with the forked workers
+        await backend.aclose()
+
+
+def ready():
+    """true once all informers are synced, from their own list or from the warm start snapshot"""
+    return all(informer.synced for informer in _informers.values())
+
+
+async def start():
+    if kube.get_backend().name != 'http':
+        return
+    informers = _create_informers()
+    for informer in informers:
+        snapshot = _snapshots.get(informer.name)
+        if snapshot is not None and time.monotonic() - snapshot[0] <= config.WARM_START_SNAPSHOT_MAX_AGE_SECONDS:
+            informer.seed(snapshot[1], transformed=True)
+        _informers[informer.name] = informer
+        informer.start()
+    start_time = time.monotonic()
+    # a single deadline for all informers, startup must finish well within the gunicorn worker timeout
+    deadline = start_time + config.INFORMER_START_TIMEOUT_SECONDS
+    for informer in informers:
+        try:
+            await informer.wait_synced(max(0, deadline - time.monotonic()))
+        except asyncio.TimeoutError:
+            logging.warning(f'{informer.name} informer did not sync on startup, serving reads from the api server until it does')
+        startup.record(f'informers.{informer.name}', start_time)
+
+
+async def stop():
+    for informer in list(_informers.values()):
+        await informer.stop()
+    _informers.clear()
@@ -0,0 +1,549 @@
+import os
+import ssl
+import time
+import base64
+import hashlib
+import asyncio
+import logging
+import contextlib
+import tempfile
+import subprocess
+from urllib.parse import urlencode
+
+import httpx
+import orjson
+import yaml
+
+from . import config, metrics
+from .common import async_subprocess_check_output, async_subprocess_status_output, async_subprocess_iter_lines
+
+
+TENANT_GROUP = 'cdn.cloudwm-cdn.com'
+TENANT_VERSION = 'v1'
+TENANT_PLURAL = 'cdntenants'
+TENANT_API_VERSION = f'{TENANT_GROUP}/{TENANT_VERSION}'
+TENANT_RESOURCE = f'cdntenant.{TENANT_GROUP}'
+
+LAST_APPLIED_ANNOTATION = 'kubectl.kubernetes.io/last-applied-configuration'
+# hash of the validated spec, apply is a no-op when it matches the stored annotation
+SPEC_HASH_ANNOTATION = f'{TENANT_GROUP}/spec-hash'
+METADATA_ONLY_ACCEPT = 'application/json;as=PartialObjectMetadataList;g=meta.k8s.io;v=v1,application/json'
+
+POD_CUSTOM_COLUMNS = 'NAME:.metadata.name,CREATED:.metadata.creationTimestamp,IMAGE:.spec.containers[0].image,PHASE:.status.phase'
+# a line per tenant of its name, a tab and its space separated domain names
+TENANT_DOMAINS_JSONPATH = '{range .items[*]}{.metadata.name}{"\\t"}{range .spec.domains[*]}{.name}{" "}{end}{"\\n"}{end}'
+
+IN_CLUSTER_SERVICEACCOUNT_DIR = '/var/run/secrets/kubernetes.io/serviceaccount'
+TOKEN_FILE_RELOAD_SECONDS = 60
+# verb label of api request metrics, matching the kubectl verbs where there is one
+HTTP_VERBS = {'GET': 'get', 'POST': 'create', 'PUT': 'replace', 'PATCH': 'patch', 'DELETE': 'delete'}
+
+
+class KubeConfigError(Exception):
+    pass
+
+
+class ResourceVersionExpired(Exception):
+    pass
+
+
+def tenants_path(name=None):
+    path = f'/apis/{TENANT_API_VERSION}/namespaces/{config.NAMESPACE}/{TENANT_PLURAL}'
+    return f'{path}/{name}' if name else path
+
+
+def spec_hash(spec):
+    return hashlib.sha256(orjson.dumps(spec, option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+
+def is_unchanged(current, o):
+    """true if the current tenant object was applied with the same spec hash as the tenant object o"""
+    new_hash = (o['metadata'].get('annotations') or {}).get(SPEC_HASH_ANNOTATION)
+    return new_hash is not None and ((current.get('metadata') or {}).get('annotations') or {}).get(SPEC_HASH_ANNOTATION) == new_hash
+
+
+def unchanged_message(name):
+    return f'{TENANT_RESOURCE}/{name} unchanged'
+
+
+def status_message(status_code, data):
+    """formats a kubernetes api error response the same way kubectl does"""
+    if isinstance(data, dict) and data.get('kind') == 'Status':
+        reason = data.get('reason') or status_code
+        return f'Error from server ({reason}): {data.get("message", "")}'
+    return f'Error from server ({status_code}): {data}'
+
+
+def _kubeconfig_path():
+    paths = [p for p in os.getenv('KUBECONFIG', '').split(os.pathsep) if p]
+    return paths[0] if paths else os.path.expanduser('~/.kube/config')
+
+
+def _named(items, name, kind):
+    for item in items or []:
+        if item.get('name') == name:
+            return item.get(kind) or {}
+    raise KubeConfigError(f'{kind} "{name}" not found in kubeconfig')
+
+
+def _write_temp_pem(tmpdir, filename, b64data):
+    path = os.path.join(tmpdir, filename)
+    with open(path, 'wb') as f:
+        f.write(base64.b64decode(b64data))
+    return path
+
+
+def _ssl_context(ca_file=None, ca_data=None, insecure=False, cert_file=None, key_file=None, cert_data=None, key_data=None):
+    if insecure:
+        ctx = ssl.create_default_context()
+        ctx.check_hostname = False
+        ctx.verify_mode = ssl.CERT_NONE
+    else:
+        ctx = ssl.create_default_context(
+            cafile=ca_file,
+            cadata=base64.b64decode(ca_data).decode() if ca_data else None,
+        )
+    if cert_data or key_data:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            ctx.load_cert_chain(
+                _write_temp_pem(tmpdir, 'client.crt', cert_data),
+                _write_temp_pem(tmpdir, 'client.key', key_data),
+            )
+    elif cert_file:
+        ctx.load_cert_chain(cert_file, key_file)
+    return ctx
+
+
+def load_in_cluster_config():
+    host, port = os.getenv('KUBERNETES_SERVICE_HOST'), os.getenv('KUBERNETES_SERVICE_PORT')
+    token_file = os.path.join(IN_CLUSTER_SERVICEACCOUNT_DIR, 'token')
+    if not host or not port or not os.path.exists(token_file):
+        raise KubeConfigError('Not running inside a kubernetes cluster')
+    if ':' in host:
+        host = f'[{host}]'
+    return {
+        'server': f'https://{host}:{port}',
+        'token_file': token_file,
+        'verify': _ssl_context(ca_file=os.path.join(IN_CLUSTER_SERVICEACCOUNT_DIR, 'ca.crt')),
+    }
+
+
+def load_kubeconfig(path=None):
+    path = path or _kubeconfig_path()
+    if not os.path.exists(path):
+        raise KubeConfigError(f'kubeconfig not found: {path}')
+    with open(path) as f:
+        kubeconfig = yaml.safe_load(f) or {}
+    base_dir = os.path.dirname(os.path.abspath(path))
+
+    def _path(value):
+        return os.path.join(base_dir, value) if value else None
+
+    context = _named(kubeconfig.get('contexts'), kubeconfig.get('current-context'), 'context')
+    cluster = _named(kubeconfig.get('clusters'), context.get('cluster'), 'cluster')
+    user = _named(kubeconfig.get('users'), context.get('user'), 'user') if context.get('user') else {}
+    if user.get('exec') or user.get('auth-provider'):
+        raise KubeConfigError('kubeconfig exec and auth-provider credentials are only supported by kubectl')
+    if not cluster.get('server'):
+        raise KubeConfigError('kubeconfig cluster has no server')
+    res = {'server': cluster['server'], 'token': user.get('token'), 'token_file': _path(user.get('tokenFile'))}
+    if cluster['server'].startswith('https://'):
+        res['verify'] = _ssl_context(
+            ca_file=_path(cluster.get('certificate-authority')),
+            ca_data=cluster.get('certificate-authority-data'),
+            insecure=cluster.get('insecure-skip-tls-verify', False),
+            cert_file=_path(user.get('client-certificate')),
+            key_file=_path(user.get('client-key')),
+            cert_data=user.get('client-certificate-data'),
+            key_data=user.get('client-key-data'),
+        )
+    return res
+
+
+def load_config():
+    """returns the http backend connection settings, from KUBE_API_URL, in-cluster service account or kubeconfig"""
+    if config.KUBE_API_URL:
+        return {'server': config.KUBE_API_URL, 'token': config.KUBE_API_TOKEN or None}
+    try:
+        return load_in_cluster_config()
+    except KubeConfigError:
+        return load_kubeconfig()
+
+
+def _pod_from_columns(name, creation_timestamp, image, phase):
+    """returns a minimal pod object, with only the fields listed in POD_CUSTOM_COLUMNS"""
+    return {
+        'metadata': {'name': name, 'creationTimestamp': creation_timestamp},
+        'spec': {'containers': [{'image': image}]},
+        'status': {'phase': phase},
+    }
+
+
+async def _iter_pages(backend, continue_token=None):
+    while True:
+        success, output = await backend.list_tenant_names_page(config.LIST_PAGE_SIZE, continue_token)
+        if not success:
+            raise Exception(output)
+        names, continue_token = output
+        for name in names:
+            yield name
+        if not continue_token:
+            break
+
+
+@contextlib.contextmanager
+def _observe_call(backend, verb):
+    """records duration and status of a kubectl process or api request, the caller sets call['status']"""
+    call = {'status': 'error'}
+    start_time = time.monotonic()
+    metrics.KUBE_CALLS_IN_FLIGHT.labels(backend).inc()
+    try:
+        yield call
+    finally:
+        metrics.KUBE_CALLS_IN_FLIGHT.labels(backend).dec()
+        metrics.KUBE_CALL_DURATION.labels(backend, verb).observe(time.monotonic() - start_time)
+        metrics.KUBE_CALLS.labels(backend, verb, str(call['status'])).inc()
+
+
+async def kubectl_status_output(verb, *args, **kwargs):
+    """runs kubectl VERB ARGS, returns tuple of (exit status, output)"""
+    with _observe_call('kubectl', verb) as call:
+        call['status'], output = await async_subprocess_status_output('kubectl', verb, *args, **kwargs)
+    return call['status'], output
+
+
+async def kubectl_check_output(verb, *args, **kwargs):
+    with _observe_call('kubectl', verb) as call:
+        output = await async_subprocess_check_output('kubectl', verb, *args, **kwargs)
+        call['status'] = 0
+    return output
+
+
+async def kubectl_iter_lines(verb, *args, **kwargs):
+    """runs kubectl VERB ARGS, yields the output lines while it runs"""
+    with _observe_call('kubectl', verb) as call:
+        async for line in async_subprocess_iter_lines('kubectl', verb, *args, **kwargs):
+            yield line
+        call['status'] = 0
+
+
+class KubectlBackend:
+    """kubernetes access by spawning a kubectl process for each call"""
+
+    name = 'kubectl'
+
+    async def get_tenant(self, name):
+        status, output = await kubectl_status_output(
+            'get', TENANT_RESOURCE, name, '-n', config.NAMESPACE, '-o', 'json',
+            stderr=subprocess.STDOUT
+        )
+        return (True, orjson.loads(output)) if status == 0 else (False, output)
+
+    async def apply_tenant(self, o):
+        name = o['metadata']['name']
+        if SPEC_HASH_ANNOTATION in (o['metadata'].get('annotations') or {}):
+            # a get is much cheaper than an apply, and most applies are re-applies of the same spec
+            success, current = await self.get_tenant(name)
+            if success and is_unchanged(current, o):
+                return True, unchanged_message(name)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with open(os.path.join(tmpdir, f'{name}.json'), 'wb') as f:
+                f.write(orjson.dumps(o))
+            status, output = await kubectl_status_output(
+                'apply', '-f', f'{name}.json',
+                stderr=subprocess.STDOUT, cwd=tmpdir
+            )
+        return (status == 0), output
+
+    async def delete_tenant(self, name):
+        status, output = await kubectl_status_output(
+            'delete', TENANT_RESOURCE, name, '-n', config.NAMESPACE, '--wait=false',
+            stderr=subprocess.STDOUT
+        )
+        return (status == 0), output
+
+    async def list_tenant_names_page(self, limit, continue_token=None):
+        params = {'limit': str(limit)}
+        if continue_token:
+            params['continue'] = continue_token
+        status, output = await kubectl_status_output(
+            'get', '--raw', f'{tenants_path()}?{urlencode(params)}',
+            stderr=subprocess.STDOUT
+        )
+        if status != 0:
+            return False, output
+        data = orjson.loads(output)
+        return True, ([item['metadata']['name'] for item in data.get('items', [])], data['metadata'].get('continue') or None)
+
+    async def iter_tenant_names(self, continue_token=None):
+        if continue_token:
+            async for name in _iter_pages(self, continue_token):
+                yield name
+            return
+        # kubectl already fetches in chunks, a single process is cheaper than one per page
+        status, output = await kubectl_status_output(
+            'get', TENANT_RESOURCE, '-oname', '-n', config.NAMESPACE,
+            stderr=subprocess.STDOUT
+        )
+        if status != 0:
+            raise Exception(output)
+        for name in output.splitlines():
+            if name:
+                yield name.split('/', 1)[1]
+
+    async def iter_tenant_domains(self):
+        """yields tuple of (tenant name, domain names), kubectl extracts them so that only the names are parsed here"""
+        async for line in kubectl_iter_lines(
+            'get', TENANT_RESOURCE, '-n', config.NAMESPACE, f'--chunk-size={config.LIST_PAGE_SIZE}',
+            '-o', f'jsonpath={TENANT_DOMAINS_JSONPATH}'
+        ):
+            if line:
+                name, _, domains = line.partition('\t')
+                yield name, domains.split()
+
+    async def list_namespace_names(self):
+        return [
+            n.split('/', 1)[1]
+            for n in (await kubectl_check_output('get', 'ns', '-oname')).splitlines()
+            if n.startswith('namespace/')
+        ]
+
+    async def list_pods(self, namespace, label_selector=None):
+        output = await kubectl_check_output(
+            'get', 'pods', '-n', namespace, '--no-headers', '-o', f'custom-columns={POD_CUSTOM_COLUMNS}',
+            *(['-l', label_selector] if label_selector else [])
+        )
+        return [_pod_from_columns(*line.split()) for line in output.splitlines() if line.strip()]
+
+
+class KubeHttpBackend:
+    """kubernetes access from inside the process over a pooled keep-alive connection to the api server"""
+
+    name = 'http'
+
+    def __init__(self, server, token=None, token_file=None, verify=True, transport=None):
+        self.server = server.rstrip('/')
+        self.verify = verify
+        self.transport = transport
+        self._token = token
+        self._token_file = token_file
+        self._token_loaded_at = 0
+        self._client = None
+        self._client_loop = None
+
+    @property
+    def client(self):
+        # connections are bound to the event loop they were opened on
+        loop = asyncio.get_running_loop()
+        if self._client is not None and self._client_loop is not loop:
+            self._discard_client()
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.server,
+                verify=self.verify,
+                transport=self.transport,
+                timeout=httpx.Timeout(config.KUBE_API_TIMEOUT_SECONDS),
+                limits=httpx.Limits(
+                    max_connections=config.KUBE_API_MAX_CONNECTIONS,
+                    max_keepalive_connections=config.KUBE_API_MAX_CONNECTIONS,
+                ),
+            )
+            self._client_loop = loop
+        return self._client
+
+    def _discard_client(self):
+        """closes the client of a previous event loop on that loop if it is still open, otherwise only drops it"""
+        client, loop = self._client, self._client_loop
+        self._client = self._client_loop = None
+        if loop is not None and not loop.is_closed():
+            asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            self._client_loop = None
+
+    def _headers(self, accept=None):
+        if self._token_file and time.monotonic() - self._token_loaded_at > TOKEN_FILE_RELOAD_SECONDS:
+            # service account tokens are rotated by the kubelet
+            with open(self._token_file) as f:
+                self._token = f.read().strip()
+            self._token_loaded_at = time.monotonic()
+        headers = {'Accept': accept or 'application/json'}
+        if self._token:
+            headers['Authorization'] = f'Bearer {self._token}'
+        return headers
+
+    async def request(self, method, path, params=None, body=None, accept=None):
+        """returns tuple of (status_code, parsed json response)"""
+        headers = self._headers(accept)
+        content = None
+        if body is not None:
+            headers['Content-Type'] = 'application/json'
+            content = orjson.dumps(body)
+        with _observe_call('http', HTTP_VERBS.get(method, method.lower())) as call:
+            try:
+                response = await self.client.request(method, path, params=params, content=content, headers=headers)
+            except httpx.HTTPError as e:
+                # same failure shape as an api error response, callers return it as (False, message)
+                return 503, {
+                    'kind': 'Status', 'status': 'Failure', 'reason': 'ServiceUnavailable', 'code': 503,
+                    'message': f'Unable to connect to the server: {str(e) or type(e).__name__}',
+                }
+            call['status'] = response.status_code
+        try:
+            data = orjson.loads(response.content)
+        except orjson.JSONDecodeError:
+            data = response.text
+        return response.status_code, data
+
+    async def request_check(self, method, path, params=None, body=None, accept=None):
+        status_code, data = await self.request(method, path, params=params, body=body, accept=accept)
+        if status_code >= 300:
+            raise Exception(status_message(status_code, data))
+        return data
+
+    async def watch(self, path, resource_version=None, timeout_seconds=None, params=None, accept=None):
+        """yields watch events of the collection at path, until the server closes the watch after timeout_seconds"""
+        params = {**(params or {}), 'watch': 'true', 'allowWatchBookmarks': 'true'}
+        if resource_version:
+            params['resourceVersion'] = resource_version
+        if timeout_seconds:
+            params['timeoutSeconds'] = str(int(timeout_seconds))
+        timeout = httpx.Timeout(
+            config.KUBE_API_TIMEOUT_SECONDS,
+            read=timeout_seconds + config.KUBE_API_TIMEOUT_SECONDS if timeout_seconds else None,
+        )
+        async with self.client.stream('GET', path, params=params, headers=self._headers(accept), timeout=timeout) as response:
+            if response.status_code != 200:
+                await response.aread()
+                if response.status_code == 410:
+                    raise ResourceVersionExpired(response.text)
+                raise Exception(status_message(response.status_code, orjson.loads(response.content)))
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                event = orjson.loads(line)
+                if event['type'] == 'ERROR':
+                    if event['object'].get('code') == 410:
+                        raise ResourceVersionExpired(event['object'].get('message'))
+                    raise Exception(status_message(event['object'].get('code'), event['object']))
+                yield event
+
+    async def get_tenant(self, name):
+        status_code, data = await self.request('GET', tenants_path(name))
+        return (True, data) if status_code == 200 else (False, status_message(status_code, data))
+
+    async def apply_tenant(self, o):
+        """same semantics as kubectl apply of a complete object: create it or replace its spec"""
+        name = o['metadata']['name']
+        last_applied = orjson.dumps(o, option=orjson.OPT_SORT_KEYS).decode()
+        for _ in range(3):
+            status_code, current = await self.request('GET', tenants_path(name))
+            if status_code == 404:
+                status_code, data = await self.request('POST', tenants_path(), body={
+                    **o,
+                    'metadata': {
+                        **o['metadata'],
+                        'annotations': {**o['metadata'].get('annotations', {}), LAST_APPLIED_ANNOTATION: last_applied},
+                    },
+                })
+                if status_code in (200, 201):
+                    return True, f'{TENANT_RESOURCE}/{name} created'
+            elif status_code == 200:
+                metadata = current['metadata']
+                annotations = metadata.get('annotations') or {}
+                if is_unchanged(current, o) or (annotations.get(LAST_APPLIED_ANNOTATION) == last_applied and current.get('spec') == o['spec']):
+                    return True, unchanged_message(name)
+                status_code, data = await self.request('PUT', tenants_path(name), body={
+                    **o,
+                    'metadata': {
+                        **metadata,
+                        'labels': {**(metadata.get('labels') or {}), **o['metadata'].get('labels', {})},
+                        'annotations': {**annotations, **o['metadata'].get('annotations', {}), LAST_APPLIED_ANNOTATION: last_applied},
+                    },
+                })
+                if status_code == 200:
+                    return True, f'{TENANT_RESOURCE}/{name} configured'
+            else:
+                return False, status_message(status_code, current)
+            if status_code != 409:
+                return False, status_message(status_code, data)
+        return False, status_message(status_code, data)
+
+    async def delete_tenant(self, name):
+        status_code, data = await self.request('DELETE', tenants_path(name), body={'propagationPolicy': 'Background'})
+        if status_code in (200, 202):
+            return True, f'{TENANT_RESOURCE} "{name}" deleted'
+        return False, status_message(status_code, data)
+
+    async def list_tenant_names_page(self, limit, continue_token=None):
+        params = {'limit': str(limit)}
+        if continue_token:
+            params['continue'] = continue_token
+        status_code, data = await self.request('GET', tenants_path(), params=params, accept=METADATA_ONLY_ACCEPT)
+        if status_code != 200:
+            return False, status_message(status_code, data)
+        return True, ([item['metadata']['name'] for item in data.get('items', [])], data['metadata'].get('continue') or None)
+
+    async def iter_tenant_names(self, continue_token=None):
+        async for name in _iter_pages(self, continue_token):
+            yield name
+
+    async def iter_tenant_domains(self):
+        """yields tuple of (tenant name, domain names), listed in pages so that only a page of tenants is held at once"""
+        params = {'limit': str(config.LIST_PAGE_SIZE)}
+        while True:
+            data = await self.request_check('GET', tenants_path(), params=params)
+            for item in data.get('items', []):
+                yield item['metadata']['name'], [domain['name'] for domain in item['spec'].get('domains', [])]
+            if not data['metadata'].get('continue'):
+                break
+            params['continue'] = data['metadata']['continue']
+
+    async def list_namespace_names(self):
+        data = await self.request_check('GET', '/api/v1/namespaces', accept=METADATA_ONLY_ACCEPT)
+        return [item['metadata']['name'] for item in data.get('items', [])]
+
+    async def list_pods(self, namespace, label_selector=None):
+        # the api server can't project spec / status fields, keep only what callers need as soon as it's parsed
+        params = {'labelSelector': label_selector} if label_selector else None
+        return [
+            _pod_from_columns(
+                pod['metadata']['name'],
+                pod['metadata']['creationTimestamp'],
+                (pod['spec']['containers'] or [{}])[0].get('image', ''),
+                pod.get('status', {}).get('phase', ''),
+            )
+            for pod in (await self.request_check('GET', f'/api/v1/namespaces/{namespace}/pods', params=params)).get('items', [])
+        ]
+
+
+def create_backend(backend_name):
+    if backend_name == 'kubectl':
+        return KubectlBackend()
+    if backend_name == 'http':
+        return KubeHttpBackend(**load_config())
+    if backend_name == 'auto':
+        try:
+            return KubeHttpBackend(**load_config())
+        except KubeConfigError as e:
+            logging.info(f'Using kubectl backend, in-process kubernetes client is not available: {e}')
+            return KubectlBackend()
+    raise ValueError(f'Invalid KUBE_BACKEND: {backend_name}')
+
+
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        _backend = create_backend(config.KUBE_BACKEND)
+    return _backend
+
+
+def set_backend(backend):
+    global _backend
+    _backend = backend
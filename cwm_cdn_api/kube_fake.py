@@ -0,0 +1,390 @@
+import copy
+import uuid
+import base64
+import bisect
+import socket
+import asyncio
+import contextlib
+from datetime import datetime, timezone
+
+import orjson
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Route
+
+from . import kube
+
+
+KINDS = {
+    'namespaces': 'Namespace',
+    'pods': 'Pod',
+    'services': 'Service',
+    'endpointslices': 'EndpointSlice',
+    kube.TENANT_PLURAL: 'CdnTenant',
+    'leases': 'Lease',
+}
+
+
+def _now():
+    return datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def _parse_path(path):
+    """returns tuple of (api, namespace, plural, name) for a kubernetes api resource path"""
+    parts = path.strip('/').split('/')
+    if parts[0] == 'api' and len(parts) >= 3:
+        api, rest = '/'.join(parts[:2]), parts[2:]
+    elif parts[0] == 'apis' and len(parts) >= 4:
+        api, rest = '/'.join(parts[:3]), parts[3:]
+    else:
+        return None
+    namespace = None
+    if len(rest) >= 3 and rest[0] == 'namespaces':
+        namespace, rest = rest[1], rest[2:]
+    if len(rest) > 2:
+        return None
+    return api, namespace, rest[0], (rest[1] if len(rest) > 1 else None)
+
+
+def _status(code, reason, message):
+    return Response(orjson.dumps({
+        'kind': 'Status',
+        'apiVersion': 'v1',
+        'metadata': {},
+        'status': 'Failure',
+        'message': message,
+        'reason': reason,
+        'code': code,
+    }), status_code=code, media_type='application/json')
+
+
+def _json(data, status_code=200):
+    return Response(orjson.dumps(data), status_code=status_code, media_type='application/json')
+
+
+def _merge_patch(target, patch):
+    if not isinstance(patch, dict):
+        return patch
+    target = dict(target) if isinstance(target, dict) else {}
+    for k, v in patch.items():
+        if v is None:
+            target.pop(k, None)
+        else:
+            target[k] = _merge_patch(target.get(k), v)
+    return target
+
+
+def _match_selector(labels, selector):
+    for requirement in [r for r in (selector or '').split(',') if r]:
+        if '!=' in requirement:
+            k, v = requirement.split('!=', 1)
+            if labels.get(k) == v:
+                return False
+        elif '=' in requirement:
+            k, v = requirement.replace('==', '=').split('=', 1)
+            if labels.get(k) != v:
+                return False
+        elif labels.get(requirement) is None:
+            return False
+    return True
+
+
+def _match_field_selector(obj, selector):
+    metadata = obj['metadata']
+    fields = {'metadata.name': metadata['name'], 'metadata.namespace': metadata.get('namespace', '')}
+    for requirement in [r for r in (selector or '').split(',') if r]:
+        if '!=' in requirement:
+            k, v = requirement.split('!=', 1)
+            if fields.get(k) == v:
+                return False
+        else:
+            k, v = requirement.replace('==', '=').split('=', 1)
+            if fields.get(k) != v:
+                return False
+    return True
+
+
+class FakeKubeApi:
+    """in-memory kubernetes api server, supports the subset of the api used by cwm-cdn-api, for tests and benchmarks"""
+
+    def __init__(self, max_events=10000, bookmark_interval_seconds=60):
+        self.objects = {}  # (api, plural) -> {(namespace, name): object}
+        self.resource_version = 0
+        self.requests = []  # (method, path) of all requests, for asserting api usage in tests
+        self.url = None
+        self.events = []  # (resource_version, api, plural, event type, object) ordered by resource_version
+        self.max_events = max_events
+        self.compacted_resource_version = 0
+        self.bookmark_interval_seconds = bookmark_interval_seconds
+        self.closed = False
+        self._changed = None
+
+    def _resource_name(self, api, plural):
+        group = api.split('/')[1] if api.startswith('apis/') else ''
+        return f'{plural}.{group}' if group else plural
+
+    def _next_resource_version(self):
+        self.resource_version += 1
+        return str(self.resource_version)
+
+    def _record(self, api, plural, event_type, obj):
+        self.events.append((int(obj['metadata']['resourceVersion']), api, plural, event_type, obj))
+        if len(self.events) > self.max_events:
+            self.compact(self.events[len(self.events) - self.max_events][0] - 1)
+        self._notify()
+
+    def _notify(self):
+        if self._changed is not None:
+            self._changed.set()
+            self._changed = None
+
+    async def _wait_change(self, timeout):
+        if self._changed is None:
+            self._changed = asyncio.Event()
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def compact(self, resource_version=None):
+        """drops watch events up to resource_version (default all), watches from older versions get 410 Expired"""
+        resource_version = self.resource_version if resource_version is None else resource_version
+        del self.events[:bisect.bisect_right(self.events, resource_version, key=lambda e: e[0])]
+        self.compacted_resource_version = max(self.compacted_resource_version, resource_version)
+
+    def close(self):
+        self.closed = True
+        self._notify()
+
+    def create(self, api, plural, obj, namespace=None):
+        obj = copy.deepcopy(obj)
+        metadata = obj.setdefault('metadata', {})
+        if namespace:
+            metadata['namespace'] = namespace
+        metadata.update({
+            'uid': str(uuid.uuid4()),
+            'creationTimestamp': _now(),
+            'generation': 1,
+            'resourceVersion': self._next_resource_version(),
+        })
+        self.objects.setdefault((api, plural), {})[(metadata.get('namespace'), metadata['name'])] = obj
+        self._record(api, plural, 'ADDED', obj)
+        return obj
+
+    def replace(self, api, plural, obj, namespace=None):
+        obj = copy.deepcopy(obj)
+        metadata = obj['metadata']
+        key = (namespace or metadata.get('namespace'), metadata['name'])
+        current = self.objects[(api, plural)][key]
+        if 'status' in current:
+            obj['status'] = current['status']
+        metadata.update({
+            'uid': current['metadata']['uid'],
+            'creationTimestamp': current['metadata']['creationTimestamp'],
+            'generation': current['metadata']['generation'] + (1 if obj.get('spec') != current.get('spec') else 0),
+            'resourceVersion': self._next_resource_version(),
+        })
+        if namespace:
+            metadata['namespace'] = namespace
+        self.objects[(api, plural)][key] = obj
+        self._record(api, plural, 'MODIFIED', obj)
+        return obj
+
+    def remove(self, api, plural, name, namespace=None):
+        obj = self.objects.get((api, plural), {}).pop((namespace, name))
+        obj = {**obj, 'metadata': {**obj['metadata'], 'resourceVersion': self._next_resource_version()}}
+        self._record(api, plural, 'DELETED', obj)
+        return obj
+
+    def get(self, api, plural, name, namespace=None):
+        return self.objects.get((api, plural), {}).get((namespace, name))
+
+    def list(self, api, plural, namespace=None, label_selector=None, field_selector=None):
+        return [
+            obj for (ns, _), obj in sorted(self.objects.get((api, plural), {}).items(), key=lambda i: (i[0][0] or '', i[0][1]))
+            if (namespace is None or ns == namespace)
+            and _match_selector(obj['metadata'].get('labels') or {}, label_selector)
+            and _match_field_selector(obj, field_selector)
+        ]
+
+    def add_tenant(self, name, spec, status=None, namespace='default'):
+        obj = self.create(f'apis/{kube.TENANT_API_VERSION}', kube.TENANT_PLURAL, {
+            'apiVersion': kube.TENANT_API_VERSION,
+            'kind': 'CdnTenant',
+            'metadata': {'name': name},
+            'spec': spec,
+        }, namespace=namespace)
+        if status is not None:
+            self.set_tenant_status(name, status, namespace=namespace)
+        return obj
+
+    def set_tenant_status(self, name, status, namespace='default'):
+        obj = copy.deepcopy(self.get(f'apis/{kube.TENANT_API_VERSION}', kube.TENANT_PLURAL, name, namespace))
+        obj['metadata']['resourceVersion'] = self._next_resource_version()
+        obj['status'] = status
+        self.objects[(f'apis/{kube.TENANT_API_VERSION}', kube.TENANT_PLURAL)][(namespace, name)] = obj
+        self._record(f'apis/{kube.TENANT_API_VERSION}', kube.TENANT_PLURAL, 'MODIFIED', obj)
+        return obj
+
+    def add_namespace(self, name):
+        return self.create('api/v1', 'namespaces', {'apiVersion': 'v1', 'kind': 'Namespace', 'metadata': {'name': name}})
+
+    def add_pod(self, namespace, name, image, phase='Running', labels=None):
+        return self.create('api/v1', 'pods', {
+            'apiVersion': 'v1',
+            'kind': 'Pod',
+            'metadata': {'name': name, 'labels': labels or {}},
+            'spec': {'containers': [{'name': 'main', 'image': image}]},
+            'status': {'phase': phase},
+        }, namespace=namespace)
+
+    def _metadata_only(self, request, items):
+        if 'as=PartialObjectMetadata' not in request.headers.get('accept', ''):
+            return items
+        return [
+            {'apiVersion': 'meta.k8s.io/v1', 'kind': 'PartialObjectMetadata', 'metadata': item['metadata']}
+            for item in items
+        ]
+
+    def _watch_response(self, request, api, plural, namespace):
+        params = request.query_params
+        label_selector, field_selector = params.get('labelSelector'), params.get('fieldSelector')
+        timeout_seconds = float(params.get('timeoutSeconds') or 1800)
+        bookmarks = params.get('allowWatchBookmarks') == 'true'
+
+        def _matches(event_api, event_plural, obj):
+            return (
+                event_api == api and event_plural == plural
+                and (namespace is None or obj['metadata'].get('namespace') == namespace)
+                and _match_selector(obj['metadata'].get('labels') or {}, label_selector)
+                and _match_field_selector(obj, field_selector)
+            )
+
+        def _event(event_type, obj):
+            return orjson.dumps({'type': event_type, 'object': self._metadata_only(request, [obj])[0]}) + b'\n'
+
+        async def _stream():
+            resource_version = params.get('resourceVersion') or '0'
+            if resource_version == '0':
+                resource_version = self.resource_version
+                for obj in self.list(api, plural, namespace, label_selector, field_selector):
+                    yield _event('ADDED', obj)
+            else:
+                resource_version = int(resource_version)
+                if resource_version < self.compacted_resource_version:
+                    yield orjson.dumps({'type': 'ERROR', 'object': {
+                        'kind': 'Status', 'apiVersion': 'v1', 'status': 'Failure', 'reason': 'Expired', 'code': 410,
+                        'message': f'too old resource version: {resource_version} ({self.compacted_resource_version})',
+                    }}) + b'\n'
+                    return
+            deadline = asyncio.get_running_loop().time() + timeout_seconds
+            while not self.closed:
+                start = bisect.bisect_right(self.events, resource_version, key=lambda e: e[0])
+                for event_resource_version, event_api, event_plural, event_type, obj in self.events[start:]:
+                    resource_version = event_resource_version
+                    if _matches(event_api, event_plural, obj):
+                        yield _event(event_type, obj)
+                remaining = deadline - asyncio.get_running_loop().time()
+                if remaining <= 0:
+                    break
+                if not await self._wait_change(min(remaining, self.bookmark_interval_seconds)) and bookmarks:
+                    yield _event('BOOKMARK', {'metadata': {'resourceVersion': str(self.resource_version)}})
+
+        return StreamingResponse(_stream(), media_type='application/json')
+
+    def _list_response(self, request, api, plural, items):
+        metadata_only = 'as=PartialObjectMetadataList' in request.headers.get('accept', '')
+        metadata = {'resourceVersion': str(self.resource_version)}
+        limit = int(request.query_params.get('limit') or 0)
+        continue_token = request.query_params.get('continue')
+        if continue_token:
+            token = orjson.loads(base64.b64decode(continue_token))
+            if token['rv'] < self.compacted_resource_version:
+                return _status(410, 'Expired', 'The provided continue parameter is too old to display a consistent list result.')
+            start = tuple(token['start'])
+            items = [item for item in items if (item['metadata'].get('namespace') or '', item['metadata']['name']) > start]
+            metadata['resourceVersion'] = str(token['rv'])
+        if limit and len(items) > limit:
+            last = items[limit - 1]['metadata']
+            metadata['continue'] = base64.b64encode(orjson.dumps({
+                'rv': int(metadata['resourceVersion']),
+                'start': [last.get('namespace') or '', last['name']],
+            })).decode()
+            metadata['remainingItemCount'] = len(items) - limit
+            items = items[:limit]
+        return _json({
+            'apiVersion': 'meta.k8s.io/v1' if metadata_only else api.split('/', 1)[1],
+            'kind': 'PartialObjectMetadataList' if metadata_only else f'{KINDS.get(plural, "Object")}List',
+            'metadata': metadata,
+            'items': self._metadata_only(request, items),
+        })
+
+    async def handle(self, request: Request):
+        self.requests.append((request.method, request.url.path))
+        parsed = _parse_path(request.url.path)
+        if parsed is None:
+            return _status(404, 'NotFound', 'the server could not find the requested resource')
+        api, namespace, plural, name = parsed
+        resource_name = self._resource_name(api, plural)
+        if request.method == 'GET' and name is None and request.query_params.get('watch') in ('true', '1'):
+            return self._watch_response(request, api, plural, namespace)
+        if request.method == 'GET' and name is None:
+            return self._list_response(request, api, plural, self.list(
+                api, plural, namespace,
+                label_selector=request.query_params.get('labelSelector'),
+                field_selector=request.query_params.get('fieldSelector'),
+            ))
+        current = self.get(api, plural, name, namespace) if name else None
+        if request.method == 'GET':
+            if current is None:
+                return _status(404, 'NotFound', f'{resource_name} "{name}" not found')
+            return _json(current)
+        if request.method == 'POST':
+            obj = orjson.loads(await request.body())
+            if self.get(api, plural, obj['metadata']['name'], namespace) is not None:
+                return _status(409, 'AlreadyExists', f'{resource_name} "{obj["metadata"]["name"]}" already exists')
+            return _json(self.create(api, plural, obj, namespace), 201)
+        if current is None:
+            return _status(404, 'NotFound', f'{resource_name} "{name}" not found')
+        if request.method == 'PUT':
+            obj = orjson.loads(await request.body())
+            resource_version = obj['metadata'].get('resourceVersion')
+            if resource_version and resource_version != current['metadata']['resourceVersion']:
+                return _status(409, 'Conflict', f'Operation cannot be fulfilled on {resource_name} "{name}": the object has been modified; please apply your changes to the latest version and try again')
+            return _json(self.replace(api, plural, obj, namespace))
+        if request.method == 'PATCH':
+            return _json(self.replace(api, plural, _merge_patch(current, orjson.loads(await request.body())), namespace))
+        if request.method == 'DELETE':
+            return _json(self.remove(api, plural, name, namespace))
+        return _status(405, 'MethodNotAllowed', f'{request.method} is not supported')
+
+    def app(self):
+        return Starlette(routes=[
+            Route('/{path:path}', self.handle, methods=['GET', 'POST', 'PUT', 'PATCH', 'DELETE']),
+        ])
+
+
+@contextlib.asynccontextmanager
+async def serve(api=None, host='127.0.0.1', port=0):
+    """runs the fake api server in the current event loop, yields the FakeKubeApi with url set"""
+    api = api or FakeKubeApi()
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM, socket.IPPROTO_TCP)  # asyncio only sets TCP_NODELAY with explicit proto
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    server = uvicorn.Server(uvicorn.Config(api.app(), log_level='warning', lifespan='off'))
+    task = asyncio.create_task(server.serve(sockets=[sock]))
+    while not server.started:
+        if task.done():
+            task.result()
+        await asyncio.sleep(0.01)
+    api.url = f'http://{host}:{sock.getsockname()[1]}'
+    try:
+        yield api
+    finally:
+        api.close()
+        server.should_exit = True
+        await task
+        sock.close()
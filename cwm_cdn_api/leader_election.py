@@ -0,0 +1,144 @@
+import uuid
+import time
+import socket
+import asyncio
+import logging
+from datetime import datetime, timezone
+
+from . import config, kube
+
+
+LEASES_API = '/apis/coordination.k8s.io/v1'
+
+
+def _micro_time():
+    return datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+
+def default_identity():
+    return f'{socket.gethostname()}_{uuid.uuid4().hex[:8]}'
+
+
+class LeaderElector:
+    """leader election on a coordination.k8s.io/v1 Lease, like the client-go leaderelection package
+
+    the lease expiry is judged by the local time the lease was last seen changing, not by its renewTime, so that
+    clock skew between replicas doesn't matter. a leader which could not renew for renew_deadline_seconds stops
+    leading, before lease_seconds pass and another replica may take over
+    """
+
+    def __init__(self, lease_name, identity=None, backend=None, lease_seconds=None, renew_deadline_seconds=None, retry_seconds=None):
+        self.lease_name = lease_name
+        self.identity = identity or default_identity()
+        self.backend = backend
+        self.lease_seconds = config.ZONE_WRITER_LEASE_SECONDS if lease_seconds is None else lease_seconds
+        self.renew_deadline_seconds = config.ZONE_WRITER_LEASE_RENEW_DEADLINE_SECONDS if renew_deadline_seconds is None else renew_deadline_seconds
+        self.retry_seconds = config.ZONE_WRITER_LEASE_RETRY_SECONDS if retry_seconds is None else retry_seconds
+        self.leading = asyncio.Event()
+        self.not_leading = asyncio.Event()
+        self.not_leading.set()
+        self._observed_resource_version = None
+        self._observed_time = None
+        self._last_renew_time = None
+
+    @property
+    def is_leader(self):
+        return self.leading.is_set()
+
+    def _path(self, name=None):
+        path = f'{LEASES_API}/namespaces/{config.NAMESPACE}/leases'
+        return f'{path}/{name}' if name else path
+
+    def _observe(self, lease):
+        if lease['metadata']['resourceVersion'] != self._observed_resource_version:
+            self._observed_resource_version = lease['metadata']['resourceVersion']
+            self._observed_time = time.monotonic()
+
+    async def try_acquire_or_renew(self):
+        """returns true if this replica holds the lease, false if another replica does"""
+        now = _micro_time()
+        status_code, lease = await self.backend.request('GET', self._path(self.lease_name))
+        if status_code == 404:
+            lease = {
+                'apiVersion': 'coordination.k8s.io/v1',
+                'kind': 'Lease',
+                'metadata': {'name': self.lease_name, 'namespace': config.NAMESPACE},
+                'spec': {
+                    'holderIdentity': self.identity,
+                    'leaseDurationSeconds': int(self.lease_seconds),
+                    'acquireTime': now,
+                    'renewTime': now,
+                    'leaseTransitions': 0,
+                },
+            }
+            status_code, data = await self.backend.request('POST', self._path(), body=lease)
+            if status_code == 409:
+                return False
+            if status_code != 201:
+                raise Exception(kube.status_message(status_code, data))
+            self._observe(data)
+            return True
+        if status_code != 200:
+            raise Exception(kube.status_message(status_code, lease))
+        self._observe(lease)
+        spec = lease.setdefault('spec', {})
+        holder = spec.get('holderIdentity')
+        if holder and holder != self.identity and (
+            time.monotonic() < self._observed_time + spec.get('leaseDurationSeconds', self.lease_seconds)
+        ):
+            return False
+        if holder != self.identity:
+            spec['acquireTime'] = now
+            spec['leaseTransitions'] = spec.get('leaseTransitions', 0) + 1
+        spec.update({'holderIdentity': self.identity, 'leaseDurationSeconds': int(self.lease_seconds), 'renewTime': now})
+        # the resourceVersion in the body makes this fail with a conflict if another replica updated the lease
+        status_code, data = await self.backend.request('PUT', self._path(self.lease_name), body=lease)
+        if status_code == 409:
+            return False
+        if status_code != 200:
+            raise Exception(kube.status_message(status_code, data))
+        self._observe(data)
+        return True
+
+    def _set_leading(self, leading):
+        if leading == self.is_leader:
+            return
+        if leading:
+            logging.info(f'{self.identity} is now the leader of lease {self.lease_name}')
+            self.not_leading.clear()
+            self.leading.set()
+        else:
+            logging.warning(f'{self.identity} stopped leading lease {self.lease_name}')
+            self.leading.clear()
+            self.not_leading.set()
+
+    async def run(self):
+        self.backend = self.backend or kube.get_backend()
+        while True:
+            try:
+                async with asyncio.timeout(self.renew_deadline_seconds):
+                    acquired = await self.try_acquire_or_renew()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logging.exception(f'failed to acquire or renew lease {self.lease_name}')
+                acquired = None
+            if acquired:
+                self._last_renew_time = time.monotonic()
+                self._set_leading(True)
+            elif acquired is False or (
+                self._last_renew_time is None or time.monotonic() - self._last_renew_time > self.renew_deadline_seconds
+            ):
+                self._set_leading(False)
+            await asyncio.sleep(self.retry_seconds)
+
+    async def release(self):
+        """gives up the lease if held, so that another replica can take over without waiting for it to expire"""
+        if not self.is_leader:
+            return
+        self._set_leading(False)
+        status_code, lease = await self.backend.request('GET', self._path(self.lease_name))
+        if status_code != 200 or lease.get('spec', {}).get('holderIdentity') != self.identity:
+            return
+        lease['spec'].update({'holderIdentity': '', 'leaseDurationSeconds': 1, 'renewTime': _micro_time()})
+        await self.backend.request('PUT', self._path(self.lease_name), body=lease)
@@ -22,7 +22,7 @@ def _request_api(method, path, **kwargs):
     return requests.request(
         method,
         f"{config.CWM_CDN_API_URL}/{path.lstrip('/')}",
-        timeout=30,
+        timeout=kwargs.pop("timeout", 30),
         auth=_api_auth(),
         verify=config.CWM_CDN_API_VERIFY_TLS,
         **kwargs,
@@ -142,9 +142,22 @@ class LoadTestState:
     def wait_tenant_ready(self, tenant):
         deadline = time.monotonic() + config.CWM_CDN_TENANT_READY_TIMEOUT_SECONDS
         last_error = None
+        long_poll = True
         while time.monotonic() < deadline:
+            timed_out_waiting = False
             try:
-                res = _request_api("GET", "get", params={"cdn_tenant_name": tenant["name"]})
+                if long_poll:
+                    # the server holds the request until the tenant conditions settle
+                    wait_seconds = max(1, min(60, int(deadline - time.monotonic())))
+                    res = _request_api(
+                        "GET", "wait-ready", params={"cdn_tenant_name": tenant["name"], "timeout": wait_seconds},
+                        timeout=wait_seconds + 30,
+                    )
+                    if res.status_code == 404:
+                        long_poll = False
+                        continue
+                else:
+                    res = _request_api("GET", "get", params={"cdn_tenant_name": tenant["name"]})
                 if res.status_code == 200:
                     data = res.json()
                     self.debug("Tenant: %s", data)
@@ -152,11 +165,14 @@ class LoadTestState:
                         self.debug("CDN tenant %s is ready", tenant["name"])
                         return
                     last_error = data
+                    timed_out_waiting = long_poll and not data.get("settled")
                 else:
                     last_error = f"{res.status_code} {res.text}"
             except Exception as exc:
                 last_error = str(exc)
-            time.sleep(config.CWM_CDN_TENANT_READY_POLL_SECONDS)
+            if not timed_out_waiting:
+                # settled but not ready, or an error, the tenant may still recover
+                time.sleep(config.CWM_CDN_TENANT_READY_POLL_SECONDS)
         raise RuntimeError(f"Timed out waiting for CDN tenant {tenant['name']} to become ready: {last_error}")
 
     def delete_tenant(self, tenant):
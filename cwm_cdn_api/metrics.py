@@ -0,0 +1,100 @@
+import os
+
+import prometheus_client
+from prometheus_client import Counter, Gauge, Histogram, multiprocess
+
+
+# gauges set the multiprocess_mode used to aggregate the values of all gunicorn workers
+# when PROMETHEUS_MULTIPROC_DIR is set, it has no effect in a single process
+
+
+INFORMER_LAST_SYNC = Gauge(
+    'cwm_cdn_api_informer_last_sync_timestamp_seconds',
+    'Unix time of the last list, watch event or bookmark received by the informer, staleness is time() minus this',
+    ['informer'],
+    multiprocess_mode='livemin',
+)
+INFORMER_OBJECTS = Gauge(
+    'cwm_cdn_api_informer_objects',
+    'Number of objects held by the informer',
+    ['informer'],
+    multiprocess_mode='livemax',
+)
+INFORMER_RESYNCS = Counter(
+    'cwm_cdn_api_informer_resyncs_total',
+    'Number of full lists done by the informer',
+    ['informer', 'reason'],
+)
+INFORMER_EVENTS = Counter(
+    'cwm_cdn_api_informer_events_total',
+    'Number of watch events received by the informer',
+    ['informer', 'type'],
+)
+LIMITER_IN_FLIGHT = Gauge(
+    'cwm_cdn_api_limiter_in_flight',
+    'Number of operations currently holding a concurrency limiter slot',
+    ['limiter'],
+    multiprocess_mode='livesum',
+)
+LIMITER_QUEUE_DEPTH = Gauge(
+    'cwm_cdn_api_limiter_queue_depth',
+    'Number of operations waiting for a concurrency limiter slot',
+    ['limiter'],
+    multiprocess_mode='livesum',
+)
+LIMITER_WAIT_SECONDS = Histogram(
+    'cwm_cdn_api_limiter_wait_seconds',
+    'Time spent waiting for a concurrency limiter slot',
+    ['limiter'],
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+LIMITER_REJECTED = Counter(
+    'cwm_cdn_api_limiter_rejected_total',
+    'Number of operations rejected because the concurrency limiter queue was full',
+    ['limiter'],
+)
+HTTP_REQUEST_DURATION = Histogram(
+    'cwm_cdn_api_http_request_duration_seconds',
+    'Time to handle an http request, until the response was fully sent',
+    ['method', 'route', 'status'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+HTTP_REQUESTS_IN_FLIGHT = Gauge(
+    'cwm_cdn_api_http_requests_in_flight',
+    'Number of http requests currently being handled',
+    ['method'],
+    multiprocess_mode='livesum',
+)
+KUBE_CALL_DURATION = Histogram(
+    'cwm_cdn_api_kube_call_duration_seconds',
+    'Duration of kubectl processes or kubernetes api requests',
+    ['backend', 'verb'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+KUBE_CALLS = Counter(
+    'cwm_cdn_api_kube_calls_total',
+    'Number of kubectl processes or kubernetes api requests, status is the kubectl exit status or the http status code',
+    ['backend', 'verb', 'status'],
+)
+KUBE_CALLS_IN_FLIGHT = Gauge(
+    'cwm_cdn_api_kube_calls_in_flight',
+    'Number of kubectl processes or kubernetes api requests currently running',
+    ['backend'],
+    multiprocess_mode='livesum',
+)
+VALIDATION_DURATION = Histogram(
+    'cwm_cdn_api_validation_duration_seconds',
+    'Time spent validating tenant names against the reserved names (step=name) and tenant specs (step=spec)',
+    ['step'],
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1),
+)
+
+
+def generate_latest():
+    """returns the metrics exposition, aggregated from all worker processes in multiprocess mode"""
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        registry = prometheus_client.CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = prometheus_client.REGISTRY
+    return prometheus_client.generate_latest(registry)
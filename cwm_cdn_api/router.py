@@ -1,14 +1,31 @@
+import asyncio
 import logging
+import contextlib
 
-from fastapi import APIRouter, Body
-from fastapi.responses import ORJSONResponse
+import orjson
+from fastapi import APIRouter, Body, Header, Query
+from fastapi.responses import ORJSONResponse, StreamingResponse, Response
+from prometheus_client import CONTENT_TYPE_LATEST
 
-from . import api
+from . import api, informer, config, metrics
 
 
 router = APIRouter()
 
 
+def _etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    # weak comparison, as done for If-None-Match
+    return etag.removeprefix('W/') in (tag.strip().removeprefix('W/') for tag in if_none_match.split(','))
+
+
+def _not_modified(etag):
+    return Response(status_code=304, headers={"ETag": etag})
+
+
 @router.get("/", include_in_schema=False)
 async def root():
     logging.debug('Root endpoint called')
@@ -44,9 +61,10 @@ async def apply(
                 "url": "http://example.com",
             }
         ]
-    })
+    }),
+    consistent: bool = Query(False, description="Compare the spec with the api server instead of the cache before applying"),
 ):
-    success, output = await api.apply(cdn_tenant_name, cdn_tenant_spec)
+    success, output = await api.apply(cdn_tenant_name, cdn_tenant_spec, consistent)
     return ORJSONResponse(
         status_code=200 if success else 400,
         content={
@@ -56,9 +74,46 @@ async def apply(
     )
 
 
+@router.post("/apply-bulk")
+async def apply_bulk(
+    items: list[dict] = Body(..., example=[
+        {
+            "name": "tenant1",
+            "spec": {
+                "domains": [
+                    {
+                        "name": "tenant1.example.com",
+                        "tls": {"mode": "letsencrypt"},
+                    }
+                ],
+                "origins": [{"url": "http://example.com"}],
+            },
+        },
+    ])
+):
+    if len(items) > config.APPLY_BULK_MAX_ITEMS:
+        return ORJSONResponse(
+            status_code=400,
+            content={
+                "success": False,
+                "results": [],
+                "msg": f"Too many items, maximum is {config.APPLY_BULK_MAX_ITEMS}",
+            }
+        )
+    results = await api.apply_bulk(items)
+    return ORJSONResponse(
+        status_code=200,
+        content={
+            "success": all(result["success"] for result in results),
+            "results": results,
+            "msg": None,
+        }
+    )
+
+
 @router.get("/debug/certificates")
-async def debug_certificates(cdn_tenant_name: str, primary_key: str):
-    success, output = await api.debug_certificates(cdn_tenant_name, primary_key)
+async def debug_certificates(cdn_tenant_name: str, primary_key: str, consistent: bool = False):
+    success, output = await api.debug_certificates(cdn_tenant_name, primary_key, consistent)
     return ORJSONResponse(
         status_code=200 if success else 403,
         content={
@@ -82,21 +137,115 @@ async def delete(cdn_tenant_name: str, primary_key: str = ""):
 
 
 @router.get("/get")
-async def get(cdn_tenant_name: str):
-    success, output = await api.get(cdn_tenant_name)
+async def get(
+    cdn_tenant_name: str,
+    consistent: bool = False,
+    fields: str = Query(None, description="Comma separated tenant fields to return, e.g. ready,domains.name"),
+    if_none_match: str = Header(None),
+):
+    if fields is not None:
+        success, fields = api.parse_fields(fields)
+        if not success:
+            return ORJSONResponse(status_code=400, content={"success": False, "tenant": None, "msg": fields})
+    success, output = await api.get_tenant(cdn_tenant_name, consistent)
+    if not success:
+        return ORJSONResponse(status_code=400, content={"success": False, "tenant": None, "msg": output})
+    etag = api.tenant_etag(output, fields)
+    if _etag_matches(if_none_match, etag):
+        return _not_modified(etag)
+    return ORJSONResponse(
+        headers={"ETag": etag},
+        content={
+            "success": True,
+            "tenant": api.tenant_view(output, fields),
+            "msg": None,
+        }
+    )
+
+
+@router.get("/wait-ready")
+async def wait_ready(
+    cdn_tenant_name: str,
+    timeout: float = Query(30, gt=0, le=config.WAIT_READY_MAX_TIMEOUT_SECONDS, description="Seconds to wait for the tenant to settle"),
+):
+    success, output, settled = await api.wait_settled(cdn_tenant_name, timeout)
     return ORJSONResponse(
         status_code=200 if success else 400,
         content={
             "success": success,
-            "tenant": output if success else None,
-            "msg": None if success else output
+            "settled": settled,
+            "tenant": api.tenant_view(output) if success else None,
+            "msg": None if success else output,
         }
     )
 
 
+async def _sse_tenant_status_events(names):
+    updates = api.tenant_status_events(names)
+    next_update = asyncio.ensure_future(anext(updates))
+    try:
+        while True:
+            done, _ = await asyncio.wait({next_update}, timeout=config.EVENTS_KEEPALIVE_SECONDS)
+            if not done:
+                # keeps proxies from closing an idle connection
+                yield b": keepalive\n\n"
+                continue
+            name, status = next_update.result()
+            if status is None:
+                yield b"event: deleted\ndata: " + orjson.dumps({"tenant": name}) + b"\n\n"
+            else:
+                yield b"event: status\ndata: " + orjson.dumps({"tenant": name, **status}) + b"\n\n"
+            next_update = asyncio.ensure_future(anext(updates))
+    finally:
+        next_update.cancel()
+        with contextlib.suppress(asyncio.CancelledError, StopAsyncIteration):
+            await next_update
+        await updates.aclose()
+
+
+@router.get("/events")
+async def events(
+    cdn_tenant_name: list[str] = Query(None, description="Only send events of these tenants"),
+):
+    if not api.tenant_events_supported():
+        return ORJSONResponse(status_code=400, content={
+            "success": False,
+            "msg": "Tenant events require the kubernetes api http backend",
+        })
+    return StreamingResponse(
+        _sse_tenant_status_events(cdn_tenant_name),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @router.get("/list")
-async def list_tenants():
-    return [name async for name in api.list_iterator()]
+async def list_tenants(
+    consistent: bool = False,
+    limit: int = Query(None, gt=0, description="Return a page of up to limit names with a continue token for the next page"),
+    continue_token: str = Query(None, alias="continue"),
+    stream: bool = Query(False, description="Stream all names (after continue, if given) as newline-delimited JSON"),
+    if_none_match: str = Header(None),
+):
+    if stream:
+        return StreamingResponse(
+            (orjson.dumps(name) + b"\n" async for name in api.list_iterator(consistent, continue_token)),
+            media_type="application/x-ndjson",
+        )
+    if limit or continue_token:
+        success, output = await api.list_page(min(limit or config.LIST_PAGE_SIZE, config.LIST_MAX_LIMIT), continue_token)
+        return ORJSONResponse(
+            status_code=200 if success else 400,
+            content={
+                "items": output[0] if success else [],
+                "continue": output[1] if success else None,
+                "msg": None if success else output,
+            }
+        )
+    names, etag = await api.list_names(consistent)
+    if _etag_matches(if_none_match, etag):
+        return _not_modified(etag)
+    return ORJSONResponse(content=names, headers={"ETag": etag})
 
 
 @router.get('/reserved-names')
@@ -110,14 +259,43 @@ async def components_status():
 
 
 @router.get('/origins-health')
-async def origins_health(cdn_tenant_name: str):
-    success, origins = await api.origins_health(cdn_tenant_name)
+async def origins_health(
+    cdn_tenant_name: str,
+    consistent: bool = False,
+    fresh: bool = Query(False, description="Probe again unless the cached result is only a few seconds old"),
+):
+    success, origins, age_seconds = await api.origins_health_cached(cdn_tenant_name, consistent, fresh)
     return ORJSONResponse(
         status_code=200 if success else 400,
         content={
             "success": success,
             "tenant": cdn_tenant_name,
             "origins": origins if success else [],
+            "ageSeconds": round(age_seconds, 1),
             "msg": None if success else origins,
         }
     )
+
+
+@router.get('/ready')
+async def ready():
+    # readiness probe, not ready until the informers are synced so that a new pod does not serve reads from the api server
+    is_ready = informer.ready()
+    return ORJSONResponse(
+        status_code=200 if is_ready else 503,
+        content={
+            "ready": is_ready,
+            "informers": {name: i.synced for name, i in informer.all_informers().items()},
+        }
+    )
+
+
+@router.get('/debug/informers')
+async def debug_informers():
+    return {name: i.status() for name, i in informer.all_informers().items()}
+
+
+@router.get('/metrics', include_in_schema=False)
+def metrics_():
+    # sync so that reading the multiprocess metric files runs in the threadpool
+    return Response(content=metrics.generate_latest(), media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,43 @@
+import os
+import time
+import logging
+import contextlib
+
+from . import config
+
+
+# set when the package is first imported, with gunicorn warm start that is in the master before forking
+STARTED_AT = time.monotonic()
+STARTED_PID = os.getpid()
+
+phases = {}  # phase name -> seconds, in the order the phases finished
+
+
+def preloaded():
+    return os.getpid() != STARTED_PID
+
+
+def record(name, start_time):
+    phases[name] = time.monotonic() - start_time
+
+
+@contextlib.contextmanager
+def timed(name):
+    start_time = time.monotonic()
+    try:
+        yield
+    finally:
+        record(name, start_time)
+
+
+def summary():
+    total = sum(seconds for name, seconds in phases.items() if '.' not in name)
+    parts = ' '.join(f'{name}={seconds:.3f}s' for name, seconds in phases.items())
+    return total, f'Startup timing: {parts} total={total:.3f}s' + (' (imports and snapshot done in the gunicorn master)' if preloaded() else '')
+
+
+def log_summary():
+    total, message = summary()
+    logging.info(message)
+    if total > config.STARTUP_BUDGET_SECONDS:
+        logging.warning(f'Startup took {total:.3f}s, over the budget of {config.STARTUP_BUDGET_SECONDS}s')
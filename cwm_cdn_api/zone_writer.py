@@ -1,21 +1,27 @@
 import os
+import re
 import sys
 import shutil
 import time
 import tempfile
 import asyncio
 import signal
-import subprocess
 import random
+import hashlib
 
 import orjson
 
-from .config import NAMESPACE
-from .common import async_subprocess_status_output
+from . import config, informer, kube, dns_responder, leader_election
 
 
-def _serial():
-    return str(int(time.time()))
+TENANT_SERVICE_NAME = 'tenant'  # the service of each tenant, in the namespace named as the tenant
+
+SOA_SERIAL_RE = re.compile(r' IN SOA [^(]*\((\d+) ')
+
+
+def _next_serial(previous):
+    # time based, but always increasing, also for more than one change per second
+    return max(previous + 1, int(time.time()))
 
 
 def _apex(domain):
@@ -34,76 +40,557 @@ def _zone_header(apex, serial):
     )
 
 
-async def main_daemon(zones_dir):
+def _zone_body(records, tenant_addresses=None):
+    lines = []
+    for domain_without_apex, tenant_id in records.items():
+        left = '@' if not domain_without_apex else domain_without_apex
+        addresses = tenant_addresses.get(tenant_id) if tenant_addresses else None
+        if addresses:
+            for address in addresses:
+                lines.append(f"{left} IN {'AAAA' if ':' in address else 'A'} {address}\n")
+        else:
+            lines.append(f"{left} IN CNAME tenant.{tenant_id}.svc.cluster.local.\n")
+    lines.append("\n")
+    return ''.join(lines)
+
+
+def _fingerprint(zone_text):
+    return hashlib.blake2b(zone_text.encode(), digest_size=16).digest()
+
+
+class ZoneFiles:
+    """fingerprint and serial of each zone file in a directory, only zones with changed records are rewritten"""
+
+    def __init__(self, zones_dir):
+        self.zones_dir = zones_dir
+        self.fingerprints = {}  # the fingerprint is of the zone text with serial 0
+        self.serials = {}
+        self.digest = None  # records_digest of the last written records
+        for filename in os.listdir(zones_dir):
+            if not filename.endswith('.db'):
+                continue
+            apex = filename[:-len('.db')]
+            with open(os.path.join(zones_dir, filename)) as f:
+                text = f.read()
+            match = SOA_SERIAL_RE.search(text)
+            if match:
+                self.serials[apex] = int(match.group(1))
+                self.fingerprints[apex] = _fingerprint(text[:match.start(1)] + '0' + text[match.end(1):])
+            else:
+                self.fingerprints[apex] = None
+
+    def write(self, apex, records, tenant_addresses=None):
+        """writes the zone file with the next serial unless its records are unchanged, returns true if written"""
+        body = _zone_body(records, tenant_addresses)
+        fingerprint = _fingerprint(_zone_header(apex, 0) + body)
+        if self.fingerprints.get(apex) == fingerprint:
+            return False
+        serial = _next_serial(self.serials.get(apex, 0))
+        with tempfile.NamedTemporaryFile('w', delete=False) as tmp:
+            tmp.write(_zone_header(apex, serial))
+            tmp.write(body)
+        try:
+            os.chmod(tmp.name, 0o755)
+            shutil.move(tmp.name, f'{self.zones_dir}/{apex}.db')
+        except:
+            os.remove(tmp.name)
+            raise
+        self.fingerprints[apex] = fingerprint
+        self.serials[apex] = serial
+        return True
+
+    def remove(self, apex):
+        """removes the zone file, its serial is kept in case the zone is added again, returns true if removed"""
+        if apex not in self.fingerprints:
+            return False
+        del self.fingerprints[apex]
+        if os.path.exists(f'{self.zones_dir}/{apex}.db'):
+            os.remove(f'{self.zones_dir}/{apex}.db')
+        return True
+
+
+_zone_files = {}  # zones dir -> ZoneFiles, loaded from the files on first write
+_last_tenant_domains = {}  # zones dir -> the tenant domains of the last main(), polls with the same tenant domains are skipped
+_fixed_serials = {}  # (zones dir, apex) -> serial of a zone not written by this process, kept until the zone changes
+
+
+def tenant_domain_names(tenant):
+    return [domain['name'] for domain in tenant['spec'].get('domains', [])]
+
+
+def _tenant_domains_only(tenant):
+    # the informer keeps only what the zones need, not the certificates and keys of all tenants
+    return {
+        'metadata': {'name': tenant['metadata']['name'], 'resourceVersion': tenant['metadata'].get('resourceVersion')},
+        'spec': {'domains': [{'name': domain['name']} for domain in tenant.get('spec', {}).get('domains', [])]},
+    }
+
+
+def _service_ips_only(service):
+    spec = service.get('spec', {})
+    return {
+        'metadata': {
+            'name': service['metadata']['name'], 'namespace': service['metadata'].get('namespace'),
+            'resourceVersion': service['metadata'].get('resourceVersion'),
+        },
+        'spec': {
+            'headless': spec.get('clusterIP') == 'None',
+            'clusterIPs': [ip for ip in spec.get('clusterIPs') or ([spec['clusterIP']] if spec.get('clusterIP') else []) if ip != 'None'],
+        },
+    }
+
+
+def _ready_addresses_only(endpoint_slice):
+    addresses = []
+    if endpoint_slice.get('addressType') in ('IPv4', 'IPv6'):
+        for endpoint in endpoint_slice.get('endpoints') or []:
+            # ready is unset if unknown, which consumers should interpret as ready
+            if (endpoint.get('conditions') or {}).get('ready') is not False:
+                addresses.extend(endpoint.get('addresses', []))
+    return {
+        'metadata': {
+            'name': endpoint_slice['metadata']['name'], 'namespace': endpoint_slice['metadata'].get('namespace'),
+            'resourceVersion': endpoint_slice['metadata'].get('resourceVersion'),
+        },
+        'addresses': addresses,
+    }
+
+
+class TenantAddresses:
+    """tenant name -> ip addresses of the tenant service, which is in the namespace named as the tenant
+
+    the addresses are the cluster ips of the service, or the ready endpoints of a headless service
+    """
+
+    def __init__(self):
+        self.services = {}  # namespace -> service ips only
+        self.endpoint_slices = {}  # namespace -> {endpoint slice name: ready addresses}
+
+    def set_service(self, service):
+        self.services[service['metadata']['namespace']] = service
+
+    def remove_service(self, service):
+        self.services.pop(service['metadata']['namespace'], None)
+
+    def set_endpoint_slice(self, endpoint_slice):
+        metadata = endpoint_slice['metadata']
+        self.endpoint_slices.setdefault(metadata['namespace'], {})[metadata['name']] = endpoint_slice['addresses']
+
+    def remove_endpoint_slice(self, endpoint_slice):
+        metadata = endpoint_slice['metadata']
+        endpoint_slices = self.endpoint_slices.get(metadata['namespace'], {})
+        endpoint_slices.pop(metadata['name'], None)
+        if not endpoint_slices:
+            self.endpoint_slices.pop(metadata['namespace'], None)
+
+    def addresses(self, tenant_name):
+        service = self.services.get(tenant_name)
+        if service is None:
+            return []
+        if service['spec']['headless']:
+            return sorted({address for addresses in self.endpoint_slices.get(tenant_name, {}).values() for address in addresses})
+        return service['spec']['clusterIPs']
+
+
+def records_digest(apex_records):
+    """order independent digest of the records, only comparable within a process (string hashes are randomized)"""
+    return sum(
+        hash((apex, domain_without_apex, tenant_name))
+        for apex, records in apex_records.items()
+        for domain_without_apex, tenant_name in records.items()
+    )
+
+
+class ZoneRecords:
+    """apex -> {domain without apex: tenant name} map, updated incrementally on tenant changes
+
+    tenant_addresses optionally has the ip addresses of tenants, whose records are then A/AAAA instead of CNAME
+    """
+
+    def __init__(self):
+        self.apex_records = {}
+        self.tenant_domains = {}
+        self.tenant_addresses = {}
+        self.domain_claims = {}  # (apex, domain without apex) -> names of the tenants with the domain, the last one has the record
+        self.changed_apexes = set()
+        self.digest = 0  # records_digest of apex_records plus the hash of each tenant addresses, updated with each record
+
+    def pop_changed_apexes(self):
+        changed_apexes, self.changed_apexes = self.changed_apexes, set()
+        return changed_apexes
+
+    def _set_record(self, apex, domain_without_apex, tenant_name):
+        """sets the record of a domain to tenant_name, or removes it if None"""
+        records = self.apex_records.setdefault(apex, {})
+        previous = records.pop(domain_without_apex, None)
+        if previous is not None:
+            self.digest -= hash((apex, domain_without_apex, previous))
+        if tenant_name is not None:
+            records[domain_without_apex] = tenant_name
+            self.digest += hash((apex, domain_without_apex, tenant_name))
+        elif not records:
+            del self.apex_records[apex]
+        self.changed_apexes.add(apex)
+
+    def _add(self, tenant_name, domains):
+        for domain in domains:
+            # dns names are case insensitive, the dns responder looks up lowercase query names
+            domain = domain.lower()
+            apex = _apex(domain)
+            domain_without_apex = domain[:-len(apex)].rstrip(".")
+            self.domain_claims.setdefault((apex, domain_without_apex), []).append(tenant_name)
+            self._set_record(apex, domain_without_apex, tenant_name)
+
+    def _remove(self, tenant_name, domains):
+        for domain in domains:
+            domain = domain.lower()
+            apex = _apex(domain)
+            domain_without_apex = domain[:-len(apex)].rstrip(".")
+            claims = self.domain_claims.get((apex, domain_without_apex), [])
+            if tenant_name not in claims:
+                continue
+            owner = claims[-1]
+            claims.remove(tenant_name)
+            if not claims:
+                del self.domain_claims[(apex, domain_without_apex)]
+                self._set_record(apex, domain_without_apex, None)
+            elif claims[-1] != owner:
+                # another tenant with the domain gets the record
+                self._set_record(apex, domain_without_apex, claims[-1])
+
+    def set_tenant(self, tenant_name, domains):
+        """returns true if the domains of the tenant changed"""
+        previous = self.tenant_domains.get(tenant_name)
+        if previous == domains:
+            return False
+        if previous:
+            self._remove(tenant_name, previous)
+        self.tenant_domains[tenant_name] = domains
+        self._add(tenant_name, domains)
+        return True
+
+    def remove_tenant(self, tenant_name):
+        """returns true if the tenant was known"""
+        previous = self.tenant_domains.pop(tenant_name, None)
+        if previous is None:
+            return False
+        self._remove(tenant_name, previous)
+        return True
+
+    def set_tenant_addresses(self, tenant_name, addresses):
+        """returns true if the addresses of the tenant changed, an empty list removes them"""
+        previous = self.tenant_addresses.get(tenant_name, [])
+        if previous == addresses:
+            return False
+        if previous:
+            self.digest -= hash((tenant_name, tuple(previous)))
+        if addresses:
+            self.tenant_addresses[tenant_name] = addresses
+            self.digest += hash((tenant_name, tuple(addresses)))
+        else:
+            del self.tenant_addresses[tenant_name]
+        self.changed_apexes.update(_apex(domain.lower()) for domain in self.tenant_domains.get(tenant_name, []))
+        return True
+
+    def load(self, apex_records, tenant_addresses=None):
+        """replaces all records from an apex records snapshot, e.g. written by another replica"""
+        self.tenant_addresses = {}
+        for tenant_name, addresses in (tenant_addresses or {}).items():
+            self.set_tenant_addresses(tenant_name, addresses)
+        tenant_domains = {}
+        for apex, records in apex_records.items():
+            for domain_without_apex, tenant_name in records.items():
+                tenant_domains.setdefault(tenant_name, []).append(f'{domain_without_apex}.{apex}' if domain_without_apex else apex)
+        self.rebuild(tenant_domains.items())
+
+    def rebuild(self, tenant_domains):
+        """replaces all records from an iterable of tuple (tenant name, domain names)"""
+        self.apex_records = {}
+        self.tenant_domains = {}
+        self.domain_claims = {}
+        self.changed_apexes = set()
+        self.digest = sum(hash((tenant_name, tuple(addresses))) for tenant_name, addresses in self.tenant_addresses.items())
+        for tenant_name, domains in tenant_domains:
+            self.tenant_domains[tenant_name] = domains
+            self._add(tenant_name, domains)
+
+
+async def watch_daemon(zones_dir, stop, records=None):
+    """keeps the zones updated from a watch on the tenants, zones are only written when the domains of a tenant change"""
+    records = records or ZoneRecords()
+    changed = asyncio.Event()
+
+    def on_tenant_event(event_type, tenant):
+        name = tenant['metadata']['name']
+        if event_type == 'DELETED':
+            tenant_changed = records.remove_tenant(name)
+        else:
+            tenant_changed = records.set_tenant(name, tenant_domain_names(tenant))
+        if tenant_changed:
+            changed.set()
+
+    tenants = informer.Informer(
+        kube.TENANT_PLURAL, kube.tenants_path(), resync_seconds=config.ZONE_WRITER_RESYNC_SECONDS,
+        page_size=config.LIST_PAGE_SIZE, transform=_tenant_domains_only,
+    )
+    tenants.add_listener(on_tenant_event)
+    informers = [tenants]
+    if config.ZONE_WRITER_FLATTEN:
+        informers.extend(_tenant_addresses_informers(records, changed))
+    for watched in informers:
+        watched.start()
+    stop_task = asyncio.create_task(stop.wait())
+    synced_task = asyncio.gather(*(watched.wait_synced() for watched in informers))
+    try:
+        await asyncio.wait([synced_task, stop_task], return_when=asyncio.FIRST_COMPLETED)
+        next_resync = time.monotonic()
+        while not stop.is_set():
+            if time.monotonic() >= next_resync:
+                # safety net for missed events or zone files modified on disk, written only if different
+                records.rebuild((name, tenant_domain_names(tenant)) for name, tenant in tenants.items.items())
+                records.pop_changed_apexes()
+                changed.clear()
+                write_zones(zones_dir, records.apex_records, reload=True, digest=records.digest, tenant_addresses=_flattened(records))
+                next_resync = time.monotonic() + config.ZONE_WRITER_RESYNC_SECONDS
+            elif changed.is_set():
+                # batch the changes of bulk applies in a single write
+                await asyncio.sleep(config.ZONE_WRITER_DEBOUNCE_SECONDS)
+                changed.clear()
+                write_zones(
+                    zones_dir, records.apex_records, records.pop_changed_apexes(), digest=records.digest,
+                    tenant_addresses=_flattened(records),
+                )
+            changed_task = asyncio.create_task(changed.wait())
+            await asyncio.wait([changed_task, stop_task], timeout=max(0, next_resync - time.monotonic()), return_when=asyncio.FIRST_COMPLETED)
+            changed_task.cancel()
+    finally:
+        stop_task.cancel()
+        synced_task.cancel()
+        for watched in informers:
+            await watched.stop()
+
+
+def _flattened(records):
+    return records.tenant_addresses if config.ZONE_WRITER_FLATTEN else None
+
+
+def _tenant_addresses_informers(records, changed):
+    """informers of the tenant services and their endpoint slices, which keep the records tenant addresses updated"""
+    addresses = TenantAddresses()
+
+    def on_change(tenant_name):
+        if records.set_tenant_addresses(tenant_name, addresses.addresses(tenant_name)):
+            changed.set()
+
+    def on_service_event(event_type, service):
+        if event_type == 'DELETED':
+            addresses.remove_service(service)
+        else:
+            addresses.set_service(service)
+        on_change(service['metadata']['namespace'])
+
+    def on_endpoint_slice_event(event_type, endpoint_slice):
+        if event_type == 'DELETED':
+            addresses.remove_endpoint_slice(endpoint_slice)
+        else:
+            addresses.set_endpoint_slice(endpoint_slice)
+        on_change(endpoint_slice['metadata']['namespace'])
+
+    services = informer.Informer(
+        'tenant-services', '/api/v1/services', resync_seconds=config.ZONE_WRITER_RESYNC_SECONDS,
+        page_size=config.LIST_PAGE_SIZE, transform=_service_ips_only,
+        params={'fieldSelector': f'metadata.name={TENANT_SERVICE_NAME}'}, namespaced=True,
+    )
+    services.add_listener(on_service_event)
+    endpoint_slices = informer.Informer(
+        'tenant-endpointslices', '/apis/discovery.k8s.io/v1/endpointslices', resync_seconds=config.ZONE_WRITER_RESYNC_SECONDS,
+        page_size=config.LIST_PAGE_SIZE, transform=_ready_addresses_only,
+        params={'labelSelector': f'kubernetes.io/service-name={TENANT_SERVICE_NAME}'}, namespaced=True,
+    )
+    endpoint_slices.add_listener(on_endpoint_slice_event)
+    return [services, endpoint_slices]
+
+
+async def poll_daemon(zones_dir, stop, records=None):
+    while True:
+        await main(zones_dir, daemon=False, records=records)
+        if stop.is_set():
+            break
+        await asyncio.sleep(1.1 + random.uniform(0, 0.4))
+
+
+async def follow_snapshot(zones_dir, records, until):
+    """loads the zones snapshot written by the leader replica whenever it changes, until the until event is set"""
+    zone_filepath_json = f'{zones_dir}.json'
+    addresses_filepath_json = f'{zones_dir}.addresses.json'
+    last_mtime = None
+    while not until.is_set():
+        try:
+            mtime = os.stat(zone_filepath_json).st_mtime_ns
+            if mtime != last_mtime:
+                with open(zone_filepath_json, 'rb') as f:
+                    apex_records = orjson.loads(f.read())
+                tenant_addresses = None
+                if config.ZONE_WRITER_FLATTEN and os.path.exists(addresses_filepath_json):
+                    with open(addresses_filepath_json, 'rb') as f:
+                        tenant_addresses = orjson.loads(f.read())
+                previous_apex_records, previous_tenant_addresses = records.apex_records, records.tenant_addresses
+                records.load(apex_records, tenant_addresses)
+                _bump_fixed_serials(zones_dir, _changed_apexes(previous_apex_records, previous_tenant_addresses, records))
+                last_mtime = mtime
+        except FileNotFoundError:
+            pass
+        except orjson.JSONDecodeError:
+            # partially written, loaded on the next check
+            pass
+        try:
+            await asyncio.wait_for(until.wait(), config.ZONE_WRITER_FOLLOW_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def elected_daemon(zones_dir, stop, records=None, elector=None):
+    """runs the watch daemon while this replica holds the zone writer lease, otherwise follows the leader's snapshot"""
+    records = records or ZoneRecords()
+    elector = elector or leader_election.LeaderElector(config.ZONE_WRITER_LEASE_NAME)
+    elector_task = asyncio.create_task(elector.run())
+    stop_task = asyncio.create_task(stop.wait())
+    try:
+        while not stop.is_set():
+            if elector.is_leader:
+                leader_stop = asyncio.Event()
+                daemon = asyncio.create_task(watch_daemon(zones_dir, leader_stop, records))
+                not_leading_task = asyncio.create_task(elector.not_leading.wait())
+                await asyncio.wait([stop_task, not_leading_task, daemon], return_when=asyncio.FIRST_COMPLETED)
+                not_leading_task.cancel()
+                leader_stop.set()
+                await daemon
+            else:
+                until = asyncio.Event()
+                follower = asyncio.create_task(follow_snapshot(zones_dir, records, until))
+                leading_task = asyncio.create_task(elector.leading.wait())
+                await asyncio.wait([stop_task, leading_task], return_when=asyncio.FIRST_COMPLETED)
+                leading_task.cancel()
+                until.set()
+                await follower
+    finally:
+        stop_task.cancel()
+        elector_task.cancel()
+        try:
+            await elector_task
+        except asyncio.CancelledError:
+            pass
+        await elector.release()
+
+
+def _changed_apexes(previous_apex_records, previous_tenant_addresses, records):
+    changed_apexes = {
+        apex for apex in previous_apex_records.keys() | records.apex_records.keys()
+        if previous_apex_records.get(apex) != records.apex_records.get(apex)
+    }
+    for tenant_name in previous_tenant_addresses.keys() | records.tenant_addresses.keys():
+        if previous_tenant_addresses.get(tenant_name) != records.tenant_addresses.get(tenant_name):
+            changed_apexes.update(_apex(domain) for domain in records.tenant_domains.get(tenant_name, []))
+    return changed_apexes
+
+
+def _bump_fixed_serials(zones_dir, apexes):
+    for apex in apexes:
+        serial = _fixed_serials.get((zones_dir, apex))
+        if serial is not None:
+            _fixed_serials[(zones_dir, apex)] = _next_serial(serial)
+
+
+def zone_serial(zones_dir, apex):
+    """serial of the last written zone file, for zones not written by this process (standby replicas or before the
+    first write) a serial fixed when first requested, which only increases when the followed snapshot changes the zone"""
+    zone_files = _zone_files.get(zones_dir)
+    serial = zone_files.serials.get(apex) if zone_files is not None else None
+    if serial is None:
+        serial = _fixed_serials.setdefault((zones_dir, apex), _next_serial(0))
+    return serial
+
+
+async def main_daemon(zones_dir, dns_listen=None):
     print(f'Starting zone writer daemon, writing to {zones_dir}', file=sys.stderr)
     os.makedirs(zones_dir, exist_ok=True)
     os.chmod(zones_dir, 0o755)
     stop = asyncio.Event()
     asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop.set)
-    while True:
-        await main(zones_dir, daemon=False)
-        if stop.is_set():
-            break
-        await asyncio.sleep(1.1 + random.uniform(0, 0.4))
+    records = ZoneRecords()
+    servers = []
+    if dns_listen:
+        host, port = dns_listen.rsplit(':', 1)
+        responder = dns_responder.DnsResponder(records, lambda apex: zone_serial(zones_dir, apex))
+        servers = await dns_responder.serve(responder, host, int(port))
+    try:
+        if kube.get_backend().name != 'http':
+            if config.ZONE_WRITER_LEADER_ELECTION:
+                print('Leader election requires the http kubernetes backend, running without it', file=sys.stderr)
+            if config.ZONE_WRITER_FLATTEN:
+                print('Flattened records require the http kubernetes backend, writing CNAME records', file=sys.stderr)
+            await poll_daemon(zones_dir, stop, records)
+        elif config.ZONE_WRITER_LEADER_ELECTION:
+            await elected_daemon(zones_dir, stop, records)
+        else:
+            await watch_daemon(zones_dir, stop, records)
+    finally:
+        for server in servers:
+            server.close()
 
 
 async def iterate_tenant_domains():
-    status, output = await async_subprocess_status_output(
-        'kubectl', 'get', 'cdntenant.cdn.cloudwm-cdn.com', '-ojson', '-n', NAMESPACE,
-        stderr=subprocess.STDOUT
-    )
-    if status == 0:
-        for tenant in orjson.loads(output).get('items', []):
-            yield tenant['metadata']['name'], [domain['name'] for domain in tenant['spec']['domains']]
-    else:
-        raise Exception(output)
+    async for tenant_name, domains in kube.get_backend().iter_tenant_domains():
+        yield tenant_name, domains
 
 
-async def main(zones_dir, daemon=False):
+async def main(zones_dir, daemon=False, records=None, dns_listen=None):
+    """writes the zones once, or keeps them updated if daemon, records optionally keeps the records in memory
+    dns_listen optionally answers dns queries for the zones from memory on HOST:PORT (udp and tcp, daemon only)"""
     zone_filepath_json = f'{zones_dir}.json'
     if daemon:
-        if os.path.exists(zone_filepath_json):
+        # with leader election the snapshot is the leader's, which the standby replicas follow
+        if not config.ZONE_WRITER_LEADER_ELECTION and os.path.exists(zone_filepath_json):
             os.remove(zone_filepath_json)
-        await main_daemon(zones_dir)
+        await main_daemon(zones_dir, dns_listen)
         return
-    apex_records = {}
-    async for tenant_name, domains in iterate_tenant_domains():
-        for domain in domains:
-            apex = _apex(domain)
-            if apex not in apex_records:
-                apex_records[apex] = {}
-            domain_without_apex = domain[:-len(apex)].rstrip(".")
-            apex_records[apex][domain_without_apex] = tenant_name
-    apex_records_json = orjson.dumps(apex_records, option=orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS).decode().strip()
-    if os.path.exists(zone_filepath_json):
-        with open(zone_filepath_json, 'r') as f:
-            if f.read().strip() == apex_records_json:
-                return
-    num_apex = 0
-    num_records = 0
-    serial = _serial()
-    db_files = set([d for d in os.listdir(zones_dir) if d.endswith('.db')])
-    for apex, records in apex_records.items():
-        num_apex += 1
-        with tempfile.NamedTemporaryFile('w', delete=False) as tmp:
-            tmp.write(_zone_header(apex, serial))
-            for domain_without_apex, tenant_id in records.items():
-                num_records += 1
-                left = '@' if not domain_without_apex else domain_without_apex
-                target = f"tenant.{tenant_id}.svc.cluster.local."
-                tmp.write(f"{left} IN CNAME {target}\n")
-            tmp.write("\n")
-        try:
-            os.chmod(tmp.name, 0o755)
-            shutil.move(tmp.name, f'{zones_dir}/{apex}.db')
-            if f'{apex}.db' in db_files:
-                db_files.remove(f'{apex}.db')
-        except:
-            os.remove(tmp.name)
-            raise
-    for old_db in db_files:
-        if os.path.exists(f'{zones_dir}/{old_db}'):
-            os.remove(f'{zones_dir}/{old_db}')
-    with open(zone_filepath_json, 'w') as f:
-        f.write(apex_records_json)
-    print(f'Wrote {num_records} records in {num_apex} zones to {zones_dir}', file=sys.stderr)
+    tenant_domains = [(tenant_name, domains) async for tenant_name, domains in iterate_tenant_domains()]
+    if _last_tenant_domains.get(zones_dir) == tenant_domains:
+        return
+    records = records or ZoneRecords()
+    records.rebuild(tenant_domains)
+    write_zones(zones_dir, records.apex_records, digest=records.digest)
+    _last_tenant_domains[zones_dir] = tenant_domains
+
+
+def write_zones(zones_dir, apex_records, apexes=None, reload=False, digest=None, tenant_addresses=None):
+    """writes the zone files of the given apexes (all if None) whose records changed and removes the zone files of
+    apexes without records, unless the digest of the records is unchanged since the last write,
+    reload reads the zone files from disk again, tenant_addresses optionally flattens the records of those tenants"""
+    if digest is None:
+        digest = records_digest(apex_records)
+    zone_files = _zone_files.get(zones_dir)
+    if zone_files is None or reload:
+        zone_files = _zone_files[zones_dir] = ZoneFiles(zones_dir)
+    elif zone_files.digest == digest:
+        return False
+    if apexes is None:
+        apexes = apex_records.keys() | zone_files.fingerprints.keys()
+    num_written = 0
+    num_removed = 0
+    for apex in apexes:
+        records = apex_records.get(apex)
+        if records:
+            num_written += zone_files.write(apex, records, tenant_addresses)
+        else:
+            num_removed += zone_files.remove(apex)
+    zone_files.digest = digest
+    # snapshot of the records, for debugging and for the standby replicas
+    if tenant_addresses is not None:
+        # before the records snapshot, followers reload both when the records snapshot changes
+        with open(f'{zones_dir}.addresses.json', 'wb') as f:
+            f.write(orjson.dumps(tenant_addresses, option=orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS))
+    with open(f'{zones_dir}.json', 'wb') as f:
+        f.write(orjson.dumps(apex_records, option=orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS))
+    print(f'Wrote {num_written} and removed {num_removed} of {len(apex_records)} zones in {zones_dir}', file=sys.stderr)
+    return True
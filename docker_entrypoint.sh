@@ -3,6 +3,10 @@
 set -euo pipefail
 
 if [ "${1:-}" == "" ]; then
+  # metrics of all gunicorn workers are aggregated from files in this directory, stale files from a previous run must be removed
+  export PROMETHEUS_MULTIPROC_DIR="${PROMETHEUS_MULTIPROC_DIR:-/tmp/cwm-cdn-api-prometheus}"
+  rm -rf "${PROMETHEUS_MULTIPROC_DIR}"
+  mkdir -p "${PROMETHEUS_MULTIPROC_DIR}"
   gunicorn --print-config cwm_cdn_api.app:app
   exec gunicorn cwm_cdn_api.app:app
 else
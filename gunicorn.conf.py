@@ -27,3 +27,24 @@ max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', '0'))
 timeout = int(os.getenv('GUNICORN_TIMEOUT', '30'))
 graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', '30'))
 keepalive = int(os.getenv('GUNICORN_KEEPALIVE', '2'))
+
+
+# https://prometheus.github.io/client_python/multiprocess/
+def child_exit(server, worker):
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
+
+
+# warm start: import the app and list the informer collections once in the master, the workers are forked with both
+# loaded and their informers only need to watch for changes since the snapshot
+preload_app = os.getenv('WARM_START', 'false') == 'true'
+
+
+def when_ready(server):
+    if preload_app:
+        import asyncio
+        from cwm_cdn_api import informer, startup
+        with startup.timed('snapshot'):
+            asyncio.run(informer.load_snapshots())
+        server.log.info(f'Warm start: imports={startup.phases["imports"]:.3f}s snapshot={startup.phases["snapshot"]:.3f}s')
@@ -28,3 +28,19 @@ def cache_nginx_entrypoint():
 def tmpdir():
     with tempfile.TemporaryDirectory() as td:
         yield td
+
+
+@pytest.fixture
+async def fake_kube():
+    from cwm_cdn_api import api as cdn_api, kube, kube_fake
+    async with kube_fake.serve() as api:
+        backend = kube.KubeHttpBackend(api.url)
+        kube.set_backend(backend)
+        cdn_api._reserved_names_cache.invalidate()
+        cdn_api._components_status_cache.invalidate()
+        cdn_api._origins_health_cache.invalidate()
+        try:
+            yield api
+        finally:
+            kube.set_backend(None)
+            await backend.aclose()
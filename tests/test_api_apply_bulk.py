@@ -0,0 +1,82 @@
+import asyncio
+
+import httpx
+
+from cwm_cdn_api import api, config, kube
+from cwm_cdn_api.app import app
+
+
+def spec(name):
+    return {
+        "domains": [{"name": f"{name}.example.com", "cert": "cert", "key": "key"}],
+        "origins": [{"url": "http://origin.example.com"}],
+    }
+
+
+async def test_apply_bulk_returns_per_item_results(fake_kube, monkeypatch):
+    monkeypatch.setattr(api, "IS_PRIMARY", True)
+    fake_kube.add_namespace("kube-system")
+    results = await api.apply_bulk([
+        {"name": "tenant1", "spec": spec("tenant1")},
+        {"name": "kube-system", "spec": spec("kube-system")},
+        {"name": "tenant2", "spec": {"domains": [], "origins": [{"url": "not-a-url"}]}},
+        {"name": "tenant3", "spec": spec("tenant3")},
+        {"name": "tenant3", "spec": spec("tenant3")},
+        {"spec": spec("tenant4")},
+        {"name": ["tenant5"], "spec": spec("tenant5")},
+    ])
+    assert [(r["name"], r["success"]) for r in results] == [
+        ("tenant1", True),
+        ("kube-system", False),
+        ("tenant2", False),
+        ("tenant3", False),
+        ("tenant3", False),
+        (None, False),
+        (["tenant5"], False),
+    ]
+    assert results[0]["msg"] == "cdntenant.cdn.cloudwm-cdn.com/tenant1 created"
+    assert results[1]["msg"] == 'Tenant name "kube-system" is not allowed'
+    assert "Invalid origin URL" in results[2]["msg"]
+    assert "more than once" in results[3]["msg"]
+    assert results[6]["msg"] == "Each item must include a name and a spec object"
+    assert [name async for name in api.list_iterator(consistent=True)] == ["tenant1"]
+
+
+async def test_apply_bulk_limits_concurrency(fake_kube, monkeypatch):
+    monkeypatch.setattr(api, "IS_PRIMARY", True)
+    monkeypatch.setattr(config, "APPLY_BULK_CONCURRENCY", 3)
+    in_flight, max_in_flight = 0, 0
+
+    async def slow_apply(o):
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return True, "ok"
+
+    monkeypatch.setattr(kube.get_backend(), "apply_tenant", slow_apply)
+    results = await api.apply_bulk([{"name": f"tenant{i}", "spec": spec(f"tenant{i}")} for i in range(20)])
+    assert all(r["success"] for r in results)
+    assert max_in_flight == 3
+    # validation against one snapshot, not a list per tenant
+    assert len([r for r in fake_kube.requests if r == ("GET", "/api/v1/namespaces")]) == 1
+
+
+async def test_apply_bulk_endpoint(fake_kube, monkeypatch):
+    monkeypatch.setattr(api, "IS_PRIMARY", True)
+    monkeypatch.setattr(config, "APPLY_BULK_MAX_ITEMS", 2)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app()), base_url="http://test") as client:
+        res = await client.post("/apply-bulk", json=[{"name": "tenant1", "spec": spec("tenant1")}])
+        assert res.status_code == 200
+        assert res.json() == {
+            "success": True,
+            "results": [{"name": "tenant1", "success": True, "msg": "cdntenant.cdn.cloudwm-cdn.com/tenant1 created"}],
+            "msg": None,
+        }
+        res = await client.post("/apply-bulk", json=[{"name": ["x"], "spec": {}}])
+        assert res.status_code == 200
+        assert res.json()["results"] == [{"name": ["x"], "success": False, "msg": "Each item must include a name and a spec object"}]
+        res = await client.post("/apply-bulk", json=[{"name": f"t{i}", "spec": spec(f"t{i}")} for i in range(3)])
+        assert res.status_code == 400
+        assert res.json()["msg"] == "Too many items, maximum is 2"
@@ -0,0 +1,82 @@
+import orjson
+
+from cwm_cdn_api import api, informer, kube
+
+from test_informer import start_tenants_informer, wait_for
+
+
+SPEC = {
+    "domains": [{"name": "tenant1.example.com", "cert": "cert", "key": "key"}],
+    "origins": [{"url": "http://origin.example.com"}],
+}
+
+
+def tenant_writes(fake_kube):
+    return [r for r in fake_kube.requests if r[0] in ("POST", "PUT", "PATCH")]
+
+
+def tenant_requests(fake_kube):
+    return [r for r in fake_kube.requests if r[1] == kube.tenants_path("tenant1") or r[0] != "GET"]
+
+
+async def test_apply_stores_spec_hash_and_skips_unchanged_spec(fake_kube, monkeypatch):
+    monkeypatch.setattr(api, "IS_PRIMARY", True)
+    assert await api.apply("tenant1", SPEC) == (True, "cdntenant.cdn.cloudwm-cdn.com/tenant1 created")
+    tenant = fake_kube.get(f"apis/{kube.TENANT_API_VERSION}", kube.TENANT_PLURAL, "tenant1", "default")
+    assert tenant["metadata"]["annotations"][kube.SPEC_HASH_ANNOTATION] == kube.spec_hash(SPEC)
+    # key order doesn't change the hash
+    assert await api.apply("tenant1", dict(reversed(SPEC.items()))) == (True, "cdntenant.cdn.cloudwm-cdn.com/tenant1 unchanged")
+    assert len(tenant_writes(fake_kube)) == 1
+
+
+async def test_apply_unchanged_is_answered_from_informer(fake_kube, monkeypatch):
+    monkeypatch.setattr(api, "IS_PRIMARY", True)
+    await api.apply("tenant1", SPEC)
+    tenants = await start_tenants_informer()
+    try:
+        await wait_for(lambda: kube.SPEC_HASH_ANNOTATION in tenants.get("tenant1")["metadata"].get("annotations", {}))
+        num_requests = len(tenant_requests(fake_kube))
+        assert await api.apply("tenant1", SPEC) == (True, "cdntenant.cdn.cloudwm-cdn.com/tenant1 unchanged")
+        results = await api.apply_bulk([{"name": "tenant1", "spec": SPEC}])
+        assert results == [{"name": "tenant1", "success": True, "msg": "cdntenant.cdn.cloudwm-cdn.com/tenant1 unchanged"}]
+        assert len(tenant_requests(fake_kube)) == num_requests
+        changed_spec = {**SPEC, "origins": [{"url": "http://other.example.com"}]}
+        assert await api.apply("tenant1", changed_spec) == (True, "cdntenant.cdn.cloudwm-cdn.com/tenant1 configured")
+        assert (await api.apply("tenant1", SPEC, consistent=True))[1] == "cdntenant.cdn.cloudwm-cdn.com/tenant1 configured"
+    finally:
+        await informer.stop()
+
+
+async def test_apply_reverting_a_change_not_yet_seen_by_informer(fake_kube, monkeypatch):
+    monkeypatch.setattr(api, "IS_PRIMARY", True)
+    await api.apply("tenant1", SPEC)
+    tenants = await start_tenants_informer()
+    try:
+        await wait_for(lambda: kube.SPEC_HASH_ANNOTATION in tenants.get("tenant1")["metadata"].get("annotations", {}))
+        # the watch lags behind the writes
+        monkeypatch.setattr(tenants, "on_event", lambda event_type, obj: None)
+        changed_spec = {**SPEC, "origins": [{"url": "http://y.example.com"}]}
+        assert await api.apply("tenant1", changed_spec) == (True, "cdntenant.cdn.cloudwm-cdn.com/tenant1 configured")
+        assert await api.apply("tenant1", SPEC) == (True, "cdntenant.cdn.cloudwm-cdn.com/tenant1 configured")
+        tenant = fake_kube.get(f"apis/{kube.TENANT_API_VERSION}", kube.TENANT_PLURAL, "tenant1", "default")
+        assert tenant["spec"]["origins"] == SPEC["origins"]
+        # the api server has the spec, the stale cache is not trusted, so it's confirmed there
+        num_writes = len(tenant_writes(fake_kube))
+        assert await api.apply("tenant1", SPEC) == (True, "cdntenant.cdn.cloudwm-cdn.com/tenant1 unchanged")
+        assert len(tenant_writes(fake_kube)) == num_writes
+    finally:
+        await informer.stop()
+
+
+async def test_kubectl_apply_skips_unchanged_spec(monkeypatch):
+    success, o = api.prepare_tenant("tenant1", {**SPEC, "primaryKey": ""})
+    assert success is True
+    calls = []
+
+    async def fake_status_output(*args, **kwargs):
+        calls.append(args[1])
+        return 0, orjson.dumps(o).decode()
+
+    monkeypatch.setattr(kube, "async_subprocess_status_output", fake_status_output)
+    assert await kube.KubectlBackend().apply_tenant(o) == (True, "cdntenant.cdn.cloudwm-cdn.com/tenant1 unchanged")
+    assert calls == ["get"]
@@ -0,0 +1,48 @@
+import asyncio
+
+from cwm_cdn_api import api, kube
+
+
+def add_component_pods(fake_kube):
+    fake_kube.add_pod("cdn-cache", "cache1-0", "cache:v1")
+    fake_kube.add_pod("cdn-cache", "router-abc", "router")
+    fake_kube.add_pod("cdn-edge", "edge-nginx-coredns-xyz", "coredns:v2", phase="Pending")
+    fake_kube.add_pod("cwm-cdn-operator-system", "operator-1", "operator:v3", labels={"app": "operator"})
+    fake_kube.add_pod("cwm-cdn-operator-system", "other-1", "other:v1")
+
+
+async def test_components_status(fake_kube, monkeypatch):
+    add_component_pods(fake_kube)
+    monkeypatch.setattr(api.config, "COMPONENTS_STATUS_OPERATOR_LABEL_SELECTOR", "app=operator")
+    res = await api.components_status()
+    assert set(res["cache"]) == {"cache1", "router"}
+    assert res["cache"]["cache1"][0]["image_tag"] == "v1"
+    assert res["cache"]["router"][0]["image_tag"] == "latest"
+    assert res["edge"]["coredns"][0]["status_phase"] == "Pending"
+    assert [pod["image_tag"] for pod in res["operator"]] == ["v3"]
+
+
+async def test_components_status_concurrent_callers_share_one_refresh(fake_kube):
+    add_component_pods(fake_kube)
+    results = await asyncio.gather(*[api.components_status() for _ in range(10)])
+    assert all(res == results[0] for res in results)
+    assert len([r for r in fake_kube.requests if r[1].endswith("/pods")]) == 3
+    await api.components_status()
+    assert len([r for r in fake_kube.requests if r[1].endswith("/pods")]) == 3
+
+
+async def test_kubectl_list_pods_parses_custom_columns(monkeypatch):
+    calls = []
+
+    async def fake_check_output(*args, **kwargs):
+        calls.append(args)
+        return "cache1-0   2026-01-01T00:00:00Z   cache:v1   Running\n"
+
+    monkeypatch.setattr(kube, "async_subprocess_check_output", fake_check_output)
+    pods = await kube.KubectlBackend().list_pods("cdn-cache", "app=cache")
+    assert "-l" in calls[0] and "app=cache" in calls[0]
+    assert api.parse_pod_status(pods[0]) == {
+        "creation_timestamp": "2026-01-01T00:00:00Z",
+        "image_tag": "v1",
+        "status_phase": "Running",
+    }
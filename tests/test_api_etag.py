@@ -0,0 +1,66 @@
+import httpx
+
+from cwm_cdn_api import informer, kube
+from cwm_cdn_api.app import app
+
+from test_informer import start_tenants_informer, wait_for
+
+
+def client():
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app()), base_url="http://test")
+
+
+async def test_get_etag_from_resource_version(fake_kube):
+    fake_kube.add_tenant("tenant1", {"domains": []})
+    async with client() as c:
+        res = await c.get("/get", params={"cdn_tenant_name": "tenant1"})
+        etag = res.headers["etag"]
+        assert res.status_code == 200
+        assert etag == f'"{fake_kube.resource_version}"'
+        res = await c.get("/get", params={"cdn_tenant_name": "tenant1"}, headers={"If-None-Match": f'"other", W/{etag}'})
+        assert res.status_code == 304
+        assert res.content == b""
+        assert res.headers["etag"] == etag
+        fake_kube.set_tenant_status("tenant1", {"conditions": [{"type": "Ready", "status": "True"}]})
+        res = await c.get("/get", params={"cdn_tenant_name": "tenant1"}, headers={"If-None-Match": etag})
+        assert res.status_code == 200
+        assert res.headers["etag"] != etag
+        res = await c.get("/get", params={"cdn_tenant_name": "missing"}, headers={"If-None-Match": "*"})
+        assert res.status_code == 400
+        assert "etag" not in res.headers
+
+
+async def test_list_etag_is_digest_of_names(fake_kube):
+    fake_kube.add_tenant("tenant1", {"domains": []})
+    async with client() as c:
+        res = await c.get("/list")
+        etag = res.headers["etag"]
+        assert res.json() == ["tenant1"]
+        tenants = await start_tenants_informer()
+        try:
+            # same names give the same etag from the informer cache, status updates don't change it
+            fake_kube.set_tenant_status("tenant1", {"conditions": []})
+            res = await c.get("/list", headers={"If-None-Match": etag})
+            assert res.status_code == 304
+            fake_kube.add_tenant("tenant2", {"domains": []})
+            await wait_for(lambda: "tenant2" in tenants.items)
+            res = await c.get("/list", headers={"If-None-Match": etag})
+            assert res.status_code == 200
+            assert res.json() == ["tenant1", "tenant2"]
+            assert res.headers["etag"] == (await c.get("/list", params={"consistent": "true"})).headers["etag"]
+        finally:
+            await informer.stop()
+
+
+def test_informer_sorted_names_cached_until_names_change():
+    tenants = informer.Informer(kube.TENANT_PLURAL, kube.tenants_path())
+    tenants.on_event("ADDED", {"metadata": {"name": "b"}})
+    tenants.on_event("ADDED", {"metadata": {"name": "a"}})
+    names, digest = tenants.sorted_names(), tenants.names_digest()
+    assert names == ["a", "b"]
+    tenants.on_event("MODIFIED", {"metadata": {"name": "a"}})
+    assert tenants.sorted_names() is names
+    assert tenants.names_digest() == digest
+    tenants.on_event("DELETED", {"metadata": {"name": "a"}})
+    assert tenants.sorted_names() == ["b"]
+    assert tenants.names_digest() == informer.names_digest(["b"])
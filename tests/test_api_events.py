@@ -0,0 +1,93 @@
+import asyncio
+import contextlib
+
+import httpx
+import orjson
+
+from cwm_cdn_api import api, informer, kube, router
+from cwm_cdn_api.app import app
+
+from test_informer import start_tenants_informer
+
+
+READY = {"conditions": [
+    {"type": "Progressing", "status": "False"},
+    {"type": "Ready", "status": "True"},
+    {"type": "Degraded", "status": "False"},
+]}
+
+
+async def next_event(events):
+    return await asyncio.wait_for(anext(events), 5)
+
+
+async def check_status_events(fake_kube, names=None):
+    async with contextlib.aclosing(api.tenant_status_events(names)) as events:
+        assert await next_event(events) == ("tenant1", {"conditions": {}, "domainTLS": [], "ready": False})
+        # spec changes and other tenants don't send events
+        fake_kube.replace(f"apis/{kube.TENANT_API_VERSION}", kube.TENANT_PLURAL, {
+            **fake_kube.get(f"apis/{kube.TENANT_API_VERSION}", kube.TENANT_PLURAL, "tenant1", "default"),
+            "spec": {"domains": [{"name": "tenant1.example.com"}]},
+        })
+        fake_kube.set_tenant_status("other", READY)
+        fake_kube.set_tenant_status("tenant1", READY)
+        name, status = await next_event(events)
+        assert name == "tenant1"
+        assert status["ready"] is True
+        fake_kube.remove(f"apis/{kube.TENANT_API_VERSION}", kube.TENANT_PLURAL, "tenant1", "default")
+        assert await next_event(events) == ("tenant1", None)
+
+
+async def test_tenant_status_events_from_watch(fake_kube):
+    fake_kube.add_tenant("tenant1", {"domains": []})
+    fake_kube.add_tenant("other", {"domains": []})
+    await check_status_events(fake_kube, ["tenant1"])
+
+
+async def test_tenant_status_events_from_informer(fake_kube):
+    fake_kube.add_tenant("tenant1", {"domains": []})
+    fake_kube.add_tenant("other", {"domains": []})
+    tenants = await start_tenants_informer()
+    try:
+        await check_status_events(fake_kube, ["tenant1"])
+        assert not tenants.listeners
+    finally:
+        await informer.stop()
+
+
+async def test_tenant_status_events_snapshot_after_queue_overflow(fake_kube, monkeypatch):
+    monkeypatch.setattr(api.config, "EVENTS_MAX_QUEUE", 1)
+    fake_kube.add_tenant("tenant1", {"domains": []})
+    tenants = await start_tenants_informer()
+    try:
+        async with contextlib.aclosing(api.tenant_status_events()) as events:
+            await next_event(events)
+            tenants.on_event("ADDED", {"metadata": {"name": "tenant2"}})
+            tenants.on_event("ADDED", {"metadata": {"name": "tenant3"}})
+            tenants.on_event("DELETED", {"metadata": {"name": "tenant1"}})
+            received = {(await next_event(events))[0] for _ in range(3)}
+            assert received == {"tenant1", "tenant2", "tenant3"}
+    finally:
+        await informer.stop()
+
+
+async def test_sse_stream_sends_keepalives_and_events(fake_kube, monkeypatch):
+    monkeypatch.setattr(router.config, "EVENTS_KEEPALIVE_SECONDS", 0.05)
+    fake_kube.add_tenant("tenant1", {"domains": []}, status=READY)
+    async with contextlib.aclosing(router._sse_tenant_status_events(None)) as stream:
+        event = await next_event(stream)
+        while event == b": keepalive\n\n":
+            event = await next_event(stream)
+        assert event.startswith(b"event: status\ndata: ")
+        assert orjson.loads(event.split(b"data: ", 1)[1])["tenant"] == "tenant1"
+        assert await next_event(stream) == b": keepalive\n\n"
+
+
+async def test_events_endpoint_requires_http_backend():
+    kube.set_backend(kube.KubectlBackend())
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app()), base_url="http://test") as client:
+            res = await client.get("/events")
+    finally:
+        kube.set_backend(None)
+    assert res.status_code == 400
@@ -0,0 +1,66 @@
+import httpx
+
+from cwm_cdn_api import api
+from cwm_cdn_api.app import app
+
+
+def client():
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app()), base_url="http://test")
+
+
+def test_parse_and_format_fields():
+    assert api.parse_fields("ready, domains.name,domains.tlsStatus.mode") == (
+        True, {"ready": True, "domains": {"name": True, "tlsStatus": {"mode": True}}}
+    )
+    # a whole field includes its sub-fields
+    assert api.parse_fields("domains.name,domains") == (True, {"domains": True})
+    assert api.parse_fields("domains,domains.name") == (True, {"domains": True})
+    assert api.format_fields(api.parse_fields("ready,domains.tlsStatus.mode,domains.name")[1]) == (
+        "domains.name,domains.tlsStatus.mode,ready"
+    )
+    assert api.parse_fields("spec") == (False, "unknown field: spec, must be one of: domains, origins, domainTLS, ready, conditions")
+    assert api.parse_fields("domains..name") == (False, "invalid field: domains..name")
+    assert api.parse_fields(" , ") == (False, "no fields")
+
+
+def test_tenant_view_projection():
+    o = {
+        "metadata": {"name": "tenant1", "generation": 1},
+        "spec": {
+            "domains": [{"name": "tenant1.example.com", "cert": "cert", "key": "key"}],
+            "origins": [{"url": "http://origin.example.com"}],
+        },
+        "status": {"conditions": [{"type": "Ready", "status": "True"}]},
+    }
+    view = api.tenant_view(o)
+    assert api.tenant_view(o, api.parse_fields(",".join(api.TENANT_VIEW_FIELDS))[1]) == view
+    assert api.tenant_view(o, api.parse_fields("ready,domains.name")[1]) == {
+        "domains": [{"name": "tenant1.example.com"}],
+        "ready": view["ready"],
+    }
+    assert api.tenant_view(o, api.parse_fields("domains.key,domains.cert,domains.name")[1]) == {
+        "domains": [{"name": "tenant1.example.com"}],
+    }
+    assert api.tenant_view(o, api.parse_fields("origins.url,conditions.Ready.status")[1]) == {
+        "origins": [{"url": "http://origin.example.com"}],
+        "conditions": {"Ready": {"status": "True"}},
+    }
+
+
+async def test_get_fields_endpoint(fake_kube):
+    fake_kube.add_tenant("tenant1", {"domains": [{"name": "tenant1.example.com"}], "origins": []})
+    async with client() as c:
+        full_etag = (await c.get("/get", params={"cdn_tenant_name": "tenant1"})).headers["etag"]
+        res = await c.get("/get", params={"cdn_tenant_name": "tenant1", "fields": "ready,domains.name"})
+        assert res.status_code == 200
+        assert res.json()["tenant"] == {"domains": [{"name": "tenant1.example.com"}], "ready": False}
+        etag = res.headers["etag"]
+        assert etag.startswith(f'"{fake_kube.resource_version}-')
+        res = await c.get("/get", params={"cdn_tenant_name": "tenant1", "fields": "domains.name,ready"}, headers={"If-None-Match": etag})
+        assert res.status_code == 304
+        # a cached full response doesn't match a projected one
+        res = await c.get("/get", params={"cdn_tenant_name": "tenant1", "fields": "ready"}, headers={"If-None-Match": full_etag})
+        assert res.status_code == 200
+        res = await c.get("/get", params={"cdn_tenant_name": "tenant1", "fields": "metadata"})
+        assert res.status_code == 400
+        assert res.json()["msg"].startswith("unknown field: metadata")
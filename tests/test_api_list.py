@@ -0,0 +1,48 @@
+import httpx
+import orjson
+
+from cwm_cdn_api import api, config, kube
+from cwm_cdn_api.app import app
+
+
+def add_tenants(fake_kube, num_tenants):
+    for i in range(num_tenants):
+        fake_kube.add_tenant(f"tenant{i:02d}", {"domains": []})
+
+
+async def test_list_page_and_resume_iterator(fake_kube):
+    add_tenants(fake_kube, 5)
+    success, (names, continue_token) = await api.list_page(2)
+    assert success is True
+    assert names == ["tenant00", "tenant01"]
+    assert [name async for name in api.list_iterator(continue_token=continue_token)] == ["tenant02", "tenant03", "tenant04"]
+
+
+async def test_list_iterator_pages_through_api_server(fake_kube, monkeypatch):
+    monkeypatch.setattr(config, "LIST_PAGE_SIZE", 2)
+    add_tenants(fake_kube, 5)
+    assert [name async for name in api.list_iterator()] == [f"tenant{i:02d}" for i in range(5)]
+    assert fake_kube.requests.count(("GET", kube.tenants_path())) == 3
+
+
+async def test_list_expired_continue_token(fake_kube):
+    add_tenants(fake_kube, 3)
+    _, (_, continue_token) = await api.list_page(1)
+    fake_kube.add_tenant("tenant99", {"domains": []})
+    fake_kube.compact()
+    success, message = await api.list_page(1, continue_token)
+    assert success is False
+    assert "Expired" in message
+
+
+async def test_list_endpoint_pagination_and_stream(fake_kube):
+    add_tenants(fake_kube, 3)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app()), base_url="http://test") as client:
+        res = (await client.get("/list", params={"limit": 2})).json()
+        assert res["items"] == ["tenant00", "tenant01"]
+        res = (await client.get("/list", params={"limit": 2, "continue": res["continue"]})).json()
+        assert res == {"items": ["tenant02"], "continue": None, "msg": None}
+        res = await client.get("/list", params={"stream": "true"})
+        assert res.headers["content-type"] == "application/x-ndjson"
+        assert [orjson.loads(line) for line in res.text.splitlines()] == ["tenant00", "tenant01", "tenant02"]
+        assert (await client.get("/list")).json() == ["tenant00", "tenant01", "tenant02"]
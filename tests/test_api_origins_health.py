@@ -1,4 +1,6 @@
-import orjson
+import asyncio
+
+import httpx
 import pytest
 from fastapi.testclient import TestClient
 
@@ -6,9 +8,9 @@ from cwm_cdn_api import api
 from cwm_cdn_api.app import app
 
 
-class FakeResponse:
-    def __init__(self, status_code):
-        self.status_code = status_code
+def mock_origins(monkeypatch, handler, max_concurrency=10):
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler), follow_redirects=False)
+    monkeypatch.setattr(api, "_origin_health_client", (asyncio.get_running_loop(), client, asyncio.Semaphore(max_concurrency)))
 
 
 def test_validate_origins_rejects_invalid_scheme():
@@ -24,25 +26,24 @@ def test_validate_origins_rejects_path_prefixed_multi_origin():
         ])
 
 
-def test_check_origin_health_defaults_and_schema(monkeypatch):
+async def test_check_origin_health_defaults_and_schema(monkeypatch):
     requested = {}
 
-    def fake_get(url, timeout, allow_redirects):
+    def handler(request):
         requested.update({
-            "url": url,
-            "timeout": timeout,
-            "allow_redirects": allow_redirects,
+            "url": str(request.url),
+            "timeout": request.extensions["timeout"]["read"],
         })
-        return FakeResponse(200)
+        return httpx.Response(200)
 
-    monkeypatch.setattr(api.requests, "get", fake_get)
-    result = api.check_origin_health({"url": "https://origin.example.com"}, 0)
+    mock_origins(monkeypatch, handler)
+    result = await api.check_origin_health({"url": "https://origin.example.com"}, 0)
 
     assert requested == {
         "url": "https://origin.example.com/",
         "timeout": 2,
-        "allow_redirects": False,
     }
+    assert api.origin_health_client().follow_redirects is False
     assert set(result) == {"name", "url", "healthy", "statusCode", "latencyMs", "checkedAt", "message"}
     assert result["name"] == "origin-0"
     assert result["healthy"] is True
@@ -50,9 +51,9 @@ def test_check_origin_health_defaults_and_schema(monkeypatch):
     assert result["message"] == ""
 
 
-def test_check_origin_health_reports_unexpected_status(monkeypatch):
-    monkeypatch.setattr(api.requests, "get", lambda *args, **kwargs: FakeResponse(503))
-    result = api.check_origin_health({
+async def test_check_origin_health_reports_unexpected_status(monkeypatch):
+    mock_origins(monkeypatch, lambda request: httpx.Response(503))
+    result = await api.check_origin_health({
         "name": "origin-a",
         "url": "http://origin.example.com",
         "healthCheck": {"path": "/healthz", "expectedStatus": 204},
@@ -63,8 +64,8 @@ def test_check_origin_health_reports_unexpected_status(monkeypatch):
     assert result["message"] == "unexpected status 503"
 
 
-def test_check_origin_health_disabled():
-    result = api.check_origin_health({
+async def test_check_origin_health_disabled():
+    result = await api.check_origin_health({
         "name": "origin-a",
         "url": "http://origin.example.com",
         "healthCheck": {"enabled": False},
@@ -74,20 +75,43 @@ def test_check_origin_health_disabled():
     assert result["message"] == "health check disabled"
 
 
-async def test_origins_health_loads_tenant_and_checks_origins(monkeypatch):
-    tenant = {
-        "spec": {
-            "origins": [
-                {"name": "origin-a", "url": "http://origin-a.example.com", "healthCheck": {"enabled": False}},
-                {"name": "origin-b", "url": "http://origin-b.example.com", "healthCheck": {"enabled": False}},
-            ]
-        }
-    }
+async def test_check_origin_health_reports_connection_errors(monkeypatch):
+    def handler(request):
+        raise httpx.ConnectTimeout("timed out")
+
+    mock_origins(monkeypatch, handler)
+    result = await api.check_origin_health({"url": "http://origin.example.com"}, 0)
+    assert result["healthy"] is False
+    assert result["statusCode"] is None
+    assert result["message"] == "timed out"
+
+
+async def test_origins_health_probes_concurrently_with_limit(fake_kube, monkeypatch):
+    in_flight, max_in_flight = 0, 0
 
-    async def fake_status_output(*args, **kwargs):
-        return 0, orjson.dumps(tenant)
+    async def handler(request):
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0.05)
+        in_flight -= 1
+        return httpx.Response(200, content=b"ok")
 
-    monkeypatch.setattr(api, "async_subprocess_status_output", fake_status_output)
+    mock_origins(monkeypatch, handler, max_concurrency=4)
+    fake_kube.add_tenant("tenant1", {"origins": [{"url": f"http://origin-{i}.example.com"} for i in range(8)]})
+    success, origins = await api.origins_health("tenant1")
+    assert success is True
+    assert all(origin["healthy"] for origin in origins)
+    assert max_in_flight == 4
+
+
+async def test_origins_health_loads_tenant_and_checks_origins(fake_kube):
+    fake_kube.add_tenant("tenant1", {
+        "origins": [
+            {"name": "origin-a", "url": "http://origin-a.example.com", "healthCheck": {"enabled": False}},
+            {"name": "origin-b", "url": "http://origin-b.example.com", "healthCheck": {"enabled": False}},
+        ]
+    })
     success, origins = await api.origins_health("tenant1")
 
     assert success is True
@@ -95,15 +119,11 @@ async def test_origins_health_loads_tenant_and_checks_origins(monkeypatch):
     assert all(origin["healthy"] for origin in origins)
 
 
-async def test_apply_rejects_invalid_origin_without_kubectl(monkeypatch):
+async def test_apply_rejects_invalid_origin_without_kubectl(monkeypatch, fake_kube):
     async def fake_validate_name(name):
         return None
 
-    async def fail_kubectl(*args, **kwargs):
-        raise AssertionError("kubectl should not be called")
-
     monkeypatch.setattr(api, "validate_name", fake_validate_name)
-    monkeypatch.setattr(api, "async_subprocess_status_output", fail_kubectl)
     success, message = await api.apply("tenant1", {
         "domains": [],
         "origins": [{"url": "not-a-url"}],
@@ -111,10 +131,11 @@ async def test_apply_rejects_invalid_origin_without_kubectl(monkeypatch):
 
     assert success is False
     assert "Invalid origin URL" in message
+    assert fake_kube.requests == []
 
 
 def test_origins_health_endpoint_schema(monkeypatch):
-    async def fake_origins_health(name):
+    async def fake_origins_health(name, consistent=False):
         return True, [{
             "name": "origin-a",
             "url": "https://origin.example.com",
@@ -141,5 +162,54 @@ def test_origins_health_endpoint_schema(monkeypatch):
             "checkedAt": "2026-06-08T00:00:00Z",
             "message": "",
         }],
+        "ageSeconds": 0.0,
         "msg": None,
     }
+
+
+async def test_origins_health_cached_joins_in_flight_probe(fake_kube, monkeypatch):
+    num_probes = 0
+
+    async def handler(request):
+        nonlocal num_probes
+        num_probes += 1
+        await asyncio.sleep(0.05)
+        return httpx.Response(200)
+
+    mock_origins(monkeypatch, handler)
+    fake_kube.add_tenant("tenant1", {"origins": [{"url": "http://origin.example.com"}]})
+    results = await asyncio.gather(*[api.origins_health_cached("tenant1") for _ in range(5)])
+    assert num_probes == 1
+    assert all(success and origins == results[0][1] for success, origins, _ in results)
+    success, origins, age_seconds = await api.origins_health_cached("tenant1")
+    assert num_probes == 1
+    assert age_seconds > 0
+
+
+async def test_origins_health_fresh_is_rate_limited(fake_kube, monkeypatch):
+    num_probes = 0
+
+    def handler(request):
+        nonlocal num_probes
+        num_probes += 1
+        return httpx.Response(200)
+
+    mock_origins(monkeypatch, handler)
+    monkeypatch.setattr(api.config, "ORIGINS_HEALTH_FRESH_MIN_INTERVAL_SECONDS", 0.05)
+    fake_kube.add_tenant("tenant1", {"origins": [{"url": "http://origin.example.com"}]})
+    await api.origins_health_cached("tenant1")
+    await api.origins_health_cached("tenant1", fresh=True)
+    assert num_probes == 1
+    await asyncio.sleep(0.06)
+    _, _, age_seconds = await api.origins_health_cached("tenant1", fresh=True)
+    assert num_probes == 2
+    assert age_seconds < 0.05
+
+
+async def test_origins_health_cached_does_not_cache_errors(fake_kube):
+    success, message, _ = await api.origins_health_cached("tenant1")
+    assert success is False
+    assert "not found" in message
+    fake_kube.add_tenant("tenant1", {"origins": [{"url": "http://origin.example.com", "healthCheck": {"enabled": False}}]})
+    success, origins, _ = await api.origins_health_cached("tenant1")
+    assert success is True
@@ -0,0 +1,49 @@
+import asyncio
+
+import pytest
+
+from cwm_cdn_api import api, informer
+
+
+def namespace_list_requests(fake_kube):
+    return [r for r in fake_kube.requests if r == ("GET", "/api/v1/namespaces")]
+
+
+async def test_validate_name_uses_single_snapshot_for_concurrent_calls(fake_kube):
+    fake_kube.add_namespace("kube-system")
+    fake_kube.add_namespace("tenant1")
+    fake_kube.add_tenant("tenant1", {"domains": []})
+    await asyncio.gather(*[api.validate_name(f"new-tenant{i}") for i in range(10)])
+    await api.validate_name("tenant1")
+    with pytest.raises(ValueError, match='Tenant name "kube-system" is not allowed'):
+        await api.validate_name("kube-system")
+    assert [name async for name in api.reserved_names_iterator()] == ["kube-system"]
+    # one snapshot for all the allowed names, the reserved hit is confirmed with one fresh list
+    assert len(namespace_list_requests(fake_kube)) == 2
+
+
+async def test_validate_name_rechecks_stale_snapshot_before_rejecting(fake_kube):
+    await api.validate_name("tenant1")
+    fake_kube.add_namespace("tenant1")
+    fake_kube.add_tenant("tenant1", {"domains": []})
+    await api.validate_name("tenant1")
+
+
+async def test_validate_name_uses_informers_without_api_calls(fake_kube):
+    fake_kube.add_namespace("kube-system")
+    fake_kube.add_namespace("tenant1")
+    fake_kube.add_tenant("tenant1", {"domains": []})
+    await informer.start()
+    try:
+        num_requests = len(fake_kube.requests)
+        await api.validate_name("tenant1")
+        with pytest.raises(ValueError, match="is not allowed"):
+            await api.validate_name("kube-system")
+        assert [name async for name in api.reserved_names_iterator()] == ["kube-system"]
+        assert len(fake_kube.requests) == num_requests
+        fake_kube.add_namespace("monitoring")
+        await asyncio.sleep(0.1)
+        assert [name async for name in api.reserved_names_iterator()] == ["kube-system", "monitoring"]
+    finally:
+        await informer.stop()
+    assert informer.get_namespaces() is None
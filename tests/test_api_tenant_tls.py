@@ -1,4 +1,3 @@
-import orjson
 import pytest
 
 from cwm_cdn_api import api
@@ -77,6 +76,32 @@ def test_validate_spec_rejects_non_object_tls():
         api.validate_spec(spec)
 
 
+def test_validate_spec_collects_all_errors():
+    spec = tenant_spec(tls={"mode": "provided", "minVersion": "TLSv1.1", "issuerRef": {}})
+    spec["domains"].append({"name": "", "tls": "provided"})
+    spec["extra"] = [{"secretName": "x"}]
+    origin_errors, errors = api.spec_errors(spec)
+    assert origin_errors == []
+    assert errors == [
+        "Tenant spec contains internal certificate fields: spec.domains[0].tls.issuerRef, spec.extra[0].secretName",
+        "domains[0].tls.minVersion must be TLSv1.2 or TLSv1.3",
+        "domains[1].name is required",
+        "domains[1].tls must be an object",
+    ]
+
+
+def test_prepare_tenant_does_not_modify_the_spec(monkeypatch):
+    monkeypatch.setattr(api, "ALLOWED_PRIMARY_KEY", "secret")
+    spec = {**tenant_spec(), "primaryKey": "secret"}
+    success, o = api.prepare_tenant("tenant1", spec)
+    assert success is True
+    assert "primaryKey" not in o["spec"]
+    assert spec["primaryKey"] == "secret"
+    assert api.prepare_tenant("tenant1", {"domains": [], "origins": [{"url": "ftp://x"}, {"url": "http://y/path"}]}) == (
+        False, "Invalid origin URL: ftp://x; Path-prefixed origin URLs are not supported with multiple origins"
+    )
+
+
 def test_certificate_resource_details_only_includes_letsencrypt_domains():
     spec = tenant_spec()
     spec["domains"].append({
@@ -104,7 +129,7 @@ def test_redacted_domain_includes_tls_status_without_secrets():
 
 
 @pytest.mark.asyncio
-async def test_get_redacts_secrets_and_returns_domain_tls(monkeypatch):
+async def test_get_redacts_secrets_and_returns_domain_tls(fake_kube):
     tenant = {
         "spec": {
             "domains": [{"name": "test.example.com", "cert": "cert", "key": "key"}],
@@ -120,10 +145,7 @@ async def test_get_redacts_secrets_and_returns_domain_tls(monkeypatch):
         },
     }
 
-    async def fake_status_output(*args, **kwargs):
-        return 0, orjson.dumps(tenant)
-
-    monkeypatch.setattr(api, "async_subprocess_status_output", fake_status_output)
+    fake_kube.add_tenant("tenant1", tenant["spec"], status=tenant["status"])
     success, result = await api.get("tenant1")
     assert success is True
     assert result["ready"] is True
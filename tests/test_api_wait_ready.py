@@ -0,0 +1,96 @@
+import asyncio
+
+import httpx
+
+from cwm_cdn_api import api, informer, kube
+from cwm_cdn_api.app import app
+
+from test_informer import start_tenants_informer
+
+
+PROGRESSING = {"conditions": [{"type": "Progressing", "status": "True"}]}
+READY = {"conditions": [
+    {"type": "Progressing", "status": "False"},
+    {"type": "Ready", "status": "True"},
+    {"type": "Degraded", "status": "False"},
+]}
+
+
+async def set_status_later(fake_kube, status, delay=0.1):
+    await asyncio.sleep(delay)
+    fake_kube.set_tenant_status("tenant1", status)
+
+
+async def test_wait_settled_follows_api_server_watch(fake_kube):
+    fake_kube.add_tenant("tenant1", {"domains": []}, status=PROGRESSING)
+    (success, tenant, settled), _ = await asyncio.gather(
+        api.wait_settled("tenant1", 5),
+        set_status_later(fake_kube, READY),
+    )
+    assert (success, settled) == (True, True)
+    assert api.tenant_view(tenant)["ready"] is True
+
+
+async def test_wait_settled_follows_informer(fake_kube):
+    fake_kube.add_tenant("tenant1", {"domains": []}, status=PROGRESSING)
+    tenants = await start_tenants_informer()
+    try:
+        (success, tenant, settled), _ = await asyncio.gather(
+            api.wait_settled("tenant1", 5),
+            set_status_later(fake_kube, READY),
+        )
+        assert (success, settled) == (True, True)
+        assert not tenants.listeners
+    finally:
+        await informer.stop()
+
+
+async def test_wait_settled_right_after_apply_waits_for_new_generation(fake_kube):
+    observed = {"conditions": [{**condition, "observedGeneration": 1} for condition in READY["conditions"]]}
+    fake_kube.add_tenant("tenant1", {"origins": [{"url": "http://x.example.com"}]}, status=observed)
+    tenants = await start_tenants_informer()
+    try:
+        tenant = fake_kube.get(f"apis/{kube.TENANT_API_VERSION}", kube.TENANT_PLURAL, "tenant1", "default")
+        fake_kube.replace(f"apis/{kube.TENANT_API_VERSION}", kube.TENANT_PLURAL, {
+            **tenant, "spec": {"origins": [{"url": "http://y.example.com"}]},
+        }, namespace="default")
+        # the informer cache still has the settled previous generation
+        assert tenants.get("tenant1")["metadata"]["generation"] == 1
+        reconciled = {"conditions": [{**condition, "observedGeneration": 2} for condition in READY["conditions"]]}
+        (success, tenant, settled), _ = await asyncio.gather(
+            api.wait_settled("tenant1", 5),
+            set_status_later(fake_kube, reconciled, delay=0.3),
+        )
+        assert (success, settled) == (True, True)
+        assert tenant["metadata"]["generation"] == 2
+        assert tenant["spec"]["origins"] == [{"url": "http://y.example.com"}]
+        assert tenant["status"] == reconciled
+    finally:
+        await informer.stop()
+
+
+async def test_wait_settled_times_out(fake_kube):
+    fake_kube.add_tenant("tenant1", {"domains": []}, status=PROGRESSING)
+    success, tenant, settled = await api.wait_settled("tenant1", 0.2)
+    assert (success, settled) == (True, False)
+    success, message, settled = await api.wait_settled("missing", 0.2)
+    assert (success, settled) == (False, False)
+    assert "not found" in message
+
+
+def test_is_settled_requires_current_generation():
+    tenant = {"metadata": {"generation": 2}, "status": {"conditions": [
+        {**condition, "observedGeneration": 1} for condition in READY["conditions"]
+    ]}}
+    assert api.is_settled(tenant) is False
+    tenant["metadata"]["generation"] = 1
+    assert api.is_settled(tenant) is True
+
+
+async def test_wait_ready_endpoint(fake_kube):
+    fake_kube.add_tenant("tenant1", {"domains": []}, status=READY)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app()), base_url="http://test") as client:
+        res = await client.get("/wait-ready", params={"cdn_tenant_name": "tenant1", "timeout": 5})
+    assert res.status_code == 200
+    assert res.json()["settled"] is True
+    assert res.json()["tenant"]["ready"] is True
@@ -0,0 +1,89 @@
+import sys
+import asyncio
+
+import httpx
+import pytest
+
+from cwm_cdn_api import common, kube, startup
+from cwm_cdn_api.app import app
+
+
+async def test_concurrency_limiter_queues_in_order_and_rejects_when_full():
+    limiter = common.ConcurrencyLimiter("test", max_concurrency=2, max_queue=2)
+    release = asyncio.Event()
+    started = []
+
+    async def run(i):
+        async with limiter.slot():
+            started.append(i)
+            await release.wait()
+
+    tasks = [asyncio.create_task(run(i)) for i in range(4)]
+    await asyncio.sleep(0)
+    assert started == [0, 1]
+    assert (limiter.in_flight, len(limiter.waiters)) == (2, 2)
+    with pytest.raises(common.QueueFull):
+        await run(4)
+    release.set()
+    await asyncio.gather(*tasks)
+    assert started == [0, 1, 2, 3]
+    assert (limiter.in_flight, len(limiter.waiters)) == (0, 0)
+
+
+async def test_concurrency_limiter_cancelled_waiter_frees_its_place():
+    limiter = common.ConcurrencyLimiter("test", max_concurrency=1, max_queue=1)
+    release = asyncio.Event()
+
+    async def run():
+        async with limiter.slot():
+            await release.wait()
+
+    holder = asyncio.create_task(run())
+    waiter = asyncio.create_task(run())
+    await asyncio.sleep(0)
+    waiter.cancel()
+    await asyncio.gather(waiter, return_exceptions=True)
+    assert len(limiter.waiters) == 0
+    release.set()
+    await holder
+    assert limiter.in_flight == 0
+
+
+async def test_subprocess_limiter_bounds_concurrent_processes(monkeypatch):
+    monkeypatch.setattr(common, "subprocess_limiter", common.ConcurrencyLimiter("subprocess", 2, 10))
+    tasks = [
+        asyncio.create_task(common.async_subprocess_status_output(sys.executable, "-c", "print('ok')"))
+        for _ in range(5)
+    ]
+    await asyncio.sleep(0)
+    assert (common.subprocess_limiter.in_flight, len(common.subprocess_limiter.waiters)) == (2, 3)
+    assert await asyncio.gather(*tasks) == [(0, "ok")] * 5
+    assert common.subprocess_limiter.in_flight == 0
+
+
+async def test_queue_full_returns_503(monkeypatch):
+    monkeypatch.setattr(common, "subprocess_limiter", common.ConcurrencyLimiter("subprocess", 0, 0))
+    kube.set_backend(kube.KubectlBackend())
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app()), base_url="http://test") as client:
+            response = await client.get("/get", params={"cdn_tenant_name": "tenant1"})
+    finally:
+        kube.set_backend(None)
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
+    assert response.json() == {"success": False, "msg": "too many pending subprocess operations, try again later"}
+
+
+def test_startup_summary(monkeypatch):
+    monkeypatch.setattr(startup, "phases", {"imports": 0.5, "app": 0.25, "informers": 1, "informers.namespaces": 0.5})
+    total, message = startup.summary()
+    assert total == 1.75
+    assert message == "Startup timing: imports=0.500s app=0.250s informers=1.000s informers.namespaces=0.500s total=1.750s"
+
+
+async def test_async_subprocess_iter_lines():
+    lines = common.async_subprocess_iter_lines(sys.executable, "-c", "print('a'); print('b\\tc')")
+    assert [line async for line in lines] == ["a", "b\tc"]
+    with pytest.raises(Exception, match="failed"):
+        async for _ in common.async_subprocess_iter_lines(sys.executable, "-c", "import sys; print('a'); sys.exit('failed')"):
+            pass
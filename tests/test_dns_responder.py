@@ -0,0 +1,147 @@
+import struct
+import asyncio
+
+from cwm_cdn_api import dns_responder, zone_writer
+
+
+def query(name, qtype, query_id=1234):
+    return struct.pack("!HHHHHH", query_id, dns_responder.FLAG_RD, 1, 0, 0, 0) + dns_responder.encode_name(name) + struct.pack("!HH", qtype, dns_responder.CLASS_IN)
+
+
+def edns_query(name, qtype, udp_size, query_id=1234):
+    message = query(name, qtype, query_id)
+    opt = b"\x00" + struct.pack("!HHIH", dns_responder.TYPE_OPT, udp_size, 0, 0)
+    return message[:10] + struct.pack("!H", 1) + message[12:] + opt
+
+
+def header(response):
+    query_id, flags, qdcount, ancount, nscount, arcount = struct.unpack("!HHHHHH", response[:12])
+    return {"id": query_id, "rcode": flags & 0xF, "aa": bool(flags & dns_responder.FLAG_AA), "answers": ancount, "authority": nscount}
+
+
+def responder():
+    records = zone_writer.ZoneRecords()
+    records.set_tenant("tenant1", ["www.example.com", "example.com"])
+    records.set_tenant("tenant2", ["api.other.com"])
+    return dns_responder.DnsResponder(records, lambda apex: 7), records
+
+
+def test_answers():
+    resp, records = responder()
+    response = resp.answer(query("WWW.Example.com", dns_responder.TYPE_A))
+    assert header(response) == {"id": 1234, "rcode": 0, "aa": True, "answers": 1, "authority": 0}
+    assert response.endswith(dns_responder.encode_name("tenant.tenant1.svc.cluster.local"))
+    assert header(resp.answer(query("example.com", dns_responder.TYPE_SOA)))["answers"] == 1
+    assert struct.pack("!I", 7) in resp.answer(query("example.com", dns_responder.TYPE_SOA))
+    assert header(resp.answer(query("example.com", dns_responder.TYPE_NS)))["answers"] == 1
+    assert header(resp.answer(query("ns1.other.com", dns_responder.TYPE_A)))["answers"] == 1
+    # an apex without a CNAME record has no data of other types
+    assert header(resp.answer(query("other.com", dns_responder.TYPE_A))) == {"id": 1234, "rcode": 0, "aa": True, "answers": 0, "authority": 1}
+    assert header(resp.answer(query("missing.other.com", dns_responder.TYPE_A)))["rcode"] == dns_responder.RCODE_NXDOMAIN
+    assert header(resp.answer(query("www.unknown.com", dns_responder.TYPE_A)))["rcode"] == dns_responder.RCODE_REFUSED
+    assert header(resp.answer(b"\x00\x01\x00"))["rcode"] == dns_responder.RCODE_FORMERR
+    assert resp.answer(b"\x00") is None
+    # answers follow the records without a reload
+    records.set_tenant("tenant3", ["new.unknown.com"])
+    assert header(resp.answer(query("new.unknown.com", dns_responder.TYPE_A)))["answers"] == 1
+
+
+async def test_udp_and_tcp():
+    resp, _ = responder()
+    udp_transport, tcp_server = await dns_responder.serve(resp, "127.0.0.1", 0)
+    try:
+        loop = asyncio.get_running_loop()
+        received = loop.create_future()
+
+        class Client(asyncio.DatagramProtocol):
+            def datagram_received(self, data, addr):
+                received.set_result(data)
+
+        client, _ = await loop.create_datagram_endpoint(Client, remote_addr=udp_transport.get_extra_info("sockname"))
+        try:
+            client.sendto(query("www.example.com", dns_responder.TYPE_A, query_id=1))
+            assert header(await asyncio.wait_for(received, 5))["answers"] == 1
+        finally:
+            client.close()
+        reader, writer = await asyncio.open_connection(*tcp_server.sockets[0].getsockname())
+        try:
+            for query_id in (2, 3):
+                message = query("api.other.com", dns_responder.TYPE_CNAME, query_id=query_id)
+                writer.write(struct.pack("!H", len(message)) + message)
+                length = struct.unpack("!H", await reader.readexactly(2))[0]
+                assert header(await reader.readexactly(length))["id"] == query_id
+        finally:
+            writer.close()
+    finally:
+        udp_transport.close()
+        tcp_server.close()
+
+
+async def test_answers_follow_the_tenants_watch(fake_kube, tmpdir):
+    from test_informer import wait_for
+
+    records = zone_writer.ZoneRecords()
+    resp = dns_responder.DnsResponder(records, lambda apex: 1)
+    stop = asyncio.Event()
+    daemon = asyncio.create_task(zone_writer.watch_daemon(tmpdir, stop, records))
+    try:
+        fake_kube.add_tenant("tenant1", {"domains": [{"name": "www.example.com"}]})
+        await wait_for(lambda: header(resp.answer(query("www.example.com", dns_responder.TYPE_A)))["answers"] == 1)
+    finally:
+        stop.set()
+        await asyncio.wait_for(daemon, 5)
+
+
+def test_flattened_answers():
+    resp, records = responder()
+    records.set_tenant_addresses("tenant1", ["10.0.0.1", "fd00::1"])
+    response = resp.answer(query("www.example.com", dns_responder.TYPE_A))
+    assert header(response)["answers"] == 1
+    assert response.endswith(bytes([10, 0, 0, 1]))
+    response = resp.answer(query("www.example.com", dns_responder.TYPE_AAAA))
+    assert header(response)["answers"] == 1
+    assert response.endswith(bytes([0xFD] + [0] * 14 + [1]))
+    assert header(resp.answer(query("www.example.com", dns_responder.TYPE_ANY)))["answers"] == 2
+    # no data of other types, instead of a CNAME
+    assert header(resp.answer(query("www.example.com", dns_responder.TYPE_CNAME))) == {"id": 1234, "rcode": 0, "aa": True, "answers": 0, "authority": 1}
+    # tenants without known addresses are answered with the CNAME
+    assert header(resp.answer(query("api.other.com", dns_responder.TYPE_A)))["answers"] == 1
+    assert resp.answer(query("api.other.com", dns_responder.TYPE_A)).endswith(dns_responder.encode_name("tenant.tenant2.svc.cluster.local"))
+
+
+def test_large_udp_responses_are_truncated():
+    resp, records = responder()
+    records.set_tenant_addresses("tenant1", [f"fd00::{i}" for i in range(1, 26)])
+    response = resp.answer(query("www.example.com", dns_responder.TYPE_AAAA))
+    assert header(response)["answers"] == 25
+    assert len(response) > dns_responder.UDP_MAX_SIZE
+    # the client retries over tcp
+    truncated = resp.answer(query("www.example.com", dns_responder.TYPE_AAAA), udp=True)
+    assert struct.unpack("!H", truncated[2:4])[0] & dns_responder.FLAG_TC
+    assert header(truncated) == {"id": 1234, "rcode": 0, "aa": True, "answers": 0, "authority": 0}
+    assert len(truncated) <= dns_responder.UDP_MAX_SIZE
+    # edns clients accept up to their advertised payload size
+    response = resp.answer(edns_query("www.example.com", dns_responder.TYPE_AAAA, 4096), udp=True)
+    assert not struct.unpack("!H", response[2:4])[0] & dns_responder.FLAG_TC
+    assert header(response)["answers"] == 25
+    assert response.endswith(dns_responder.OPT_RR)
+    truncated = resp.answer(edns_query("www.example.com", dns_responder.TYPE_AAAA, 600), udp=True)
+    assert struct.unpack("!H", truncated[2:4])[0] & dns_responder.FLAG_TC
+    assert header(truncated)["answers"] == 0
+    # small responses are not truncated
+    response = resp.answer(query("www.example.com", dns_responder.TYPE_A), udp=True)
+    assert not struct.unpack("!H", response[2:4])[0] & dns_responder.FLAG_TC
+    assert header(response)["answers"] == 0
+
+
+def test_mixed_case_tenant_domains():
+    records = zone_writer.ZoneRecords()
+    records.set_tenant("tenant1", ["WWW.Example.com"])
+    resp = dns_responder.DnsResponder(records, lambda apex: 1)
+    for name in ("www.example.com", "WWW.EXAMPLE.COM"):
+        response = resp.answer(query(name, dns_responder.TYPE_A))
+        assert header(response)["rcode"] == dns_responder.RCODE_NOERROR
+        assert response.endswith(dns_responder.encode_name("tenant.tenant1.svc.cluster.local"))
+    assert header(resp.answer(query("example.com", dns_responder.TYPE_SOA)))["answers"] == 1
+    records.remove_tenant("tenant1")
+    assert records.apex_records == {}
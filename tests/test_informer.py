@@ -0,0 +1,154 @@
+import time
+import asyncio
+
+import httpx
+
+from cwm_cdn_api import api, config, informer, kube
+from cwm_cdn_api.app import app
+
+
+async def wait_for(condition, timeout=5):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, "timed out waiting for condition"
+        await asyncio.sleep(0.01)
+
+
+async def start_tenants_informer(**kwargs):
+    tenants = informer.Informer(kube.TENANT_PLURAL, kube.tenants_path(), **kwargs)
+    informer._informers[tenants.name] = tenants
+    tenants.start()
+    await tenants.wait_synced(5)
+    return tenants
+
+
+async def test_informer_lists_and_follows_watch_events(fake_kube):
+    fake_kube.add_tenant("tenant1", {"domains": []})
+    tenants = await start_tenants_informer()
+    try:
+        assert set(tenants.items) == {"tenant1"}
+        fake_kube.add_tenant("tenant2", {"domains": []})
+        fake_kube.remove(f"apis/{kube.TENANT_API_VERSION}", kube.TENANT_PLURAL, "tenant1", "default")
+        await wait_for(lambda: set(tenants.items) == {"tenant2"})
+        assert tenants.resource_version == str(fake_kube.resource_version)
+        assert tenants.status()["synced"] is True
+    finally:
+        await informer.stop()
+
+
+async def test_informer_relists_when_resource_version_expired(fake_kube):
+    tenants = await start_tenants_informer()
+    try:
+        await wait_for(lambda: ("GET", kube.tenants_path()) in fake_kube.requests[1:])
+        await tenants.stop()
+        fake_kube.add_tenant("tenant1", {"domains": []})
+        fake_kube.compact()
+        tenants.start()
+        await wait_for(lambda: "tenant1" in tenants.items)
+        assert tenants.num_resyncs == 2
+    finally:
+        await informer.stop()
+
+
+async def test_reads_served_from_informer_unless_consistent(fake_kube):
+    fake_kube.add_tenant("tenant1", {"domains": [{"name": "tenant1.example.com"}], "origins": []})
+    await start_tenants_informer()
+    try:
+        num_requests = len(fake_kube.requests)
+        success, tenant = await api.get("tenant1")
+        assert success is True
+        assert tenant["domains"] == [{"name": "tenant1.example.com"}]
+        assert [name async for name in api.list_iterator()] == ["tenant1"]
+        success, message = await api.get("missing")
+        assert success is False
+        assert "not found" in message
+        assert len(fake_kube.requests) == num_requests
+        assert (await api.get("tenant1", consistent=True))[0] is True
+        assert fake_kube.requests[-1] == ("GET", kube.tenants_path("tenant1"))
+    finally:
+        await informer.stop()
+
+
+async def test_app_lifespan_starts_tenants_informer(fake_kube):
+    fake_kube.add_tenant("tenant1", {"domains": []})
+    app_ = app()
+    async with app_.router.lifespan_context(app_):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app_), base_url="http://test") as client:
+            assert (await client.get("/list")).json() == ["tenant1"]
+            assert (await client.get("/debug/informers")).json()[kube.TENANT_PLURAL]["objects"] == 1
+    assert informer.get_tenants() is None
+
+
+async def test_warm_start_snapshot_seeds_informers(fake_kube, monkeypatch):
+    monkeypatch.setattr(config, "LIST_PAGE_SIZE", 1)
+    fake_kube.add_tenant("tenant1", {"domains": []})
+    fake_kube.add_tenant("tenant0", {"domains": []})
+    fake_kube.add_namespace("kube-system")
+    monkeypatch.setattr(informer, "_snapshots", {})
+    await informer.load_snapshots()
+    assert set(informer._snapshots) == {kube.TENANT_PLURAL, "namespaces"}
+    # listed in pages, like the informers list
+    assert fake_kube.requests.count(("GET", kube.tenants_path())) == 2
+    fake_kube.add_tenant("tenant2", {"domains": []})
+    num_requests = len(fake_kube.requests)
+    await informer.start()
+    try:
+        # synced from the snapshot, the watch picks up the tenant added after it
+        assert informer.get_tenants().num_resyncs == 1
+        assert ("GET", kube.tenants_path()) not in fake_kube.requests[num_requests:]
+        await wait_for(lambda: set(informer.get_tenants().items) == {"tenant0", "tenant1", "tenant2"})
+        assert informer.get_namespaces().sorted_names() == ["kube-system"]
+    finally:
+        await informer.stop()
+
+
+async def test_start_waits_for_all_informers_within_one_deadline(monkeypatch):
+    monkeypatch.setattr(config, "INFORMER_START_TIMEOUT_SECONDS", 0.5)
+    monkeypatch.setattr(config, "NAMESPACE_INFORMER", True)
+    backend = kube.KubeHttpBackend("http://127.0.0.1:1")
+    kube.set_backend(backend)
+    try:
+        start_time = time.monotonic()
+        await informer.start()
+        assert 0.5 <= time.monotonic() - start_time < 1
+        assert informer.all_informers()[kube.TENANT_PLURAL].page_size == config.LIST_PAGE_SIZE
+        assert not informer.ready()
+    finally:
+        await informer.stop()
+        kube.set_backend(None)
+        await backend.aclose()
+
+
+async def test_ready_until_informers_synced(fake_kube):
+    app_ = app()
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app_), base_url="http://test") as client:
+        informer._informers["namespaces"] = informer.Informer("namespaces", "/api/v1/namespaces")
+        try:
+            response = await client.get("/ready")
+            assert response.status_code == 503
+            assert response.json() == {"ready": False, "informers": {"namespaces": False}}
+        finally:
+            informer._informers.clear()
+        async with app_.router.lifespan_context(app_):
+            response = await client.get("/ready")
+            assert response.status_code == 200
+            assert response.json()["ready"] is True
+
+
+async def test_informer_paged_list_and_transform(fake_kube):
+    for i in range(3):
+        fake_kube.add_tenant(f"tenant{i}", {"domains": [{"name": f"tenant{i}.example.com", "cert": "cert", "key": "key"}]})
+
+    def transform(o):
+        return {"metadata": o["metadata"], "domains": [domain["name"] for domain in o["spec"]["domains"]]}
+
+    tenants = await start_tenants_informer(page_size=2, transform=transform)
+    try:
+        assert fake_kube.requests.count(("GET", kube.tenants_path())) == 2
+        assert tenants.items["tenant0"]["domains"] == ["tenant0.example.com"]
+        assert len(tenants.items) == 3
+        fake_kube.add_tenant("tenant3", {"domains": [{"name": "tenant3.example.com", "key": "key"}]})
+        await wait_for(lambda: "tenant3" in tenants.items)
+        assert tenants.items["tenant3"]["domains"] == ["tenant3.example.com"]
+    finally:
+        await informer.stop()
@@ -0,0 +1,164 @@
+import pytest
+
+from cwm_cdn_api import api, kube, config
+
+
+def tenant_object(name, origin_url="http://origin.example.com"):
+    return {
+        "apiVersion": kube.TENANT_API_VERSION,
+        "kind": "CdnTenant",
+        "metadata": {"name": name, "namespace": "default"},
+        "spec": {
+            "domains": [{"name": f"{name}.example.com", "cert": "cert", "key": "key"}],
+            "origins": [{"url": origin_url}],
+        },
+    }
+
+
+async def test_http_backend_apply_creates_configures_and_detects_unchanged(fake_kube):
+    backend = kube.get_backend()
+    assert await backend.apply_tenant(tenant_object("tenant1")) == (True, "cdntenant.cdn.cloudwm-cdn.com/tenant1 created")
+    assert await backend.apply_tenant(tenant_object("tenant1")) == (True, "cdntenant.cdn.cloudwm-cdn.com/tenant1 unchanged")
+    assert await backend.apply_tenant(tenant_object("tenant1", "http://other.example.com")) == (True, "cdntenant.cdn.cloudwm-cdn.com/tenant1 configured")
+    success, tenant = await backend.get_tenant("tenant1")
+    assert success is True
+    assert tenant["spec"]["origins"] == [{"url": "http://other.example.com"}]
+    assert kube.LAST_APPLIED_ANNOTATION in tenant["metadata"]["annotations"]
+    assert tenant["metadata"]["generation"] == 2
+
+
+async def test_http_backend_apply_preserves_status(fake_kube):
+    fake_kube.add_tenant("tenant1", {"domains": []}, status={"conditions": [{"type": "Ready", "status": "True"}]})
+    assert (await kube.get_backend().apply_tenant(tenant_object("tenant1")))[0] is True
+    _, tenant = await kube.get_backend().get_tenant("tenant1")
+    assert tenant["status"] == {"conditions": [{"type": "Ready", "status": "True"}]}
+
+
+async def test_http_backend_get_and_delete_not_found_messages(fake_kube):
+    backend = kube.get_backend()
+    assert await backend.get_tenant("missing") == (
+        False, 'Error from server (NotFound): cdntenants.cdn.cloudwm-cdn.com "missing" not found'
+    )
+    fake_kube.add_tenant("tenant1", {"domains": []})
+    assert await backend.delete_tenant("tenant1") == (True, 'cdntenant.cdn.cloudwm-cdn.com "tenant1" deleted')
+    success, message = await backend.delete_tenant("tenant1")
+    assert success is False
+    assert "not found" in message
+
+
+async def test_http_backend_lists(fake_kube):
+    fake_kube.add_tenant("tenant2", {"domains": []})
+    fake_kube.add_tenant("tenant1", {"domains": []})
+    fake_kube.add_tenant("other", {"domains": []}, namespace="other-ns")
+    fake_kube.add_namespace("kube-system")
+    fake_kube.add_namespace("tenant1")
+    fake_kube.add_pod("cdn-cache", "cache1-abc", "cache:v1")
+    backend = kube.get_backend()
+    assert [name async for name in backend.iter_tenant_names()] == ["tenant1", "tenant2"]
+    assert await backend.list_namespace_names() == ["kube-system", "tenant1"]
+    assert [pod["metadata"]["name"] for pod in await backend.list_pods("cdn-cache")] == ["cache1-abc"]
+    assert [name async for name in api.reserved_names_iterator()] == ["kube-system"]
+
+
+async def test_http_backend_iter_tenant_domains_paged(fake_kube, monkeypatch):
+    monkeypatch.setattr(config, "LIST_PAGE_SIZE", 2)
+    for i in range(3):
+        fake_kube.add_tenant(f"tenant{i}", {"domains": [{"name": f"www.tenant{i}.com", "cert": "cert"}, {"name": f"tenant{i}.com"}]})
+    assert [item async for item in kube.get_backend().iter_tenant_domains()] == [
+        (f"tenant{i}", [f"www.tenant{i}.com", f"tenant{i}.com"]) for i in range(3)
+    ]
+    assert fake_kube.requests.count(("GET", kube.tenants_path())) == 2
+
+
+async def test_api_apply_and_get_with_http_backend(fake_kube, monkeypatch):
+    monkeypatch.setattr(api, "IS_PRIMARY", True)
+    spec = tenant_object("tenant1")["spec"]
+    assert await api.apply("tenant1", spec) == (True, "cdntenant.cdn.cloudwm-cdn.com/tenant1 created")
+    success, tenant = await api.get("tenant1")
+    assert success is True
+    assert tenant["domains"] == [{"name": "tenant1.example.com"}]
+    assert [name async for name in api.list_iterator()] == ["tenant1"]
+
+
+def test_load_kubeconfig(tmpdir):
+    kubeconfig_path = f"{tmpdir}/kubeconfig"
+    with open(kubeconfig_path, "w") as f:
+        f.write("""
+apiVersion: v1
+kind: Config
+current-context: ctx
+contexts:
+- name: ctx
+  context: {cluster: cluster1, user: user1}
+clusters:
+- name: cluster1
+  cluster: {server: "https://127.0.0.1:6443", insecure-skip-tls-verify: true}
+users:
+- name: user1
+  user: {token: secret-token}
+""")
+    loaded = kube.load_kubeconfig(kubeconfig_path)
+    assert loaded["server"] == "https://127.0.0.1:6443"
+    assert loaded["token"] == "secret-token"
+    assert loaded["verify"].check_hostname is False
+
+
+def test_load_kubeconfig_rejects_exec_credentials(tmpdir):
+    kubeconfig_path = f"{tmpdir}/kubeconfig"
+    with open(kubeconfig_path, "w") as f:
+        f.write("""
+current-context: ctx
+contexts: [{name: ctx, context: {cluster: c, user: u}}]
+clusters: [{name: c, cluster: {server: "https://127.0.0.1:6443"}}]
+users: [{name: u, user: {exec: {command: aws}}}]
+""")
+    with pytest.raises(kube.KubeConfigError, match="only supported by kubectl"):
+        kube.load_kubeconfig(kubeconfig_path)
+
+
+def test_auto_backend_falls_back_to_kubectl(tmpdir, monkeypatch):
+    monkeypatch.setattr(config, "KUBE_API_URL", "")
+    monkeypatch.setenv("KUBECONFIG", f"{tmpdir}/missing")
+    monkeypatch.delenv("KUBERNETES_SERVICE_HOST", raising=False)
+    assert kube.create_backend("auto").name == "kubectl"
+    monkeypatch.setattr(config, "KUBE_API_URL", "http://127.0.0.1:8001")
+    assert kube.create_backend("auto").name == "http"
+
+
+async def test_http_backend_unreachable_server_returns_failure(monkeypatch):
+    import httpx
+    from cwm_cdn_api.app import app
+
+    backend = kube.KubeHttpBackend("http://127.0.0.1:1")
+    monkeypatch.setattr(config, "TENANT_INFORMER", False)
+    kube.set_backend(backend)
+    try:
+        success, message = await backend.get_tenant("tenant1")
+        assert success is False
+        assert message.startswith("Error from server (ServiceUnavailable): Unable to connect to the server")
+        assert (await backend.apply_tenant(tenant_object("tenant1")))[0] is False
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app()), base_url="http://test") as client:
+            res = await client.get("/get", params={"cdn_tenant_name": "tenant1", "consistent": "true"})
+            assert res.status_code == 400
+            assert "Unable to connect to the server" in res.json()["msg"]
+    finally:
+        kube.set_backend(None)
+        await backend.aclose()
+
+
+def test_http_backend_closes_the_client_of_a_previous_event_loop():
+    import asyncio
+    import httpx
+
+    backend = kube.KubeHttpBackend("http://kube", transport=httpx.MockTransport(lambda request: httpx.Response(200, json={})))
+    first_loop = asyncio.new_event_loop()
+    try:
+        assert first_loop.run_until_complete(backend.request("GET", "/api/v1/namespaces")) == (200, {})
+        first_client = backend._client
+        assert asyncio.run(backend.request("GET", "/api/v1/namespaces")) == (200, {})
+        assert backend._client is not first_client
+        # the close is scheduled on the loop the client was opened on
+        first_loop.run_until_complete(asyncio.sleep(0.01))
+        assert first_client.is_closed
+    finally:
+        first_loop.close()
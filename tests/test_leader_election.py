@@ -0,0 +1,126 @@
+import os
+import time
+import signal
+import asyncio
+
+from cwm_cdn_api import config, kube, leader_election, zone_writer
+
+from test_informer import wait_for
+
+
+def elector(identity, lease_name="test-lease", **kwargs):
+    return leader_election.LeaderElector(
+        lease_name, identity, kube.get_backend(),
+        **{"lease_seconds": 1, "renew_deadline_seconds": 0.5, "retry_seconds": 0.05, **kwargs},
+    )
+
+
+async def stop_task(task):
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+
+
+async def test_single_leader_and_failover(fake_kube):
+    elector1, elector2 = elector("replica1"), elector("replica2")
+    task1 = asyncio.create_task(elector1.run())
+    await wait_for(lambda: elector1.is_leader)
+    task2 = asyncio.create_task(elector2.run())
+    try:
+        await asyncio.sleep(0.3)
+        assert elector1.is_leader and not elector2.is_leader
+        lease = fake_kube.get("apis/coordination.k8s.io/v1", "leases", "test-lease", config.NAMESPACE)
+        assert lease["spec"]["holderIdentity"] == "replica1"
+        # the leader stops renewing without releasing, the other replica takes over once the lease expires
+        await stop_task(task1)
+        start_time = time.monotonic()
+        await wait_for(lambda: elector2.is_leader, timeout=5)
+        assert 0.5 < time.monotonic() - start_time < 2
+        lease = fake_kube.get("apis/coordination.k8s.io/v1", "leases", "test-lease", config.NAMESPACE)
+        assert lease["spec"]["holderIdentity"] == "replica2"
+        assert lease["spec"]["leaseTransitions"] == 1
+    finally:
+        await stop_task(task2)
+
+
+async def test_release_allows_immediate_takeover(fake_kube):
+    elector1, elector2 = elector("replica1"), elector("replica2", lease_seconds=60)
+    task1 = asyncio.create_task(elector1.run())
+    await wait_for(lambda: elector1.is_leader)
+    task2 = asyncio.create_task(elector2.run())
+    try:
+        await asyncio.sleep(0.2)
+        await stop_task(task1)
+        await elector1.release()
+        assert elector1.not_leading.is_set()
+        start_time = time.monotonic()
+        await wait_for(lambda: elector2.is_leader)
+        assert time.monotonic() - start_time < 0.5
+    finally:
+        await stop_task(task2)
+
+
+async def test_elected_daemons_follow_the_leader(fake_kube, tmpdir, monkeypatch):
+    monkeypatch.setattr(config, "ZONE_WRITER_DEBOUNCE_SECONDS", 0.01)
+    monkeypatch.setattr(config, "ZONE_WRITER_FOLLOW_SECONDS", 0.05)
+    fake_kube.add_tenant("tenant1", {"domains": [{"name": "www.example.com"}]})
+    # replicas share the zones snapshot, e.g. on a shared volume
+    zones_dir = os.path.join(tmpdir, "zones")
+    os.makedirs(zones_dir)
+    stop1, stop2 = asyncio.Event(), asyncio.Event()
+    records1, records2 = zone_writer.ZoneRecords(), zone_writer.ZoneRecords()
+    elector1, elector2 = elector("replica1"), elector("replica2")
+    daemon1 = asyncio.create_task(zone_writer.elected_daemon(zones_dir, stop1, records1, elector1))
+    await wait_for(lambda: elector1.is_leader)
+    daemon2 = asyncio.create_task(zone_writer.elected_daemon(zones_dir, stop2, records2, elector2))
+    try:
+        await wait_for(lambda: records2.apex_records == {"example.com": {"www": "tenant1"}})
+        assert not elector2.is_leader
+        fake_kube.add_tenant("tenant2", {"domains": [{"name": "api.other.com"}]})
+        await wait_for(lambda: "other.com" in records2.apex_records)
+        # the leader stops and releases the lease, the follower takes over and keeps the zones updated
+        stop1.set()
+        await daemon1
+        await wait_for(lambda: elector2.is_leader)
+        fake_kube.add_tenant("tenant3", {"domains": [{"name": "cdn.third.com"}]})
+        await wait_for(lambda: os.path.exists(os.path.join(zones_dir, "third.com.db")))
+        assert "third.com" in records2.apex_records
+    finally:
+        stop1.set()
+        stop2.set()
+        await asyncio.gather(daemon1, daemon2)
+
+
+async def test_starting_replica_follows_the_leader_snapshot(fake_kube, tmpdir, monkeypatch):
+    monkeypatch.setattr(config, "ZONE_WRITER_DEBOUNCE_SECONDS", 0.01)
+    monkeypatch.setattr(config, "ZONE_WRITER_FOLLOW_SECONDS", 0.05)
+    monkeypatch.setattr(config, "ZONE_WRITER_LEADER_ELECTION", True)
+    created_records = []
+
+    class CreatedZoneRecords(zone_writer.ZoneRecords):
+        def __init__(self):
+            super().__init__()
+            created_records.append(self)
+
+    fake_kube.add_tenant("tenant1", {"domains": [{"name": "www.example.com"}]})
+    zones_dir = os.path.join(tmpdir, "zones")
+    os.makedirs(zones_dir)
+    leader_stop = asyncio.Event()
+    leader = asyncio.create_task(zone_writer.elected_daemon(zones_dir, leader_stop, elector=elector("replica1", config.ZONE_WRITER_LEASE_NAME)))
+    await wait_for(lambda: os.path.exists(f"{zones_dir}.json"))
+    monkeypatch.setattr(zone_writer, "ZoneRecords", CreatedZoneRecords)
+    # a replica (re)starting through the cli entrypoint keeps the leader's snapshot and serves its records
+    replica = asyncio.create_task(zone_writer.main(zones_dir, daemon=True))
+    try:
+        await wait_for(lambda: created_records and created_records[0].apex_records == {"example.com": {"www": "tenant1"}})
+        assert os.path.exists(f"{zones_dir}.json")
+        lease = fake_kube.get("apis/coordination.k8s.io/v1", "leases", config.ZONE_WRITER_LEASE_NAME, config.NAMESPACE)
+        assert lease["spec"]["holderIdentity"] == "replica1"
+    finally:
+        os.kill(os.getpid(), signal.SIGTERM)
+        await asyncio.wait_for(replica, 5)
+        asyncio.get_running_loop().remove_signal_handler(signal.SIGTERM)
+        leader_stop.set()
+        await leader
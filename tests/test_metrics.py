@@ -0,0 +1,66 @@
+import os
+import sys
+import subprocess
+
+import httpx
+import prometheus_client
+from prometheus_client import multiprocess
+
+from cwm_cdn_api import api, kube
+from cwm_cdn_api.app import app
+
+
+def sample(name, labels):
+    return prometheus_client.REGISTRY.get_sample_value(name, labels) or 0
+
+
+async def test_metrics_endpoint_records_route_latency_and_kube_calls(fake_kube):
+    fake_kube.add_tenant("tenant1", {"domains": []})
+    labels = {"method": "GET", "route": "/get", "status": "200"}
+    requests_before = sample("cwm_cdn_api_http_request_duration_seconds_count", labels)
+    kube_calls_before = sample("cwm_cdn_api_kube_calls_total", {"backend": "http", "verb": "get", "status": "200"})
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app()), base_url="http://test") as client:
+        assert (await client.get("/get", params={"cdn_tenant_name": "tenant1", "consistent": "true"})).status_code == 200
+        response = await client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "cwm_cdn_api_http_requests_in_flight" in response.text
+    assert sample("cwm_cdn_api_http_request_duration_seconds_count", labels) == requests_before + 1
+    assert sample("cwm_cdn_api_kube_calls_total", {"backend": "http", "verb": "get", "status": "200"}) == kube_calls_before + 1
+
+
+async def test_validation_duration_per_step(fake_kube, monkeypatch):
+    monkeypatch.setattr(api, "IS_PRIMARY", True)
+    before = {step: sample("cwm_cdn_api_validation_duration_seconds_count", {"step": step}) for step in ("name", "spec")}
+    success, msg = await api.apply("tenant1", {
+        "domains": [{"name": "tenant1.example.com", "cert": "cert", "key": "key"}],
+        "origins": [{"url": "http://origin.example.com"}],
+    })
+    assert success, msg
+    for step in ("name", "spec"):
+        assert sample("cwm_cdn_api_validation_duration_seconds_count", {"step": step}) == before[step] + 1
+
+
+async def test_kubectl_calls_are_counted_per_verb_and_exit_status(monkeypatch):
+    async def fake_status_output(*args, **kwargs):
+        return 1, 'Error from server (NotFound): cdntenants.cdn.cloudwm-cdn.com "missing" not found'
+
+    monkeypatch.setattr(kube, "async_subprocess_status_output", fake_status_output)
+    labels = {"backend": "kubectl", "verb": "get", "status": "1"}
+    before = sample("cwm_cdn_api_kube_calls_total", labels)
+    success, _ = await kube.KubectlBackend().get_tenant("missing")
+    assert success is False
+    assert sample("cwm_cdn_api_kube_calls_total", labels) == before + 1
+
+
+def test_multiprocess_metrics_are_aggregated(tmpdir):
+    env = {**os.environ, "PROMETHEUS_MULTIPROC_DIR": tmpdir}
+    for _ in range(2):
+        subprocess.check_call([
+            sys.executable, "-c",
+            "from cwm_cdn_api import metrics; "
+            "metrics.KUBE_CALLS.labels('kubectl', 'get', '0').inc()",
+        ], env=env)
+    registry = prometheus_client.CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry, path=tmpdir)
+    assert registry.get_sample_value("cwm_cdn_api_kube_calls_total", {"backend": "kubectl", "verb": "get", "status": "0"}) == 2
@@ -0,0 +1,272 @@
+import os
+import time
+import asyncio
+
+import orjson
+
+from cwm_cdn_api import config, kube, zone_writer
+
+from test_informer import wait_for
+
+
+TENANTS_API = f"apis/{kube.TENANT_API_VERSION}"
+
+
+def read_zone(zones_dir, apex):
+    with open(os.path.join(zones_dir, f"{apex}.db")) as f:
+        return [line for line in f.read().splitlines() if "CNAME" in line]
+
+
+def test_zone_records_incremental_updates():
+    records = zone_writer.ZoneRecords()
+    assert records.set_tenant("tenant1", ["www.example.com", "example.com"]) is True
+    assert records.set_tenant("tenant1", ["www.example.com", "example.com"]) is False
+    assert records.set_tenant("tenant2", ["api.other.com"]) is True
+    assert records.apex_records == {"example.com": {"www": "tenant1", "": "tenant1"}, "other.com": {"api": "tenant2"}}
+    assert records.pop_changed_apexes() == {"example.com", "other.com"}
+    assert records.set_tenant("tenant1", ["www.example.com"]) is True
+    assert records.pop_changed_apexes() == {"example.com"}
+    assert records.remove_tenant("tenant2") is True
+    assert records.remove_tenant("tenant2") is False
+    assert records.apex_records == {"example.com": {"www": "tenant1"}}
+    assert records.digest == zone_writer.records_digest(records.apex_records)
+    assert records.set_tenant("tenant2", ["www.example.com"]) is True
+    assert records.digest == zone_writer.records_digest({"example.com": {"www": "tenant2"}})
+    rebuilt = zone_writer.ZoneRecords()
+    rebuilt.rebuild(records.tenant_domains.items())
+    assert rebuilt.apex_records == records.apex_records
+    assert rebuilt.digest == records.digest
+
+
+def test_zone_records_domain_of_more_than_one_tenant():
+    records = zone_writer.ZoneRecords()
+    records.set_tenant("tenant1", ["www.example.com", "api.example.com"])
+    records.set_tenant("tenant2", ["WWW.example.com"])
+    assert records.apex_records == {"example.com": {"www": "tenant2", "api": "tenant1"}}
+    records.pop_changed_apexes()
+    # the remaining tenant with the domain gets the record without waiting for a rebuild
+    assert records.remove_tenant("tenant2") is True
+    assert records.apex_records == {"example.com": {"www": "tenant1", "api": "tenant1"}}
+    assert records.pop_changed_apexes() == {"example.com"}
+    assert records.digest == zone_writer.records_digest(records.apex_records)
+    records.set_tenant("tenant2", ["www.example.com"])
+    # removing a tenant which doesn't have the record keeps it
+    assert records.set_tenant("tenant1", ["api.example.com"]) is True
+    assert records.apex_records == {"example.com": {"www": "tenant2", "api": "tenant1"}}
+    assert records.remove_tenant("tenant2") is True
+    assert records.apex_records == {"example.com": {"api": "tenant1"}}
+    assert records.digest == zone_writer.records_digest(records.apex_records)
+
+
+def zone_serial(zones_dir, apex):
+    with open(os.path.join(zones_dir, f"{apex}.db")) as f:
+        return int(zone_writer.SOA_SERIAL_RE.search(f.read()).group(1))
+
+
+def test_write_zones_only_rewrites_changed_zones_with_increasing_serials(tmpdir):
+    zones_dir = os.path.join(tmpdir, "zones")
+    os.makedirs(zones_dir)
+    apex_records = {"example.com": {"www": "tenant1"}, "other.com": {"api": "tenant2"}}
+    assert zone_writer.write_zones(zones_dir, apex_records) is True
+    serial = zone_serial(zones_dir, "example.com")
+    # unchanged records are detected from the in-memory digest, without reading or writing any file
+    os.remove(f"{zones_dir}.json")
+    assert zone_writer.write_zones(zones_dir, apex_records) is False
+    assert not os.path.exists(f"{zones_dir}.json")
+    apex_records["other.com"]["cdn"] = "tenant2"
+    assert zone_writer.write_zones(zones_dir, apex_records, {"other.com"}) is True
+    assert zone_serial(zones_dir, "example.com") == serial
+    assert zone_serial(zones_dir, "other.com") == serial + 1
+    apex_records["other.com"]["cdn"] = "tenant3"
+    assert zone_writer.write_zones(zones_dir, apex_records, {"other.com"}) is True
+    assert zone_serial(zones_dir, "other.com") == serial + 2
+    del apex_records["other.com"]
+    assert zone_writer.write_zones(zones_dir, apex_records) is True
+    assert sorted(os.listdir(zones_dir)) == ["example.com.db"]
+    # a new process continues from the serials and fingerprints of the zone files
+    del zone_writer._zone_files[zones_dir]
+    apex_records["example.com"]["api"] = "tenant1"
+    apex_records["new.com"] = {"": "tenant4"}
+    assert zone_writer.write_zones(zones_dir, apex_records) is True
+    assert zone_serial(zones_dir, "example.com") == serial + 1
+    assert read_zone(zones_dir, "new.com") == ["@ IN CNAME tenant.tenant4.svc.cluster.local."]
+
+
+async def test_watch_daemon_writes_only_on_domain_changes(fake_kube, tmpdir, monkeypatch):
+    monkeypatch.setattr(config, "ZONE_WRITER_DEBOUNCE_SECONDS", 0.01)
+    writes = []
+    write_zones = zone_writer.write_zones
+
+    def counting_write_zones(zones_dir, apex_records, *args, **kwargs):
+        written = write_zones(zones_dir, apex_records, *args, **kwargs)
+        if written:
+            writes.append(apex_records)
+        return written
+
+    monkeypatch.setattr(zone_writer, "write_zones", counting_write_zones)
+    fake_kube.add_tenant("tenant1", {"domains": [{"name": "www.example.com"}]})
+    zones_dir = os.path.join(tmpdir, "zones")
+    os.makedirs(zones_dir)
+    stop = asyncio.Event()
+    daemon = asyncio.create_task(zone_writer.watch_daemon(zones_dir, stop))
+    try:
+        await wait_for(lambda: len(writes) == 1)
+        assert read_zone(zones_dir, "example.com") == ["www IN CNAME tenant.tenant1.svc.cluster.local."]
+        fake_kube.set_tenant_status("tenant1", {"conditions": [{"type": "Ready", "status": "True"}]})
+        fake_kube.add_tenant("tenant2", {"domains": [{"name": "cdn.other.com"}]})
+        await wait_for(lambda: len(writes) == 2)
+        assert read_zone(zones_dir, "other.com") == ["cdn IN CNAME tenant.tenant2.svc.cluster.local."]
+        fake_kube.remove(TENANTS_API, kube.TENANT_PLURAL, "tenant2", "default")
+        await wait_for(lambda: len(writes) == 3)
+        assert not os.path.exists(os.path.join(zones_dir, "other.com.db"))
+        # status only changes don't write
+        fake_kube.set_tenant_status("tenant1", {"conditions": []})
+        await asyncio.sleep(0.1)
+        assert len(writes) == 3
+    finally:
+        stop.set()
+        await asyncio.wait_for(daemon, 5)
+
+
+async def test_watch_daemon_periodic_resync(fake_kube, tmpdir, monkeypatch):
+    monkeypatch.setattr(config, "ZONE_WRITER_RESYNC_SECONDS", 0.2)
+    fake_kube.add_tenant("tenant1", {"domains": [{"name": "www.example.com"}]})
+    zones_dir = os.path.join(tmpdir, "zones")
+    os.makedirs(zones_dir)
+    stop = asyncio.Event()
+    daemon = asyncio.create_task(zone_writer.watch_daemon(zones_dir, stop))
+    try:
+        await wait_for(lambda: os.path.exists(os.path.join(zones_dir, "example.com.db")))
+        os.remove(os.path.join(zones_dir, "example.com.db"))
+        await wait_for(lambda: os.path.exists(os.path.join(zones_dir, "example.com.db")))
+    finally:
+        stop.set()
+        await asyncio.wait_for(daemon, 5)
+
+
+async def test_main_writes_zones_from_paged_list(fake_kube, tmpdir, monkeypatch):
+    monkeypatch.setattr(config, "LIST_PAGE_SIZE", 1)
+    fake_kube.add_tenant("tenant1", {"domains": [{"name": "www.example.com", "cert": "cert", "key": "key"}]})
+    fake_kube.add_tenant("tenant2", {"domains": [{"name": "example.com"}]})
+    zones_dir = os.path.join(tmpdir, "zones")
+    os.makedirs(zones_dir)
+    await zone_writer.main(zones_dir)
+    assert read_zone(zones_dir, "example.com") == [
+        "www IN CNAME tenant.tenant1.svc.cluster.local.",
+        "@ IN CNAME tenant.tenant2.svc.cluster.local.",
+    ]
+    # the same tenant domains as the last poll are skipped before building the records
+    num_requests = len(fake_kube.requests)
+    os.remove(f"{zones_dir}.json")
+    await zone_writer.main(zones_dir)
+    assert len(fake_kube.requests) > num_requests
+    assert not os.path.exists(f"{zones_dir}.json")
+
+
+def read_address_records(zones_dir, apex):
+    with open(os.path.join(zones_dir, f"{apex}.db")) as f:
+        return [
+            line for line in f.read().splitlines()
+            if not line.startswith("ns1 ") and (" IN A " in line or " IN AAAA " in line or " IN CNAME " in line)
+        ]
+
+
+def test_write_zones_flattened_records(tmpdir):
+    zones_dir = os.path.join(tmpdir, "zones")
+    os.makedirs(zones_dir)
+    records = zone_writer.ZoneRecords()
+    records.set_tenant("tenant1", ["example.com", "www.example.com"])
+    records.set_tenant("tenant2", ["api.other.com"])
+    records.pop_changed_apexes()
+    assert records.set_tenant_addresses("tenant1", ["10.0.0.1", "fd00::1"]) is True
+    assert records.set_tenant_addresses("tenant1", ["10.0.0.1", "fd00::1"]) is False
+    assert records.pop_changed_apexes() == {"example.com"}
+    write = lambda: zone_writer.write_zones(zones_dir, records.apex_records, digest=records.digest, tenant_addresses=records.tenant_addresses)
+    assert write() is True
+    # tenants without known addresses keep the CNAME
+    assert read_address_records(zones_dir, "example.com") == ["@ IN A 10.0.0.1", "@ IN AAAA fd00::1", "www IN A 10.0.0.1", "www IN AAAA fd00::1"]
+    assert read_address_records(zones_dir, "other.com") == ["api IN CNAME tenant.tenant2.svc.cluster.local."]
+    serial = zone_serial(zones_dir, "example.com")
+    assert write() is False
+    records.set_tenant_addresses("tenant1", ["10.0.0.2"])
+    assert write() is True
+    assert read_address_records(zones_dir, "example.com") == ["@ IN A 10.0.0.2", "www IN A 10.0.0.2"]
+    assert zone_serial(zones_dir, "example.com") == serial + 1
+    records.set_tenant_addresses("tenant1", [])
+    assert records.digest == zone_writer.records_digest(records.apex_records)
+    assert write() is True
+    assert read_address_records(zones_dir, "example.com") == ["@ IN CNAME tenant.tenant1.svc.cluster.local.", "www IN CNAME tenant.tenant1.svc.cluster.local."]
+    # standby replicas load the flattened records from the snapshots
+    followed = zone_writer.ZoneRecords()
+    followed.load(records.apex_records, {"tenant2": ["10.0.0.5"]})
+    assert followed.tenant_addresses == {"tenant2": ["10.0.0.5"]}
+    records.set_tenant_addresses("tenant2", ["10.0.0.5"])
+    assert followed.digest == records.digest
+
+
+async def test_watch_daemon_flattened_records_follow_service_ips(fake_kube, tmpdir, monkeypatch):
+    monkeypatch.setattr(config, "ZONE_WRITER_DEBOUNCE_SECONDS", 0.01)
+    monkeypatch.setattr(config, "ZONE_WRITER_FLATTEN", True)
+    fake_kube.add_tenant("tenant1", {"domains": [{"name": "www.example.com"}]})
+    fake_kube.add_tenant("tenant2", {"domains": [{"name": "api.other.com"}]})
+    service = {"metadata": {"name": "tenant"}, "spec": {"clusterIP": "10.0.0.1", "clusterIPs": ["10.0.0.1"]}}
+    fake_kube.create("api/v1", "services", service, namespace="tenant1")
+    fake_kube.create("api/v1", "services", {"metadata": {"name": "other"}, "spec": {"clusterIP": "10.0.0.9"}}, namespace="tenant2")
+    fake_kube.create("api/v1", "services", {"metadata": {"name": "tenant"}, "spec": {"clusterIP": "None"}}, namespace="tenant2")
+    endpoint_slice = {
+        "metadata": {"name": "tenant-abc", "labels": {"kubernetes.io/service-name": "tenant"}},
+        "addressType": "IPv4",
+        "endpoints": [{"addresses": ["10.1.0.2"], "conditions": {"ready": True}}, {"addresses": ["10.1.0.1"]}],
+    }
+    fake_kube.create("apis/discovery.k8s.io/v1", "endpointslices", endpoint_slice, namespace="tenant2")
+    zones_dir = os.path.join(tmpdir, "zones")
+    os.makedirs(zones_dir)
+    records = zone_writer.ZoneRecords()
+    stop = asyncio.Event()
+    daemon = asyncio.create_task(zone_writer.watch_daemon(zones_dir, stop, records))
+    try:
+        await wait_for(lambda: os.path.exists(os.path.join(zones_dir, "other.com.db")))
+        # the first write is after the services are synced, with the flattened records
+        assert read_address_records(zones_dir, "example.com") == ["www IN A 10.0.0.1"]
+        assert read_address_records(zones_dir, "other.com") == ["api IN A 10.1.0.1", "api IN A 10.1.0.2"]
+        fake_kube.replace("api/v1", "services", {**service, "spec": {"clusterIPs": ["10.0.0.3", "fd00::3"]}}, namespace="tenant1")
+        await wait_for(lambda: "www IN AAAA fd00::3" in read_address_records(zones_dir, "example.com"))
+        assert read_address_records(zones_dir, "example.com") == ["www IN A 10.0.0.3", "www IN AAAA fd00::3"]
+        endpoint_slice["endpoints"][0]["conditions"]["ready"] = False
+        fake_kube.replace("apis/discovery.k8s.io/v1", "endpointslices", endpoint_slice, namespace="tenant2")
+        await wait_for(lambda: read_address_records(zones_dir, "other.com") == ["api IN A 10.1.0.1"])
+        fake_kube.remove("api/v1", "services", "tenant", "tenant1")
+        await wait_for(lambda: read_address_records(zones_dir, "example.com") == ["www IN CNAME tenant.tenant1.svc.cluster.local."])
+    finally:
+        stop.set()
+        await asyncio.wait_for(daemon, 5)
+
+
+async def test_serials_of_followed_zones_are_stable(tmpdir, monkeypatch):
+    monkeypatch.setattr(config, "ZONE_WRITER_FOLLOW_SECONDS", 0.01)
+    zones_dir = os.path.join(tmpdir, "zones")
+
+    def write_snapshot(apex_records, mtime_ns):
+        with open(f"{zones_dir}.json", "wb") as f:
+            f.write(orjson.dumps(apex_records))
+        os.utime(f"{zones_dir}.json", ns=(mtime_ns, mtime_ns))
+
+    write_snapshot({"example.com": {"www": "tenant1"}, "other.com": {"api": "tenant2"}}, 1)
+    records = zone_writer.ZoneRecords()
+    until = asyncio.Event()
+    follower = asyncio.create_task(zone_writer.follow_snapshot(zones_dir, records, until))
+    try:
+        await wait_for(lambda: "other.com" in records.apex_records)
+        serial = zone_writer.zone_serial(zones_dir, "example.com")
+        other_serial = zone_writer.zone_serial(zones_dir, "other.com")
+        # not the current time on each query, which secondaries would see as a zone that keeps changing
+        now = time.time()
+        monkeypatch.setattr(zone_writer.time, "time", lambda: now + 10)
+        assert zone_writer.zone_serial(zones_dir, "example.com") == serial
+        write_snapshot({"example.com": {"www": "tenant3"}, "other.com": {"api": "tenant2"}}, 2)
+        await wait_for(lambda: records.apex_records["example.com"] == {"www": "tenant3"})
+        assert zone_writer.zone_serial(zones_dir, "example.com") == int(now + 10)
+        assert zone_writer.zone_serial(zones_dir, "other.com") == other_serial
+    finally:
+        until.set()
+        await follower